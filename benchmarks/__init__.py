@@ -0,0 +1 @@
+"""Benchmarks for the bot's hot paths. Run them from the repository root, e.g. python3 -m benchmarks.logtail. They need the same dependencies as the bot, but no server, IRC network, or Twitter account."""
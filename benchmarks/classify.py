@@ -0,0 +1,67 @@
+"""Measures how fast server log lines are classified into achievements, actions, chat messages, and joins/leaves.
+
+A mix of typical log lines is classified by loop.classify_log_line and by the previous approach, which built the pattern strings for every line and tried them one after another. Both must agree on every line before their speeds are compared.
+"""
+
+from wurstminebot import loop
+import minecraft
+import random
+import re
+import timeit
+
+LINES = 20000
+REPEAT = 5
+
+def old_classify(log_line):
+    """The InputLoop's classification before classify_log_line. Returns (match_type, player, text)."""
+    match_prefix = '(' + minecraft.regexes.timestamp + '|' + minecraft.regexes.full_timestamp + ') \\[Server thread/INFO\\]: '
+    matches = {
+        'achievement': '(' + minecraft.regexes.player + ') has just earned the achievement \\[(.+)\\]$',
+        'action': '\\* (' + minecraft.regexes.player + ') (.*)',
+        'chat_message': '<(' + minecraft.regexes.player + ')> (.*)',
+        'join_leave': '(' + minecraft.regexes.player + ') (left|joined) the game'
+    }
+    for match_type, match_string in matches.items():
+        match = re.match(match_prefix + match_string, log_line)
+        if match:
+            return (match_type,) + match.group(2, 3)
+    return None, None, None
+
+def new_classify(log_line):
+    match_type, match = loop.classify_log_line(log_line)
+    if match_type is None:
+        return None, None, None
+    return match_type, match.group(match_type + '_player'), match.group(match_type)
+
+def sample_lines(count, seed=0):
+    rng = random.Random(seed)
+    players = ['alice', 'bob_42', 'Carol', 'dave', 'xX_Eve_Xx']
+    templates = [
+        (40, '<{player}> {text}'),
+        (5, '* {player} {text}'),
+        (10, '{player} joined the game'),
+        (10, '{player} left the game'),
+        (2, '{player} has just earned the achievement [Getting Wood]'),
+        (20, '{player} lost connection: Disconnected'),
+        (8, 'Saving chunks for level \'world\'/Overworld'),
+        (5, '{player} was slain by Zombie')
+    ]
+    words = 'the a creeper blew up my house again can someone help me rebuild it tomorrow https://bugs.mojang.com/browse/MC-4 !time lol'.split()
+    population = [template for weight, template in templates for i in range(weight)]
+    lines = []
+    for i in range(count):
+        timestamp = '[{:02}:{:02}:{:02}]'.format(i // 3600 % 24, i // 60 % 60, i % 60) if i % 2 else '2015-06-01 12:{:02}:{:02}'.format(i // 60 % 60, i % 60)
+        text = ' '.join(rng.choice(words) for j in range(rng.randrange(1, 15)))
+        lines.append(timestamp + ' [Server thread/INFO]: ' + rng.choice(population).format(player=rng.choice(players), text=text))
+    return lines
+
+def main():
+    lines = sample_lines(LINES)
+    for line in lines:
+        assert old_classify(line) == new_classify(line), line
+    for name, classify in [('before', old_classify), ('after', new_classify)]:
+        best = min(timeit.repeat(lambda: [classify(line) for line in lines], number=1, repeat=REPEAT))
+        print('{:>6}: {:>9,.0f} lines/s'.format(name, LINES / best))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Replays a large server log and measures the cost of a poll after one line has been appended.
+
+The cost of LogTail.read_lines should stay the same no matter how long the log already is. For comparison, the previous approach of reading and splitting the whole file on each poll is measured as well; its cost grows with the log.
+"""
+
+from wurstminebot import logtail
+import os
+import os.path
+import tempfile
+import timeit
+
+CHECKPOINTS = [1000, 100000, 250000, 500000] # log sizes at which polls are measured
+POLLS = 200 # polls measured at each checkpoint, each after appending one line
+LINE = '[12:34:56] [Server thread/INFO]: <someone> a chat message of a fairly typical length, number {}\n'
+
+def full_read_poll(path, lines_read):
+    """The InputLoop's poll before LogTail: re-read and re-split the whole log, skipping the lines already seen."""
+    with open(path) as log:
+        lines = log.read().split('\n')
+    return lines[lines_read:-1]
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'latest.log')
+        open(path, 'w').close()
+        tail = logtail.LogTail(path)
+        written = 0
+        print('{:>10}  {:>18}  {:>18}'.format('log lines', 'LogTail per poll', 'full read per poll'))
+        with open(path, 'a') as log:
+            for checkpoint in CHECKPOINTS:
+                log.writelines(LINE.format(i) for i in range(written, checkpoint))
+                log.flush()
+                written = checkpoint
+                assert len(tail.read_lines()) > 0
+                tail_time = 0
+                for i in range(POLLS):
+                    log.write(LINE.format(written))
+                    log.flush()
+                    written += 1
+                    start = timeit.default_timer()
+                    lines = tail.read_lines()
+                    tail_time += timeit.default_timer() - start
+                    assert len(lines) == 1
+                full_read_polls = max(1, POLLS // 20) # much slower, and only needed to show the trend
+                full_read_time = timeit.timeit(lambda: full_read_poll(path, written - 1), number=full_read_polls)
+                print('{:>10}  {:>15.1f} µs  {:>15.1f} µs'.format(written, tail_time / POLLS * 1e6, full_read_time / full_read_polls * 1e6))
+        tail.close()
+
+if __name__ == '__main__':
+    main()
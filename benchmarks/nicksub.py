@@ -0,0 +1,97 @@
+"""Measures nicksub.textsub with a people file of 200 people and 1000 chat messages.
+
+Every message is substituted in each direction the bot uses, by textsub and by the previous implementation, which ran one regex per nick and created Person objects on every call. Both must give the same output. The previous implementation is only run on the first OLD_MESSAGES messages, since it takes up to half a second per message.
+"""
+
+import json
+from wurstminebot import nicksub
+import os.path
+import random
+import re
+import tempfile
+import timeit
+
+PEOPLE = 200
+MESSAGES = 1000
+OLD_MESSAGES = 50
+DIRECTIONS = [ # (source, target, strict)
+    ('irc', 'minecraft', False),
+    ('irc', 'twitter', False),
+    ('minecraft', 'irc', False),
+    ('minecraft', 'irc', True),
+    ('twitter', 'irc', False)
+]
+
+def old_textsub(text, source, target, strict=False):
+    """nicksub.textsub before it was compiled into a single regex."""
+    def _nicks_for_context(context):
+        if context == 'irc':
+            mode = 'main' if strict else 'all'
+            return reversed(list(nicksub.irc_nicks(include_ids=True, mode=mode)))
+        elif context == 'minecraft':
+            return nicksub.minecraft_nicks(include_ids=True)
+        elif context == 'reddit':
+            return nicksub.reddit_nicks(include_ids=True)
+        elif context == 'twitter':
+            return nicksub.twitter_nicks(include_ids=True, twitter_at_prefix=True)
+        else:
+            return []
+    
+    url_characters = "[0-9A-Za-z-._~:/?#\\[\\]@!$&'()*+\\,;=%]"
+    for person_id, nick in _nicks_for_context(source):
+        if nicksub.Person(person_id).nick(target):
+            text = re.sub('(?<!' + url_characters + ')(' + re.sub('\\|', '\\|', nick) + ')(?!' + url_characters + ')', nicksub.Person(person_id).nick(target, twitter_at_prefix=True), text, flags=re.IGNORECASE)
+    if not strict:
+        for person_id, nick in nicksub.other_nicks(include_ids=True, mode='all'):
+            if nicksub.Person(person_id).nick(target):
+                text = re.sub('(?<!' + url_characters + ')(' + re.sub('\\|', '\\|', nick) + ')(?!' + url_characters + ')', nicksub.Person(person_id).nick(target, twitter_at_prefix=True), text, flags=re.IGNORECASE)
+    return text
+
+def sample_people(count, rng):
+    people = []
+    for i in range(count):
+        person_id = 'person{}'.format(i)
+        person = {
+            'id': person_id,
+            'irc': {'nicks': [person_id, person_id + '_away', 'p{}irc'.format(i)]},
+            'minecraft': 'Player{}'.format(i),
+            'nicks': ['nick{}'.format(i)]
+        }
+        if rng.random() < 0.5:
+            person['twitter'] = 'tw_person{}'.format(i)
+        people.append(person)
+    return people
+
+def sample_messages(count, people, rng):
+    words = 'hey did you see what happened at spawn yesterday the creeper farm is broken again https://wurstmineberg.de/ lol'.split()
+    nicks = [nick for person in people for nick in person['irc']['nicks'] + [person['minecraft'], '@' + person.get('twitter', person['id'])] + person['nicks']]
+    messages = []
+    for i in range(count):
+        message = [rng.choice(words) for j in range(rng.randrange(3, 20))]
+        for j in range(rng.randrange(0, 4)):
+            message.insert(rng.randrange(len(message) + 1), rng.choice(nicks))
+        messages.append(' '.join(message))
+    return messages
+
+def main():
+    rng = random.Random(0)
+    people = sample_people(PEOPLE, rng)
+    messages = sample_messages(MESSAGES, people, rng)
+    with tempfile.TemporaryDirectory() as directory:
+        nicksub.CONFIG_FILE = os.path.join(directory, 'people.json')
+        with open(nicksub.CONFIG_FILE, 'w') as people_file:
+            json.dump({'people': people}, people_file)
+        compile_time = timeit.timeit(lambda: nicksub.TextSub(nicksub.people_index(), 'minecraft', 'irc'), number=1)
+        print('compiling one direction: {:.1f} ms'.format(compile_time * 1e3))
+        print('{:>20}  {:>16}  {:>16}'.format('direction', 'before', 'after'))
+        for source, target, strict in DIRECTIONS:
+            start = timeit.default_timer()
+            old_results = [old_textsub(message, source, target, strict=strict) for message in messages[:OLD_MESSAGES]]
+            old_time = (timeit.default_timer() - start) / OLD_MESSAGES
+            new_results = [nicksub.textsub(message, source, target, strict=strict) for message in messages] # also compiles and caches the TextSub
+            assert new_results[:OLD_MESSAGES] == old_results, (source, target, strict)
+            new_time = min(timeit.repeat(lambda: [nicksub.textsub(message, source, target, strict=strict) for message in messages], number=1, repeat=5)) / MESSAGES
+            print('{:>20}  {:>11.1f} µs  {:>11.1f} µs'.format(source + '→' + target + (' strict' if strict else ''), old_time * 1e6, new_time * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+import json
+import pytest
+from wurstminebot import core
+
+@pytest.fixture
+def config(tmp_path):
+    """Points the bot at a temporary config file and returns a function that replaces its contents."""
+    path = tmp_path / 'wurstminebot.json'
+    old_path = core.state['config_path']
+    
+    def set_config(config_dict):
+        with path.open('w') as config_file:
+            json.dump(config_dict, config_file)
+    
+    set_config({'paths': {'cache': str(tmp_path / 'cache'), 'logs': str(tmp_path / 'log')}})
+    core.state['config_path'] = str(path)
+    yield set_config
+    core.state['config_path'] = old_path
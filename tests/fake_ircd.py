@@ -0,0 +1,92 @@
+"""A local fake IRC server, so the IRC client can be tested offline.
+
+Start a FakeIrcd and point an ircclient.Client at 127.0.0.1 and its port. The server registers clients with a 001 welcome, echoes JOINs back, and records every line it receives. Tests send it raw data to pass on to the connected client, which may end in the middle of a line to check how reads are split.
+"""
+
+import queue
+import socketserver
+import threading
+
+class FakeIrcd(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """The fake IRC server. Listens on a free port on localhost, in a background thread. Only one client is expected at a time."""
+    
+    daemon_threads = True
+    
+    def __init__(self, name='irc.example.com'):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.name = name
+        self.lock = threading.Lock()
+        self.received = queue.Queue() # every line received, without the line break
+        self.connection = None
+        self.connected = threading.Event()
+        self.thread = threading.Thread(target=self.serve_forever, name='fake ircd', daemon=True)
+        self.thread.start()
+    
+    @property
+    def port(self):
+        return self.server_address[1]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+    
+    def expect(self, predicate, timeout=5):
+        """Returns the lines received until one for which predicate returns true, including that one. Raises AssertionError if none arrives in time."""
+        lines = []
+        while True:
+            try:
+                line = self.received.get(timeout=timeout)
+            except queue.Empty:
+                raise AssertionError('no matching line received, got {!r}'.format(lines))
+            lines.append(line)
+            if predicate(line):
+                return lines
+    
+    def send(self, data):
+        """Sends a line, or raw bytes, to the connected client."""
+        if not self.connected.wait(5):
+            raise AssertionError('no client connected')
+        if isinstance(data, str):
+            data = data.encode('utf-8') + b'\r\n'
+        with self.lock:
+            self.connection.sendall(data)
+    
+    def stop(self):
+        self.shutdown()
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+        self.server_close()
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connection = self.request
+        nick = None
+        try:
+            for raw_line in self.rfile:
+                line = raw_line.decode('utf-8').rstrip('\r\n')
+                server.received.put(line)
+                command, _, rest = line.partition(' ')
+                if command == 'NICK':
+                    nick = rest
+                elif command == 'USER':
+                    self.reply(':{} 001 {} :Welcome to the fake IRC network'.format(server.name, nick))
+                    server.connected.set()
+                elif command == 'JOIN':
+                    self.reply(':{}!{}@localhost JOIN {}'.format(nick, nick, rest))
+                elif command == 'QUIT':
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            server.connected.clear()
+            with server.lock:
+                server.connection = None
+    
+    def reply(self, line):
+        with self.server.lock:
+            self.request.sendall(line.encode('utf-8') + b'\r\n')
@@ -0,0 +1,96 @@
+"""A local fake of the Minecraft server's rcon interface, so the rcon transport can be tested offline.
+
+Start a FakeRcon server and point rcon.Connection or rcon.Transport at its host and port. Like the real server, it answers each command with its response split into packets of at most 4096 bytes, all with the command's request ID, and it handles the commands of a connection one after the other. Responses come from the responses dict (command → text), other commands get an empty response. The server can be told to stop answering, to test timeouts, or to answer with malformed packets.
+"""
+
+import socketserver
+import struct
+import threading
+
+MAX_RESPONSE_BYTES = 4096
+
+class FakeRcon(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """The fake rcon server. Listens on a free port on localhost, in a background thread."""
+    
+    daemon_threads = True
+    
+    def __init__(self, password='hunter2'):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.password = password
+        self.lock = threading.Lock()
+        self.answering = threading.Event()
+        self.answering.set()
+        self.commands = [] # every command received, in order, including the empty sentinel commands
+        self.connections = 0
+        self.malformed = 0 # the number of commands to answer with a malformed packet
+        self.responses = {}
+        self.thread = threading.Thread(target=self.serve_forever, name='fake rcon', daemon=True)
+        self.thread.start()
+    
+    @property
+    def port(self):
+        return self.server_address[1]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+    
+    def resume(self):
+        self.answering.set()
+    
+    def stop(self):
+        self.answering.set()
+        self.shutdown()
+        self.server_close()
+    
+    def stop_answering(self):
+        """Commands are still received and logged, but not answered until resume is called."""
+        self.answering.clear()
+
+class Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        try:
+            while True:
+                request_id, packet_type, payload = self.read_packet()
+                if packet_type == 3: # auth
+                    self.send_packet(request_id if payload == server.password else -1, 2, '')
+                    continue
+                with server.lock:
+                    server.commands.append(payload)
+                    response = server.responses.get(payload, '')
+                    malformed = server.malformed > 0
+                    if malformed:
+                        server.malformed -= 1
+                server.answering.wait()
+                if malformed:
+                    self.request.sendall(struct.pack('<i', 4) + struct.pack('<i', request_id)) # too short to hold a packet type
+                    continue
+                for start in range(0, max(len(response.encode('utf-8')), 1), MAX_RESPONSE_BYTES):
+                    self.send_packet(request_id, 0, response.encode('utf-8')[start:start + MAX_RESPONSE_BYTES])
+        except (ConnectionError, EOFError, OSError):
+            pass
+    
+    def read_exactly(self, length):
+        data = b''
+        while len(data) < length:
+            chunk = self.request.recv(length - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+    
+    def read_packet(self):
+        length = struct.unpack('<i', self.read_exactly(4))[0]
+        packet = self.read_exactly(length)
+        request_id, packet_type = struct.unpack_from('<ii', packet)
+        return request_id, packet_type, packet[8:-2].decode('utf-8')
+    
+    def send_packet(self, request_id, packet_type, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        self.request.sendall(struct.pack('<iii', len(payload) + 10, request_id, packet_type) + payload + b'\x00\x00')
@@ -0,0 +1,271 @@
+"""A local fake of the parts of the Twitter REST and streaming APIs the bot uses, so the Twitter code can be tested offline.
+
+Start a FakeTwitter server and pass FakeTwitterAPI(server) wherever the bot expects a TwitterAPI.TwitterAPI. The server keeps tweets in memory, sends x-rate-limit-* headers for GET endpoints and answers 429 once an endpoint's budget is used up, rejects duplicate statuses with error 187, and can be told to fail the next requests to a resource.
+"""
+
+import collections
+import http.server
+import json
+import queue
+import re
+import socketserver
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+POST_RESOURCES = {'friendships/create', 'lists/members/create', 'statuses/retweet/:id', 'statuses/update'}
+
+def endpoint_name(resource):
+    return re.sub(':[^/]+', ':id', resource)
+
+class FakeTwitter(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """The fake API server. Listens on a free port on localhost, in a background thread."""
+    
+    daemon_threads = True
+    
+    def __init__(self, screen_name='wurstmineberg', rate_limit=180, window=900):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.screen_name = screen_name
+        self.rate_limit = rate_limit
+        self.window = window
+        self.lock = threading.Lock()
+        self.budgets = {} # endpoint → [remaining, reset]
+        self.limits = {} # endpoint → limit, for endpoints with a limit other than rate_limit
+        self.failures = collections.defaultdict(collections.deque) # endpoint → (status code, error code, message) to answer the next requests with
+        self.following = set()
+        self.list_members = set()
+        self.log = [] # (method, endpoint, params) for every request received
+        self.next_id = 1000
+        self.stream_queues = []
+        self.tweets = collections.OrderedDict() # ID → tweet
+        self.thread = threading.Thread(target=self.serve_forever, name='fake Twitter', daemon=True)
+        self.thread.start()
+    
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/1.1/'.format(self.server_address[1])
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+    
+    def add_tweet(self, text, screen_name='someone', mentions=(), retweeted_status=None):
+        """Adds a tweet and returns it. If it mentions the bot's account, it's also sent to open user streams."""
+        with self.lock:
+            tweet_id = self.next_id
+            self.next_id += 1
+            tweet = {
+                'created_at': time.strftime('%a %b %d %H:%M:%S +0000 %Y', time.gmtime()),
+                'entities': {'urls': [], 'user_mentions': [{'screen_name': mention} for mention in mentions]},
+                'id': tweet_id,
+                'id_str': str(tweet_id),
+                'text': text,
+                'user': {'screen_name': screen_name}
+            }
+            if retweeted_status is not None:
+                tweet['retweeted_status'] = retweeted_status
+            self.tweets[tweet_id] = tweet
+            if self.screen_name in mentions:
+                for stream_queue in self.stream_queues:
+                    stream_queue.put(tweet)
+        return tweet
+    
+    def fail(self, resource, status_code, code=131, message='Internal error', count=1):
+        """Makes the next count requests to the resource fail with the given HTTP status and Twitter error code."""
+        with self.lock:
+            for i in range(count):
+                self.failures[endpoint_name(resource)].append((status_code, code, message))
+    
+    def mention(self, text, screen_name='someone'):
+        return self.add_tweet('@' + self.screen_name + ' ' + text, screen_name=screen_name, mentions=[self.screen_name])
+    
+    def requests_to(self, resource):
+        with self.lock:
+            return [params for method, endpoint, params in self.log if endpoint == endpoint_name(resource)]
+    
+    def set_limit(self, resource, limit):
+        with self.lock:
+            self.limits[endpoint_name(resource)] = limit
+            self.budgets.pop(endpoint_name(resource), None)
+    
+    def stop(self):
+        with self.lock:
+            for stream_queue in self.stream_queues:
+                stream_queue.put(None)
+        self.shutdown()
+        self.server_close()
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.0' # the connection is closed after each response, which ends streams
+    
+    def do_GET(self):
+        self.handle_request('GET')
+    
+    def do_POST(self):
+        self.handle_request('POST')
+    
+    def handle_request(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        resource = url.path[len('/1.1/'):-len('.json')]
+        params = dict(urllib.parse.parse_qsl(url.query))
+        if method == 'POST':
+            params.update(urllib.parse.parse_qsl(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')))
+        twitter = self.server
+        endpoint = re.sub('/[0-9]+$', '/:id', resource)
+        headers = {}
+        with twitter.lock:
+            twitter.log.append((method, endpoint, params))
+            if method == 'GET' and endpoint != 'user':
+                limit = twitter.limits.get(endpoint, twitter.rate_limit)
+                budget = twitter.budgets.get(endpoint)
+                if budget is None or budget[1] <= time.time():
+                    budget = twitter.budgets[endpoint] = [limit, int(time.time()) + twitter.window]
+                if budget[0] == 0:
+                    return self.send_error_json(429, 88, 'Rate limit exceeded', {'x-rate-limit-limit': limit, 'x-rate-limit-remaining': 0, 'x-rate-limit-reset': budget[1]})
+                budget[0] -= 1
+                headers = {'x-rate-limit-limit': limit, 'x-rate-limit-remaining': budget[0], 'x-rate-limit-reset': budget[1]}
+            if len(twitter.failures[endpoint]):
+                status_code, code, message = twitter.failures[endpoint].popleft()
+                return self.send_error_json(status_code, code, message, headers)
+        if endpoint == 'user':
+            return self.stream()
+        handler = getattr(self, 'resource_' + endpoint.replace('/', '_').replace(':', ''), None)
+        if handler is None:
+            return self.send_error_json(404, 34, 'Sorry, that page does not exist')
+        handler(resource, params, headers)
+    
+    def log_message(self, format, *args):
+        pass # keep test output clean
+    
+    def resource_friendships_create(self, resource, params, headers):
+        with self.server.lock:
+            self.server.following.add(params['screen_name'])
+        self.send_json({'screen_name': params['screen_name']}, headers)
+    
+    def resource_lists_members_create(self, resource, params, headers):
+        with self.server.lock:
+            self.server.list_members.add((params['list_id'], params['screen_name']))
+        self.send_json({'id_str': params['list_id']}, headers)
+    
+    def resource_statuses_lookup(self, resource, params, headers):
+        with self.server.lock:
+            found = [self.server.tweets[int(tweet_id)] for tweet_id in params['id'].split(',') if int(tweet_id) in self.server.tweets]
+        self.send_json(found, headers)
+    
+    def resource_statuses_mentions_timeline(self, resource, params, headers):
+        since_id = int(params.get('since_id', 0))
+        with self.server.lock:
+            mentions = [tweet for tweet_id, tweet in self.server.tweets.items() if tweet_id > since_id and any(mention['screen_name'] == self.server.screen_name for mention in tweet['entities']['user_mentions'])]
+        self.send_json(list(reversed(mentions))[:int(params.get('count', 20))], headers)
+    
+    def resource_statuses_retweet_id(self, resource, params, headers):
+        tweet_id = int(resource.rsplit('/', 1)[1])
+        with self.server.lock:
+            tweet = self.server.tweets.get(tweet_id)
+        if tweet is None:
+            return self.send_error_json(404, 144, 'No status found with that ID.', headers)
+        self.send_json(self.server.add_tweet('RT @' + tweet['user']['screen_name'] + ': ' + tweet['text'], screen_name=self.server.screen_name, retweeted_status=tweet), headers)
+    
+    def resource_statuses_show_id(self, resource, params, headers):
+        with self.server.lock:
+            tweet = self.server.tweets.get(int(resource.rsplit('/', 1)[1]))
+        if tweet is None:
+            return self.send_error_json(404, 144, 'No status found with that ID.', headers)
+        self.send_json(tweet, headers)
+    
+    def resource_statuses_update(self, resource, params, headers):
+        with self.server.lock:
+            duplicate = any(tweet['text'] == params['status'] and tweet['user']['screen_name'] == self.server.screen_name for tweet in self.server.tweets.values())
+        if duplicate:
+            return self.send_error_json(403, 187, 'Status is a duplicate.', headers)
+        self.send_json(self.server.add_tweet(params['status'], screen_name=self.server.screen_name), headers)
+    
+    def send_error_json(self, status_code, code, message, headers={}):
+        self.send_json({'errors': [{'code': code, 'message': message}]}, headers, status_code=status_code)
+    
+    def send_json(self, data, headers={}, status_code=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def stream(self, keepalive=0.5):
+        """Sends mentions as they are added, with a keepalive newline whenever nothing happens for keepalive seconds."""
+        stream_queue = queue.Queue()
+        with self.server.lock:
+            self.server.stream_queues.append(stream_queue)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'friends': []}).encode('utf-8') + b'\r\n')
+            self.wfile.flush()
+            while True:
+                try:
+                    tweet = stream_queue.get(timeout=keepalive)
+                except queue.Empty:
+                    self.wfile.write(b'\r\n')
+                else:
+                    if tweet is None:
+                        return
+                    self.wfile.write(json.dumps(tweet).encode('utf-8') + b'\r\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.server.lock:
+                self.server.stream_queues.remove(stream_queue)
+
+class FakeResponse:
+    """The parts of requests.Response the bot uses."""
+    
+    def __init__(self, status_code, headers, raw):
+        self.status_code = status_code
+        self.headers = headers
+        self.raw = raw
+        self._content = None
+    
+    def close(self):
+        self.raw.close()
+    
+    def iter_content(self, chunk_size=None):
+        while True:
+            try:
+                chunk = self.raw.read1(65536) if chunk_size is None else self.raw.read(chunk_size)
+            except (OSError, ValueError): # closed
+                raise IOError('connection closed')
+            if not chunk:
+                return
+            yield chunk
+    
+    def json(self):
+        if self._content is None:
+            self._content = self.raw.read()
+        return json.loads(self._content.decode('utf-8'))
+
+class FakeTwitterAPI:
+    """Talks to a FakeTwitter server, with the request method of TwitterAPI.TwitterAPI."""
+    
+    def __init__(self, server):
+        self.server = server
+    
+    def request(self, resource, params=None):
+        path = re.sub('/:', '/', resource)
+        data = urllib.parse.urlencode(params or {})
+        if endpoint_name(resource) in POST_RESOURCES:
+            request = urllib.request.Request(self.server.url + path + '.json', data=data.encode('utf-8'), method='POST')
+        else:
+            request = urllib.request.Request(self.server.url + path + '.json' + ('?' + data if data else ''))
+        try:
+            raw = urllib.request.urlopen(request, timeout=10)
+        except urllib.error.HTTPError as e:
+            raw = e
+        return FakeResponse(raw.status if hasattr(raw, 'status') else raw.code, {name.lower(): value for name, value in raw.headers.items()}, raw)
@@ -0,0 +1,40 @@
+import threading
+from wurstminebot import commands
+
+class FakeSender:
+    def display_name(self):
+        return 'tester'
+
+class FakeCommand:
+    def __init__(self, name, action):
+        self.name = name
+        self.action = action
+        self.context = 'irc'
+        self.sender = FakeSender()
+    
+    def run(self):
+        self.action()
+
+def fail():
+    raise RuntimeError('command failed')
+
+def test_pool_survives_failing_commands(config):
+    pool = commands.CommandPool(workers=1)
+    pool.start()
+    try:
+        for i in range(3):
+            assert pool.submit(FakeCommand('Fail', fail))
+        done = threading.Event()
+        assert pool.submit(FakeCommand('Succeed', done.set))
+        assert done.wait(5)
+        assert all(thread.is_alive() for thread in pool.threads)
+        assert pool.status()['commands']['Fail']['count'] == 3
+    finally:
+        pool.stop()
+
+def test_pool_refuses_when_sender_queue_full(config):
+    pool = commands.CommandPool(workers=1, queue_size_per_sender=2) # not started, so nothing is taken off the queue
+    assert pool.submit(FakeCommand('A', lambda: None))
+    assert pool.submit(FakeCommand('B', lambda: None))
+    assert not pool.submit(FakeCommand('C', lambda: None))
+    pool.stop()
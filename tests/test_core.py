@@ -0,0 +1,66 @@
+import pytest
+import threading
+from wurstminebot import core
+
+@pytest.fixture
+def presence(config, monkeypatch):
+    monkeypatch.setitem(core.state, 'presence', {
+        'generation': 0,
+        'lock': threading.Lock(),
+        'players': [],
+        'stamp': None
+    })
+    return core.state['presence']
+
+def test_online_players_is_cached(presence, monkeypatch):
+    calls = []
+    
+    def online_players(allow_exceptions=False):
+        calls.append(allow_exceptions)
+        return ['alice']
+    
+    monkeypatch.setattr(core.minecraft, 'online_players', online_players)
+    assert core.online_players() == ['alice']
+    core.update_presence('bob', True)
+    assert core.online_players() == ['alice', 'bob']
+    assert len(calls) == 1
+
+def test_events_during_a_query_are_not_overwritten(presence, monkeypatch):
+    def online_players(allow_exceptions=False):
+        core.update_presence('bob', True) # seen in the log while the answer without bob is on its way
+        return ['alice']
+    
+    monkeypatch.setattr(core.minecraft, 'online_players', online_players)
+    assert core.online_players() == ['alice']
+    assert presence['stamp'] is None
+    monkeypatch.setattr(core.minecraft, 'online_players', lambda allow_exceptions=False: ['alice', 'bob'])
+    assert core.online_players() == ['alice', 'bob']
+    assert presence['stamp'] is not None
+
+def test_failures_are_not_cached(presence, monkeypatch):
+    def online_players(allow_exceptions=False):
+        if allow_exceptions:
+            raise IOError('server down')
+        return [] # what minecraft.online_players falls back to
+    
+    monkeypatch.setattr(core.minecraft, 'online_players', online_players)
+    assert core.online_players() == []
+    with pytest.raises(IOError):
+        core.online_players(allow_exceptions=True)
+    assert presence['stamp'] is None
+
+def test_log_status(monkeypatch):
+    class Pool:
+        def status(self):
+            return {'commands': {'Status': {'count': 2, 'maxLatency': 0.5}}, 'queued': 1, 'running': 0, 'workers': 4}
+    
+    class Bot:
+        def status(self):
+            return {'queued': 3, 'sent': 10}
+    
+    logged = []
+    monkeypatch.setitem(core.state, 'bot', Bot())
+    monkeypatch.setitem(core.state, 'command_pool', Pool())
+    monkeypatch.setattr(core, 'debug_print', lambda msg, level='debug', exc_info=False: logged.append((msg, level)))
+    core.log_status()
+    assert logged == [('[status] commands {"commands": {"Status": {"count": 2, "maxLatency": 0.5}}, "queued": 1, "running": 0, "workers": 4}', 'info'), ('[status] irc {"queued": 3, "sent": 10}', 'info')]
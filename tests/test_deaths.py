@@ -0,0 +1,99 @@
+import minecraft
+import pytest
+import re
+from wurstminebot import deaths
+from wurstminebot import nicksub
+
+CORPUS = [ # (message, death id, groups), at least one for every entry of deaths.messages
+    ('was squashed by a falling anvil', 'anvil', ()),
+    ('was pricked to death', 'cactus', ()),
+    ('walked into a cactus whilst trying to escape Zombie', 'cactusEscape', ('Zombie',)),
+    ('was shot by arrow', 'arrow', ()),
+    ('drowned', 'drowned', ()),
+    ('drowned whilst trying to escape Spider', 'drownedEscape', ('Spider',)),
+    ('blew up', 'explosion', ()),
+    ('was blown up by Creeper', 'explosionCreeper', ()),
+    ('was blown up by Ghast', 'explosionBy', ('Ghast',)),
+    ('hit the ground too hard', 'hitGround', ()),
+    ('fell from a high place and fell out of the world', 'highVoid', ()),
+    ('fell from a high place and got finished off by alice', 'highFinishedPlayer', ('alice',)),
+    ('fell from a high place', 'high', ()),
+    ('fell off a ladder', 'highLadder', ()),
+    ('fell off some vines', 'highVines', ()),
+    ('fell out of the water', 'highWater', ()),
+    ('fell into a patch of fire', 'hitGroundFire', ()),
+    ('fell into a patch of cacti', 'hitGroundCactus', ()),
+    ('was doomed to fall', 'doomedToFall', ()),
+    ('was doomed to fall by alice using [Bow of Doom]', 'doomedToFallPlayerUsing', ('alice', 'Bow of Doom')),
+    ('was doomed to fall by Zombie Pigman', 'doomedToFallBy', ('Zombie Pigman',)),
+    ('was shot off some vines by Skeleton', 'arrowHighVines', ('Skeleton',)),
+    ('was shot off a ladder by Skeleton', 'arrowHighLadder', ('Skeleton',)),
+    ('was blown from a high place by Creeper', 'explosionHigh', ('Creeper',)),
+    ('went up in flames', 'fire', ()),
+    ('burned to death', 'burn', ()),
+    ('was burnt to a crisp whilst fighting Blaze', 'burnBy', ('Blaze',)),
+    ('walked into a fire whilst fighting Zombie', 'fireBy', ('Zombie',)),
+    ('was slain by alice using [Sword]', 'slainPlayerUsing', ('alice', 'Sword')),
+    ('was slain by Zombie Pigman using [Golden Sword]', 'slainUsing', ('Zombie Pigman', 'Golden Sword')),
+    ('was slain by Silverfish', 'slainSilverfish', ()),
+    ('was slain by Zombie', 'slainZombie', ()),
+    ('was slain by Cave Spider', 'slain', ('Cave Spider',)),
+    ('was slain by alice', 'slain', ('alice',)),
+    ('was slain by alice using a stick', 'slain', ('alice using a stick',)),
+    ('was shot by alice using [Bow]', 'shotPlayerUsing', ('alice', 'Bow')),
+    ('was shot by alice', 'shotPlayer', ('alice',)),
+    ('was shot by Skeleton', 'shotPlayer', ('Skeleton',)), # looks like a username
+    ('was shot by Skeleton Horse Rider', 'shot', ('Skeleton Horse Rider',)),
+    ('was fireballed by Ghast', 'fireball', ('Ghast',)),
+    ('tried to swim in lava to escape Zombie', 'lavaBy', ('Zombie',)),
+    ('tried to swim in lava', 'lava', ()),
+    ('died', 'generic', ()),
+    ('got finished off by alice using [Axe]', 'finishedPlayerUsing', ('alice', 'Axe')),
+    ('got finished off by Wither Skeleton using [Stone Sword]', 'finishedUsing', ('Wither Skeleton', 'Stone Sword')),
+    ('was killed by alice using magic', 'magicPlayer', ('alice',)),
+    ('was killed by Witch of the West using magic', 'magicBy', ('Witch of the West',)),
+    ('was killed by magic', 'magic', ()),
+    ('starved to death', 'starved', ()),
+    ('suffocated in a wall', 'wall', ()),
+    ('was killed trying to hurt Guardian', 'genericBy', ('Guardian',)),
+    ('was pummeled by Snow Golem', 'pummeledBy', ('Snow Golem',)),
+    ('fell out of the world', 'void', ()),
+    ('was knocked into the void by alice', 'voidBy', ('alice',)),
+    ('withered away', 'wither', ()),
+    ('was struck by lightning', 'lightning', ())
+]
+
+NOT_DEATHS = [
+    'drowned whilst trying to escape',
+    'joined the game',
+    'said hello'
+]
+
+@pytest.fixture(autouse=True)
+def offline_people(config, monkeypatch):
+    monkeypatch.setattr(nicksub, 'minecraft_profile', lambda username: None)
+
+def reference_classify(log_line):
+    """Classifies a log line the way Death did before the messages were combined into one regex: each message on its own, in list order."""
+    for death in deaths.messages:
+        match = re.match('(' + minecraft.regexes.timestamp + '|' + minecraft.regexes.full_timestamp + ') \\[Server thread/INFO\\]: (' + minecraft.regexes.player + ') ' + death['regex'] + '$', log_line)
+        if match:
+            return death['id'], match.groups()[2:]
+
+def test_corpus_covers_every_message():
+    assert {death_id for message, death_id, groups in CORPUS} == {death['id'] for death in deaths.messages}
+
+@pytest.mark.parametrize('message,death_id,groups', CORPUS)
+def test_classification(message, death_id, groups):
+    log_line = '2015-06-01 12:34:56 [Server thread/INFO]: bob ' + message
+    death = deaths.Death(log_line)
+    assert (death.id, death.groups) == (death_id, groups)
+    assert reference_classify(log_line) == (death_id, groups)
+    assert death.message() == 'bob ' + message
+
+@pytest.mark.parametrize('message', NOT_DEATHS)
+def test_not_a_death(message):
+    log_line = '2015-06-01 12:34:56 [Server thread/INFO]: bob ' + message
+    assert reference_classify(log_line) is None
+    with pytest.raises(ValueError):
+        deaths.Death(log_line)
@@ -0,0 +1,84 @@
+import pytest
+import threading
+from wurstminebot import ircclient
+from tests import fake_ircd
+
+@pytest.fixture
+def ircd():
+    with fake_ircd.FakeIrcd() as server:
+        yield server
+
+@pytest.fixture
+def connect(ircd):
+    clients = []
+    
+    def connect(binds={}):
+        client = ircclient.Client('127.0.0.1', ircd.port, 'wurstminebot', 'test bot')
+        for msgtype, callback in binds.items():
+            client.bind(msgtype, callback)
+        thread = threading.Thread(target=client.run, name='IRC client', daemon=True)
+        thread.start()
+        clients.append((client, thread))
+        ircd.expect(lambda line: line.startswith('USER '))
+        return client
+    
+    yield connect
+    for client, thread in clients:
+        client.stop()
+        thread.join(5)
+        assert not thread.is_alive()
+
+def test_join(ircd, connect):
+    joined = threading.Event()
+    client = connect({'JOIN': lambda sender, headers, message: joined.set()})
+    client.joinchan('#wurstmineberg')
+    ircd.expect(lambda line: line == 'JOIN #wurstmineberg')
+    assert joined.wait(5)
+    assert '#wurstmineberg' in client.channel_data
+
+def test_ping_is_answered_while_a_callback_is_busy(ircd, connect):
+    busy = threading.Event()
+    release = threading.Event()
+    
+    def privmsg(sender, headers, message):
+        busy.set()
+        release.wait(5)
+    
+    connect({'PRIVMSG': privmsg})
+    ircd.send(':alice!alice@localhost PRIVMSG #wurstmineberg :hi')
+    assert busy.wait(5)
+    ircd.send('PING :irc.example.com')
+    ircd.expect(lambda line: line == 'PONG :irc.example.com')
+    assert not release.is_set()
+    release.set()
+
+def test_lines_split_across_reads(ircd, connect):
+    received = []
+    done = threading.Event()
+    
+    def record(msgtype):
+        def callback(sender, headers, message):
+            received.append((msgtype, sender, headers, message))
+            if len(received) == 2:
+                done.set()
+        
+        return callback
+    
+    connect({'ACTION': record('ACTION'), 'PRIVMSG': record('PRIVMSG')})
+    ircd.send(b':alice!alice@localhost PRIVMSG #wurstmineberg :hello ')
+    ircd.send(b'world\r\n:bob!bob@localhost PRIVMSG #wurstmineberg :\x01ACTION waves\x01\r\n')
+    assert done.wait(5)
+    assert received == [
+        ('PRIVMSG', 'alice', ['#wurstmineberg'], 'hello world'),
+        ('ACTION', 'bob', ['#wurstmineberg'], 'waves')
+    ]
+
+def test_say_from_another_thread_is_batched(ircd, connect):
+    client = connect()
+    writes = client.stats['writes']
+    thread = threading.Thread(target=lambda: [client.say('#wurstmineberg', 'line {}'.format(i)) for i in range(20)])
+    thread.start()
+    thread.join(5)
+    lines = ircd.expect(lambda line: line == 'PRIVMSG #wurstmineberg :line 19')
+    assert lines == ['PRIVMSG #wurstmineberg :line {}'.format(i) for i in range(20)]
+    assert client.stats['writes'] - writes < 20
@@ -0,0 +1,60 @@
+import json
+import os
+import time
+from wurstminebot import core
+from wurstminebot import logger
+
+def read_log(path, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path):
+            with open(path) as log_file:
+                lines = log_file.read().splitlines()
+            if len(lines):
+                return lines
+        time.sleep(0.05)
+    return []
+
+def test_rate_limit_and_rotation(tmp_path):
+    path = str(tmp_path / 'wurstminebot.log')
+    log = logger.Logger(path, rate_limits={'logpipe': 3})
+    for i in range(10):
+        log.log('[logpipe] line {}'.format(i))
+    log.log('[logpipe] crash', level='error')
+    time.sleep(0.2)
+    os.rename(path, path + '.1')
+    time.sleep(logger.ROTATION_CHECK_INTERVAL + 0.1)
+    log.log('after rotation')
+    log.stop()
+    with open(path + '.1') as log_file:
+        rotated = [line.split(' ', 3)[3] for line in log_file.read().splitlines()]
+    assert rotated == ['[logpipe] line 0', '[logpipe] line 1', '[logpipe] line 2', '[logpipe] 7 messages suppressed', '[logpipe] crash'] # errors are never suppressed
+    assert [line.split(' ', 3)[3] for line in read_log(path)] == ['after rotation']
+    assert log.status()['suppressed'] == 7
+
+def test_exception_tracebacks(tmp_path):
+    path = str(tmp_path / 'wurstminebot.log')
+    log = logger.Logger(path)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        log.log('Exception in test:', level='error', exc_info=True)
+    log.stop()
+    lines = read_log(path)
+    assert lines[0].startswith('ERROR] ')
+    assert lines[0].endswith(' Exception in test:')
+    assert lines[-1] == 'ZeroDivisionError: division by zero'
+
+def test_debug_mode_can_be_turned_on_at_runtime(config, monkeypatch, capsys):
+    monkeypatch.setitem(core.state, 'logger', None)
+    config({'debug': False})
+    core.config() # load it
+    core.debug_print('hidden')
+    time.sleep(0.05)
+    config({'debug': True, 'padding': 'so the size changes'})
+    core.config() # the bot reads the config all the time, which notices the change
+    core.debug_print('shown')
+    core.state['logger'].stop()
+    output = capsys.readouterr().out
+    assert 'hidden' not in output
+    assert 'DEBUG] ' in output and output.rstrip().endswith(' shown')
@@ -0,0 +1,62 @@
+import pytest
+import threading
+import time
+from wurstminebot import logtail
+
+def test_reads_only_appended_lines(tmp_path):
+    path = tmp_path / 'latest.log'
+    path.write_text('old line\n')
+    with logtail.LogTail(str(path)) as log:
+        assert log.read_lines() == []
+        with path.open('a') as f:
+            f.write('first\nsecond, still being writ')
+        assert log.read_lines() == ['first']
+        with path.open('a') as f:
+            f.write('ten\n')
+        assert log.read_lines() == ['second, still being written']
+
+def test_follows_rotation_and_truncation(tmp_path):
+    path = tmp_path / 'latest.log'
+    path.write_text('')
+    with logtail.LogTail(str(path)) as log:
+        with path.open('a') as f:
+            f.write('before rotation\n')
+        path.rename(tmp_path / 'old.log')
+        path.write_text('after rotation\n')
+        assert log.read_lines() == ['before rotation', 'after rotation']
+        path.write_text('truncated\n')
+        assert log.read_lines() == ['truncated']
+
+@pytest.mark.parametrize('backend', ['inotify', 'poll'])
+def test_stop_interrupts_wait(tmp_path, backend):
+    path = tmp_path / 'latest.log'
+    path.write_text('')
+    try:
+        watcher = logtail.watcher(str(path), backend=backend, interval=30)
+    except OSError:
+        pytest.skip('inotify is not available')
+    results = []
+    thread = threading.Thread(target=lambda: results.append(watcher.wait()))
+    start = time.monotonic()
+    thread.start()
+    time.sleep(0.1)
+    watcher.stop()
+    thread.join(5)
+    assert results == [False]
+    assert time.monotonic() - start < 5
+    watcher.close()
+
+def test_inotify_wakes_on_write(tmp_path):
+    path = tmp_path / 'latest.log'
+    path.write_text('')
+    try:
+        watcher = logtail.watcher(str(path), backend='inotify', interval=30)
+    except OSError:
+        pytest.skip('inotify is not available')
+    try:
+        threading.Timer(0.1, lambda: path.write_text('line\n')).start()
+        start = time.monotonic()
+        assert watcher.wait()
+        assert time.monotonic() - start < 5
+    finally:
+        watcher.close()
@@ -0,0 +1,14 @@
+from wurstminebot import core
+from wurstminebot import logins
+from wurstminebot import loop
+from wurstminebot import nicksub
+
+def test_join_without_logs_directory(config, tmp_path, monkeypatch):
+    config({'paths': {'cache': str(tmp_path / 'cache')}}) # a paths section without logs
+    sent = []
+    monkeypatch.setattr(core, 'tellraw', lambda message, player=None, block=False: sent.append((message, player)))
+    monkeypatch.setattr(core, 'update_topic', lambda *args, **kwargs: None)
+    monkeypatch.setattr(nicksub, 'minecraft_profile', lambda username: None)
+    assert logins.logins_index() is None
+    loop.InputLoop.process_value('2015-06-01 12:34:56 [Server thread/INFO]: stranger joined the game')
+    assert [player for message, player in sent] == ['stranger'] # the “you're not in the database” message
@@ -0,0 +1,12 @@
+import uuid
+from wurstminebot import nicksub
+
+def test_invalid_uuid_only_affects_uuid_lookups(config):
+    index = nicksub.PeopleIndex([
+        {'id': 'alice', 'irc': {'nicks': ['Alice']}, 'minecraft': 'alice_mc', 'minecraftUUID': 'bogus'},
+        {'id': 'bob', 'minecraftUUID': '0123456789abcdef0123456789abcdef'}
+    ])
+    assert index.by_id['alice']['minecraft'] == 'alice_mc'
+    assert index.by_irc_nick['alice'] == 'alice'
+    assert index.by_minecraft['alice_mc'] == 'alice'
+    assert index.by_minecraft_uuid == {uuid.UUID('0123456789abcdef0123456789abcdef'): 'bob'}
@@ -0,0 +1,67 @@
+import json
+import pytest
+import threading
+from tests import fake_twitter
+from wurstminebot import core
+from wurstminebot import outbox
+
+@pytest.fixture
+def server(config, monkeypatch):
+    with fake_twitter.FakeTwitter() as server:
+        monkeypatch.setattr(core, 'twitter', fake_twitter.FakeTwitterAPI(server))
+        monkeypatch.setitem(core.state, 'tweet_cache', None)
+        yield server
+
+class FollowUps(list):
+    """Records the follow-ups the outbox sends instead of announcing them."""
+    
+    def __init__(self):
+        super().__init__()
+        self.done = threading.Event()
+    
+    def __call__(self, entry, url=None, error=None):
+        self.append((entry['status'], url, error))
+        self.done.set()
+
+@pytest.fixture
+def follow_ups(monkeypatch):
+    follow_ups = FollowUps()
+    monkeypatch.setattr(outbox, 'follow_up', follow_ups)
+    return follow_ups
+
+def test_posts_queued_tweets(server, follow_ups, tmp_path):
+    path = tmp_path / 'outbox.json'
+    box = outbox.Outbox(str(path))
+    box.put('[Achievement Get] @someone got Taking Inventory')
+    assert follow_ups.done.wait(5)
+    box.stop()
+    status, url, error = follow_ups[0]
+    assert error is None
+    assert url.startswith('https://twitter.com/wurstmineberg/status/')
+    assert json.loads(path.read_text()) == []
+
+def test_duplicate_after_lost_response_counts_as_posted(server, follow_ups, tmp_path):
+    path = tmp_path / 'outbox.json'
+    server.add_tweet('someone fell from a high place', screen_name='wurstmineberg') # posted before the bot crashed
+    path.write_text(json.dumps([{
+        'attempts': 0,
+        'id': 'crashed',
+        'info': {},
+        'kind': None,
+        'notBefore': 0,
+        'posting': True,
+        'status': 'someone fell from a high place'
+    }]))
+    box = outbox.Outbox(str(path))
+    assert follow_ups.done.wait(5)
+    box.stop()
+    assert follow_ups == [('someone fell from a high place', 'https://twitter.com/wurstmineberg', None)]
+
+def test_genuine_duplicate_is_reported(server, follow_ups, tmp_path):
+    server.add_tweet('someone fell from a high place', screen_name='wurstmineberg')
+    path = tmp_path / 'outbox.json'
+    box = outbox.Outbox(str(path))
+    box.put('someone fell from a high place')
+    assert follow_ups.done.wait(5)
+    box.stop()
+    assert follow_ups == [('someone fell from a high place', None, 'error 403: Status is a duplicate.')]
@@ -0,0 +1,108 @@
+import concurrent.futures
+import pytest
+import time
+from wurstminebot import core
+from wurstminebot import loop
+from wurstminebot import rcon
+from tests import fake_rcon
+
+@pytest.fixture
+def server():
+    with fake_rcon.FakeRcon() as server:
+        yield server
+
+@pytest.fixture
+def fallbacks(monkeypatch):
+    commands = []
+    
+    def command(cmd, args=[]):
+        commands.append(rcon.full_command(cmd, args))
+        return 'from fallback'
+    
+    monkeypatch.setattr(rcon.minecraft, 'command', command, raising=False)
+    return commands
+
+def test_long_responses_are_not_truncated(server):
+    server.responses['list'] = 'x' * 10000
+    server.responses['say hi'] = 'said hi'
+    connection = rcon.Connection('127.0.0.1', server.port, server.password)
+    try:
+        assert connection.run(['list', 'say hi', 'list']) == ['x' * 10000, 'said hi', 'x' * 10000]
+        assert connection.run(['say hi']) == ['said hi'] # nothing left over from the previous batch
+    finally:
+        connection.close()
+
+def test_wrong_password(server):
+    with pytest.raises(rcon.RconError):
+        rcon.Connection('127.0.0.1', server.port, 'wrong')
+
+def test_batches_share_a_connection(server, fallbacks):
+    server.responses['time query daytime'] = 'The time is 1000'
+    transport = rcon.Transport('127.0.0.1', server.port, server.password, flush_window=0.1)
+    try:
+        futures = [transport.command('tellraw', ['@a', '"{}"'.format(i)]) for i in range(10)]
+        assert transport.command('time', ['query', 'daytime'], block=True) == 'The time is 1000'
+        concurrent.futures.wait(futures, timeout=5)
+        assert [future.result() for future in futures] == [''] * 10
+        assert transport.status()['batches'] == 1
+        assert server.connections == 1
+        assert fallbacks == []
+    finally:
+        transport.stop()
+
+def test_commands_are_not_resent_after_a_read_timeout(server, fallbacks):
+    transport = rcon.Transport('127.0.0.1', server.port, server.password, flush_window=0, timeout=0.5)
+    try:
+        assert transport.command('say', ['before'], block=True) == ''
+        server.stop_answering()
+        with pytest.raises(rcon.RconError):
+            transport.command('say', ['hi'], block=True)
+        assert fallbacks == []
+        assert server.commands.count('say hi') == 1
+        assert transport.status()['unanswered'] == 1
+        server.resume()
+        assert transport.command('say', ['after'], block=True) == '' # reconnects
+        assert fallbacks == []
+    finally:
+        transport.stop()
+
+def test_worker_survives_malformed_packets(server, fallbacks):
+    transport = rcon.Transport('127.0.0.1', server.port, server.password, flush_window=0, timeout=1)
+    try:
+        server.malformed = 1
+        with pytest.raises(rcon.RconError):
+            transport.command('say', ['hi'], block=True)
+        assert transport.thread.is_alive()
+        assert transport.command('say', ['after'], block=True) == '' # reconnects
+        assert fallbacks == []
+    finally:
+        transport.stop()
+
+def test_fallback_while_disconnected(fallbacks):
+    with fake_rcon.FakeRcon() as server:
+        port = server.port
+    transport = rcon.Transport('127.0.0.1', port, 'hunter2', flush_window=0)
+    try:
+        assert transport.command('say', ['hi'], block=True) == 'from fallback'
+        assert fallbacks == ['say hi']
+    finally:
+        transport.stop()
+
+def test_tell_time_warns_when_tellraw_fails(config, monkeypatch):
+    config({'irc': {'main_channel': '#wurstmineberg'}})
+    said = []
+    
+    class Bot:
+        def say(self, channel, message):
+            said.append((channel, message))
+    
+    def tellraw(message, player=None, block=False):
+        assert block
+        raise rcon.RconError('no response')
+    
+    monkeypatch.setitem(core.state, 'bot', Bot())
+    monkeypatch.setitem(core.state, 'dst', bool(time.localtime().tm_isdst))
+    monkeypatch.setattr(core, 'tellraw', tellraw)
+    monkeypatch.setattr(core, 'update_topic', lambda: None)
+    loop.tell_time()
+    assert said == [('#wurstmineberg', 'Warning! Telltime is disconnected from Minecraft.')]
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+from wurstminebot import loop
+from wurstminebot import runtime
+
+class BlockingWatcher:
+    """A log watcher whose wait blocks until stop is called, recording whether it was closed too early."""
+    
+    def __init__(self):
+        self.waiting = threading.Event()
+        self.stopped = threading.Event()
+        self.closed_while_waiting = False
+        self.in_wait = False
+        self.closed = False
+    
+    def close(self):
+        self.closed_while_waiting = self.in_wait
+        self.closed = True
+    
+    def stop(self):
+        self.stopped.set()
+    
+    def wait(self):
+        self.in_wait = True
+        self.waiting.set()
+        self.stopped.wait(5)
+        threading.Event().wait(0.1) # finishing up takes a moment after being woken
+        self.in_wait = False
+        return False
+
+def test_cancelled_input_loop_closes_the_watcher_after_wait_returns(config, tmp_path, monkeypatch):
+    log_path = tmp_path / 'latest.log'
+    log_path.write_text('')
+    watcher = BlockingWatcher()
+    monkeypatch.setattr(loop, 'watch_log', lambda: (str(log_path), watcher))
+    bot_runtime = runtime.Runtime(workers=2)
+    
+    async def cancel_input_loop():
+        task = bot_runtime.loop.create_task(bot_runtime.input_loop())
+        await bot_runtime.run_blocking(watcher.waiting.wait, 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    
+    try:
+        bot_runtime.loop.run_until_complete(cancel_input_loop())
+    finally:
+        bot_runtime.executor.shutdown()
+        bot_runtime.loop.close()
+    assert watcher.closed
+    assert not watcher.closed_while_waiting
@@ -0,0 +1,195 @@
+import json
+import pytest
+import threading
+from wurstminebot import core
+from wurstminebot import tweets
+
+def make_tweet(tweet_id, mention=True):
+    return {
+        'entities': {'user_mentions': [{'screen_name': 'wurstmineberg' if mention else 'someone_else'}]},
+        'id': tweet_id,
+        'id_str': str(tweet_id),
+        'text': 'hello',
+        'user': {'screen_name': 'tester'}
+    }
+
+class FakeResponse:
+    """A streamed response that yields the given chunks, then either ends or hangs until it's closed."""
+    
+    def __init__(self, status_code=200, chunks=(), hang=False, data=None):
+        self.status_code = status_code
+        self.chunks = list(chunks)
+        self.hang = hang
+        self.data = data
+        self.headers = {}
+        self.closed = threading.Event()
+    
+    def close(self):
+        self.closed.set()
+    
+    def iter_content(self, chunk_size=None):
+        yield from self.chunks
+        if self.hang:
+            self.closed.wait(10)
+            raise IOError('connection closed')
+    
+    def json(self):
+        return self.data
+
+class FakeAPI:
+    def __init__(self, streams, mentions=()):
+        self.streams = list(streams)
+        self.mentions = list(mentions)
+        self.requests = []
+    
+    def request(self, resource, params=None):
+        self.requests.append((resource, params))
+        if resource == 'statuses/mentions_timeline':
+            return FakeResponse(data=[tweet for tweet in reversed(self.mentions) if tweet['id'] > params['since_id']])
+        return self.streams.pop(0)
+
+def stream_data(*messages):
+    return ''.join(json.dumps(message) + '\r\n' for message in messages).encode('utf-8')
+
+@pytest.fixture
+def twitter(config, monkeypatch):
+    config({'twitter': {'screen_name': 'wurstmineberg'}})
+    
+    def set_api(api):
+        monkeypatch.setattr(core, 'twitter', api)
+        monkeypatch.setitem(core.state, 'tweet_cache', None)
+    
+    return set_api
+
+def make_stream(api, path=None):
+    stream = tweets.MentionStream(api, path=path)
+    waits = []
+    
+    def wait(timeout=None):
+        waits.append(timeout)
+        if len(waits) > 20:
+            stream.stop_event.set() # give up instead of looping forever if the test is broken
+        return stream.stop_event.is_set()
+    
+    stream.stop_event.wait = wait
+    return stream, waits
+
+def test_reconnect_backfill_and_dedupe(twitter, monkeypatch):
+    monkeypatch.setattr(tweets, 'STALL_TIMEOUT', 0.5)
+    data = stream_data(make_tweet(1), make_tweet(2, mention=False)) + b'\r\n' + stream_data(make_tweet(3))
+    api = FakeAPI([
+        FakeResponse(chunks=[data[:10], data[10:50], data[50:]], hang=True), # stalls after three mentions
+        FakeResponse(status_code=503),
+        FakeResponse(chunks=[stream_data(make_tweet(5), make_tweet(6))], hang=True)
+    ], mentions=[make_tweet(4), make_tweet(5)])
+    twitter(api)
+    stream, waits = make_stream(api)
+    mentions = iter(stream)
+    assert [next(mentions) for i in range(5)] == [1, 3, 4, 5, 6]
+    stream.stop()
+    assert waits == [0.25, 5]
+    assert ('statuses/mentions_timeline', {'count': 200, 'since_id': 3}) in api.requests
+
+def test_error_responses_are_closed_and_backoff_is_capped(twitter):
+    responses = [FakeResponse(status_code=429) for i in range(7)]
+    api = FakeAPI(responses + [FakeResponse(status_code=503)])
+    twitter(api)
+    stream, waits = make_stream(api)
+    api.streams.append(FakeResponse(chunks=[stream_data(make_tweet(1))]))
+    assert next(iter(stream)) == 1
+    assert waits == [60, 120, 240, 480, 960, 960, 960, 5]
+    assert all(response.closed.is_set() for response in responses)
+
+def test_healthy_connection_resets_backoff(twitter):
+    api = FakeAPI([
+        FakeResponse(status_code=503),
+        FakeResponse(chunks=[b'\r\n']), # only a keepalive, then the stream ends
+        FakeResponse(status_code=503),
+        FakeResponse(chunks=[stream_data(make_tweet(1))])
+    ])
+    twitter(api)
+    stream, waits = make_stream(api)
+    assert next(iter(stream)) == 1
+    assert waits == [5, 5]
+
+def test_last_id_survives_restarts(twitter, tmp_path):
+    path = str(tmp_path / 'twitter_mentions.json')
+    api = FakeAPI([FakeResponse(chunks=[stream_data(make_tweet(7))])])
+    twitter(api)
+    stream, waits = make_stream(api, path=path)
+    assert next(iter(stream)) == 7
+    stream.stop()
+    api = FakeAPI([FakeResponse(hang=True)], mentions=[make_tweet(7), make_tweet(8)])
+    twitter(api)
+    stream, waits = make_stream(api, path=path)
+    assert next(iter(stream)) == 8 # missed while the bot wasn't running
+    stream.stop()
+
+def test_stop_interrupts_a_hanging_stream(twitter):
+    api = FakeAPI([FakeResponse(hang=True)])
+    twitter(api)
+    stream = tweets.MentionStream(api)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(list(stream)))
+    thread.start()
+    while stream.response is None:
+        thread.join(0.01)
+    stream.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert result == [[]]
+
+class LookupAPI:
+    def __init__(self, tweets):
+        self.tweets = tweets
+        self.requests = []
+    
+    def request(self, resource, params=None):
+        self.requests.append((resource, params))
+        if resource == 'statuses/lookup':
+            return FakeResponse(data=[self.tweets[tweet_id] for tweet_id in params['id'].split(',') if tweet_id in self.tweets])
+        return FakeResponse(data=self.tweets[resource.split(':')[1]])
+
+def test_tweet_cache_batches_lookups(twitter):
+    api = LookupAPI({str(i): make_tweet(i) for i in range(3)})
+    cache = tweets.TweetCache(api, batch_window=0)
+    assert set(cache.get_many(['0', '1', '2'])) == {'0', '1', '2'}
+    assert cache.get('1')['id'] == 1
+    assert len(api.requests) == 1
+
+def test_tweet_cache_resolves_every_future_when_adding_fails(twitter):
+    broken = make_tweet(2)
+    broken['retweeted_status'] = {'text': 'no ID'} # makes add raise KeyError
+    api = LookupAPI({'1': make_tweet(1), '2': broken})
+    cache = tweets.TweetCache(api, batch_window=0.2)
+    results = {}
+    
+    def get(tweet_id):
+        try:
+            results[tweet_id] = cache.get(tweet_id)
+        except Exception as e:
+            results[tweet_id] = e
+    
+    threads = [threading.Thread(target=get, args=(tweet_id,)) for tweet_id in ('1', '2')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(api.requests) == 1
+    assert all(isinstance(result, KeyError) for result in results.values())
+
+def test_mentions_from_fake_twitter(twitter):
+    from tests import fake_twitter
+    with fake_twitter.FakeTwitter() as server:
+        api = fake_twitter.FakeTwitterAPI(server)
+        twitter(api)
+        stream = tweets.MentionStream(api)
+        mentions = iter(stream)
+        threading.Timer(0.2, server.add_tweet, args=('not a mention',)).start()
+        threading.Timer(0.3, server.mention, args=('hi',)).start()
+        tweet_id = next(mentions)
+        assert server.tweets[tweet_id]['text'] == '@wurstmineberg hi'
+        assert tweets.tweet_cache().get(tweet_id)['id'] == tweet_id # cached from the stream
+        assert server.requests_to('statuses/show/:id') == []
+        stream.stop()
@@ -0,0 +1,105 @@
+import pytest
+import threading
+from tests import fake_twitter
+from wurstminebot import core
+from wurstminebot import twitterclient
+
+@pytest.fixture
+def server():
+    with fake_twitter.FakeTwitter() as server:
+        yield server
+
+@pytest.fixture
+def client(config, server):
+    client = twitterclient.Client(fake_twitter.FakeTwitterAPI(server), coalesce_window=5, reserve=2)
+    yield client
+    client.stop()
+
+def test_budget_is_tracked_per_endpoint(client, server):
+    server.set_limit('statuses/show/:id', 2)
+    tweet = server.add_tweet('hello')
+    for i in range(2):
+        assert client.request('statuses/show/:' + str(tweet['id']), {'include_entities': str(i)}).status_code == 200 # different params, so nothing is coalesced
+    assert client.remaining('statuses/show/:id') == 0
+    with pytest.raises(core.TwitterError) as excinfo:
+        client.request('statuses/show/:' + str(tweet['id']), {'trim_user': 'true'})
+    assert excinfo.value.code == 88
+    assert len(server.requests_to('statuses/show/:id')) == 2 # the third request wasn't sent
+    assert client.request('statuses/lookup', {'id': str(tweet['id'])}).status_code == 200 # other endpoints are unaffected
+
+def test_identical_requests_are_coalesced(client, server):
+    tweet = server.add_tweet('hello')
+    first = client.request('statuses/lookup', {'id': str(tweet['id'])})
+    second = client.request('statuses/lookup', {'id': str(tweet['id'])})
+    assert first is second
+    assert len(server.requests_to('statuses/lookup')) == 1
+    assert client.status()['coalesced'] == 1
+
+def test_deferred_requests_are_sent(client, server):
+    future = client.defer('friendships/create', {'screen_name': 'someone'})
+    assert future.result(5).status_code == 200
+    assert server.following == {'someone'}
+
+def test_posts_are_never_coalesced(client, server):
+    tweet = server.add_tweet('hello')
+    client.request('friendships/create', {'screen_name': 'someone'})
+    client.request('friendships/create', {'screen_name': 'someone'})
+    client.request('statuses/retweet/:' + str(tweet['id']))
+    client.request('statuses/retweet/:' + str(tweet['id']))
+    assert len(server.requests_to('friendships/create')) == 2
+    assert len(server.requests_to('statuses/retweet/:id')) == 2
+
+def test_error_responses_are_not_reused(client, server):
+    tweet = server.add_tweet('hello')
+    server.fail('statuses/lookup', 503)
+    assert client.request('statuses/lookup', {'id': str(tweet['id'])}).status_code == 503
+    assert client.request('statuses/lookup', {'id': str(tweet['id'])}).status_code == 200
+
+def test_concurrent_requests_dont_overdraw_the_budget(client, server):
+    import concurrent.futures
+    server.set_limit('statuses/show/:id', 5)
+    tweet = server.add_tweet('hello')
+    client.request('statuses/show/:' + str(tweet['id'])) # learn the budget
+    
+    def show(i):
+        try:
+            return client.request('statuses/show/:' + str(tweet['id']), {'include_entities': str(i)}).status_code
+        except core.TwitterError as e:
+            return e.code
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(show, range(8)))
+    assert sorted(results) == [88, 88, 88, 88, 200, 200, 200, 200]
+    assert len(server.requests_to('statuses/show/:id')) == 5
+
+def test_deferred_requests_survive_restarts(config, server, tmp_path):
+    path = str(tmp_path / 'deferred.json')
+    client = twitterclient.Client(fake_twitter.FakeTwitterAPI(server), path=path)
+    client.stop() # nothing is sent while stopped
+    client.defer('friendships/create', {'screen_name': 'someone'})
+    client = twitterclient.Client(fake_twitter.FakeTwitterAPI(server), path=path)
+    try:
+        client.deferred[0][2].result(5)
+        assert server.following == {'someone'}
+        assert client.load() == []
+    finally:
+        client.stop()
+
+def test_set_twitter_reports_failures(config, server, monkeypatch):
+    client = twitterclient.Client(fake_twitter.FakeTwitterAPI(server))
+    monkeypatch.setattr(core, 'twitter', client)
+    server.fail('friendships/create', 403, code=161, message='You are unable to follow more people at this time.')
+    
+    class Person:
+        twitter = None
+    
+    errors = []
+    try:
+        core.set_twitter(Person(), 'someone', on_error=errors.append)
+        for i in range(50):
+            if len(errors):
+                break
+            threading.Event().wait(0.1)
+    finally:
+        client.stop()
+    assert errors == ['Could not follow @someone [status 403]']
@@ -0,0 +1,37 @@
+import time
+from wurstminebot import core
+from wurstminebot import web
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers={}):
+        self.status_code = status_code
+        self.headers = headers
+    
+    def close(self):
+        pass
+
+def test_unparseable_pages_are_cached_briefly(config, monkeypatch):
+    monkeypatch.setitem(core.state, 'http_cache', None)
+    requests = []
+    
+    def get(url, **kwargs):
+        requests.append(url)
+        return FakeResponse()
+    
+    monkeypatch.setattr(web, 'get', get)
+    assert web.get_cached('http://example.com/good', lambda response: 'title') == (200, 'title')
+    assert web.get_cached('http://example.com/bad', lambda response: None) == (200, None)
+    entries = web.response_cache()
+    assert entries.get('http://example.com/good')['fresh'] > time.time() + 3000
+    assert entries.get('http://example.com/bad')['fresh'] < time.time() + 61
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 120)
+    assert web.get_cached('http://example.com/good', lambda response: 'title') == (200, 'title')
+    assert web.get_cached('http://example.com/bad', lambda response: 'fixed') == (200, 'fixed')
+    assert requests == ['http://example.com/good', 'http://example.com/bad', 'http://example.com/bad']
+
+def test_failed_requests_are_not_cached(config, monkeypatch):
+    monkeypatch.setitem(core.state, 'http_cache', None)
+    monkeypatch.setattr(web, 'get', lambda url, **kwargs: FakeResponse(status_code=503))
+    assert web.get_cached('http://example.com/down', lambda response: 'title') == (503, None)
+    assert web.response_cache().get('http://example.com/down') is None
@@ -0,0 +1,135 @@
+import collections
+import json
+import os
+import os.path
+import threading
+import time
+
+class TTLCache:
+    """A thread-safe mapping whose entries expire after a fixed time, holding at most max_size entries.
+    
+    When the cache is full, the least recently used entry is evicted. Lookups that found nothing can be cached as well (negative caching) by storing None. If a path is given, the cache is loaded from that JSON file on creation and written back after each change, so keys must be strings and values must be JSON-serializable.
+    """
+    
+    def __init__(self, max_size=1024, ttl=600, negative_ttl=None, path=None):
+        """Optional arguments:
+        max_size -- The maximum number of entries.
+        ttl -- The time in seconds after which an entry expires.
+        negative_ttl -- The time in seconds after which a cached None expires. Defaults to ttl.
+        path -- A JSON file used to persist the cache across restarts.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.path = path
+        self.entries = collections.OrderedDict() # key → (expiry time, value), least recently used first
+        self.fetches = {} # key → event set when the fetch in progress for that key has finished
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        if path is not None:
+            self.load()
+    
+    def _get(self, key):
+        """Returns the entry for key, or None if there is none or it has expired. Must be called with the lock held."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+    
+    def _set(self, key, value, ttl=None):
+        """Stores an entry without saving. Must be called with the lock held."""
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        self.entries[key] = time.time() + ttl, value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    def __contains__(self, key):
+        with self.lock:
+            return self._get(key) is not None
+    
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+    
+    def get(self, key, default=None):
+        """Returns the cached value for key, or default if there is none. A cached None (negative result) is returned as None."""
+        with self.lock:
+            entry = self._get(key)
+        return default if entry is None else entry[1]
+    
+    def get_or_fetch(self, key, fetch):
+        """Returns the cached value for key, calling fetch() to get and cache it if necessary.
+        
+        If fetch returns None, that result is cached for negative_ttl seconds. If fetch raises, nothing is cached and the exception propagates. When several threads ask for the same missing key at the same time, only one of them calls fetch and the others wait for its result.
+        """
+        while True:
+            with self.lock:
+                entry = self._get(key)
+                if entry is not None:
+                    return entry[1]
+                event = self.fetches.get(key)
+                if event is None:
+                    event = self.fetches[key] = threading.Event()
+                    break
+            event.wait() # another thread is fetching this key, use its result (or try again if it failed)
+        try:
+            value = fetch()
+            with self.lock:
+                self._set(key, value)
+            self.save()
+            return value
+        finally:
+            with self.lock:
+                del self.fetches[key]
+            event.set()
+    
+    def load(self):
+        """Replaces the contents of the cache with the unexpired entries from the JSON file at path. Does nothing if the file doesn't exist or can't be read."""
+        try:
+            with open(self.path) as cache_file:
+                entries = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return
+        now = time.time()
+        with self.lock:
+            self.entries.clear()
+            for key, (expires, value) in sorted(entries.items(), key=lambda item: item[1][0]):
+                if expires > now:
+                    self.entries[key] = expires, value
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        if entry is None:
+            return default
+        self.save()
+        return entry[1]
+    
+    def save(self):
+        """Writes the cache to the JSON file at path, if any. Errors are ignored, since the cache can always be rebuilt."""
+        if self.path is None:
+            return
+        with self.save_lock:
+            with self.lock:
+                entries = {key: list(entry) for key, entry in self.entries.items()}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path + '.tmp', 'w') as cache_file:
+                    json.dump(entries, cache_file, sort_keys=True, indent=4, separators=(',', ': '))
+                os.replace(self.path + '.tmp', self.path)
+            except (IOError, OSError):
+                pass
+    
+    def set(self, key, value, ttl=None):
+        """Stores value for key. ttl defaults to the cache's ttl, or negative_ttl if value is None."""
+        with self.lock:
+            self._set(key, value, ttl=ttl)
+        self.save()
@@ -1,22 +1,25 @@
 import sys
 
+import collections
 from wurstminebot import core
 from datetime import datetime
 import functools
 import inspect
 import json
+from wurstminebot import logins
 import minecraft
 from wurstminebot import nicksub
 import os.path
 import random
 import re
-import requests
 import socket
 import subprocess
 import threading
+import time
 from datetime import timedelta
 from datetime import timezone
-import traceback
+from wurstminebot import tweets
+from wurstminebot import web
 
 def handle_exceptions(f):
     @functools.wraps(f)
@@ -29,20 +32,17 @@ def handle_exceptions(f):
             core.debug_print(json.dumps(e.errors, sort_keys=True, indent=4))
         except Exception as e:
             self.warning('{}: {}'.format(e.__class__.__name__, e))
-            core.debug_print('Exception in {} command from {} to {}:'.format(self.name, self.sender, self.channel or self.context))
-            if core.config('debug', False):
-                traceback.print_exc(file=sys.stdout)
+            core.debug_print('Exception in {} command from {} to {}:'.format(self.name, self.sender, self.channel or self.context), exc_info=True)
     
     return ret
 
-class BaseCommand(threading.Thread):
+class BaseCommand:
     """base class for other commands, not a real command"""
     
     exits = False
     usage = None
     
     def __init__(self, args, sender, context, channel=None, addressing=None):
-        super().__init__(name='wurstminebot command ' + self.__class__.__name__)
         self.addressing = addressing
         self.arguments = [str(arg) for arg in args]
         if isinstance(sender, str):
@@ -73,12 +73,12 @@ class BaseCommand(threading.Thread):
                     'color': 'gold'
                 }
             if self.sender.minecraft is None:
-                minecraft.tellraw([{
+                core.tellraw([{
                     'text': self.sender.display_name() + ': ',
                     'color': 'gold'
                 }] + ([tellraw_reply] if isinstance(tellraw_reply, dict) else tellraw_reply), (self.sender.minecraft if self.addressing is None else self.addressing.minecraft))
             else:
-                minecraft.tellraw(tellraw_reply, self.sender.minecraft)
+                core.tellraw(tellraw_reply, self.sender.minecraft)
         elif self.channel is None:
             if self.addressing is None:
                 for line in irc_reply.splitlines():
@@ -175,7 +175,7 @@ class AliasCommand(BaseCommand):
                     ]
                 if isinstance(tellraw_text, dict):
                     tellraw_text = [tellraw_text]
-                minecraft.tellraw([
+                core.tellraw([
                     {
                         'clickEvent': {
                             'action': 'suggest_command',
@@ -218,7 +218,7 @@ class AliasCommand(BaseCommand):
                     ]
                 if isinstance(tellraw_text, dict):
                     tellraw_text = [tellraw_text]
-                minecraft.tellraw([
+                core.tellraw([
                     {
                         'color': 'gold',
                         'text': '<'
@@ -326,7 +326,7 @@ class Alias(BaseCommand):
     
     @handle_exceptions
     def run(self):
-        aliases = core.config('aliases')
+        aliases = dict(core.config('aliases'))
         alias = self.arguments[0].lower()
         if len(self.arguments) == 1:
             if alias in aliases:
@@ -400,9 +400,7 @@ class Cloud(BaseCommand):
             try:
                 int(self.arguments[1])
             except ValueError:
-                core.debug_print('Exception in Cloud command <damage> argument parsing:')
-                if core.config('debug', False) or core.state.get('is_daemon', False):
-                    traceback.print_exc(file=sys.stdout)
+                core.debug_print('Exception in Cloud command <damage> argument parsing:', exc_info=True)
                 return '<damage> must be a number'
         return True
     
@@ -466,7 +464,7 @@ class Command(BaseCommand):
     
     @handle_exceptions
     def run(self):
-        for line in minecraft.command(self.arguments[0], self.arguments[1:]).splitlines():
+        for line in core.command(self.arguments[0], self.arguments[1:]).splitlines():
             self.reply(line)
 
 class DeathGames(BaseCommand):
@@ -681,7 +679,7 @@ class Invite(BaseCommand):
         return True
     
     def permission_level(self):
-        response = requests.get('https://s3.amazonaws.com/MinecraftSkins/' + self.arguments[1] + '.png')
+        response = web.get('https://s3.amazonaws.com/MinecraftSkins/' + self.arguments[1] + '.png')
         if response.status_code != 200:
             return 4
         return 3
@@ -695,7 +693,7 @@ class Invite(BaseCommand):
         minecraft.whitelist_add(self.arguments[0].lower(), minecraft_nick=self.arguments[1], people_file=core.config('paths').get('people'), person_status='invited', invited_by=self.sender)
         self.reply('A new person with id ' + self.arguments[0].lower() + ' is now invited. The !Whitelist command must be run by a bot op.')
         if screen_name is not None:
-            core.set_twitter(nicksub.Person(self.arguments[0]), screen_name)
+            core.set_twitter(nicksub.Person(self.arguments[0]), screen_name, on_error=self.warning)
             self.reply('@' + core.config('twitter')['screen_name'] + ' is now following @' + screen_name)
 
 class Join(BaseCommand):
@@ -755,7 +753,7 @@ class LastSeen(BaseCommand):
                 person = nicksub.Person(player, context=self.context)
             except nicksub.PersonNotFoundError:
                 person = nicksub.Person(player, context='minecraft')
-        if person.minecraft in minecraft.online_players():
+        if person.minecraft in core.online_players():
             self.reply(player + ' is currently on the server.', [
                 {
                     'text': player,
@@ -775,71 +773,71 @@ class LastSeen(BaseCommand):
                 }
             ])
         else:
-            with core.state['log_lock']:
-                lastseen = None
-                if 'logs' in core.config('paths') and os.path.exists(os.path.join(core.config('paths')['logs'], 'logins.log')):
-                    lastseen = minecraft.last_seen(person, logins_log=os.path.join(core.config('paths')['logs'], 'logins.log'))
-                if lastseen is None:
-                    self.reply('let me check the logs…', 'checking the logs...')
+            lastseen = None
+            if logins.logins_index() is not None:
+                lastseen = logins.logins_index().last_seen(person.id)
+            if lastseen is None:
+                self.reply('let me check the logs…', 'checking the logs...')
+                with core.state['log_lock']:
                     lastseen = minecraft.last_seen(person.minecraft)
-                if lastseen is None:
-                    self.reply('I have not seen ' + player + ' on the server yet.')
-                else:
-                    lastseen = lastseen.astimezone(timezone.utc)
-                    if lastseen.date() == datetime.utcnow().date():
-                        datestr = 'today at ' + lastseen.strftime('%H:%M UTC')
-                        tellraw_date = [
-                            {
-                                'text': 'today',
-                                'hoverEvent': {
-                                    'action': 'show_text',
-                                    'value': lastseen.strftime('%Y-%m-%d')
-                                },
-                                'color': 'gold'
-                            },
-                            {
-                                'text': ' at ' + lastseen.strftime('%H:%M UTC.'),
-                                'color': 'gold'
-                            }
-                        ]
-                    elif lastseen.date() == datetime.utcnow().date() - timedelta(days=1):
-                        datestr = 'yesterday at ' + lastseen.strftime('%H:%M UTC')
-                        tellraw_date = [
-                            {
-                                'text': 'yesterday',
-                                'hoverEvent': {
-                                    'action': 'show_text',
-                                    'value': lastseen.strftime('%Y-%m-%d')
-                                },
-                                'color': 'gold'
+            if lastseen is None:
+                self.reply('I have not seen ' + player + ' on the server yet.')
+            else:
+                lastseen = lastseen.astimezone(timezone.utc)
+                if lastseen.date() == datetime.utcnow().date():
+                    datestr = 'today at ' + lastseen.strftime('%H:%M UTC')
+                    tellraw_date = [
+                        {
+                            'text': 'today',
+                            'hoverEvent': {
+                                'action': 'show_text',
+                                'value': lastseen.strftime('%Y-%m-%d')
                             },
-                            {
-                                'text': ' at ' + lastseen.strftime('%H:%M UTC.'),
-                                'color': 'gold'
-                            }
-                        ]
-                    else:
-                        datestr = lastseen.strftime('on %Y-%m-%d at %H:%M UTC')
-                        tellraw_date = [
-                            {
-                                'text': datestr + '.',
-                                'color': 'gold'
-                            }
-                        ]
-                    self.reply(player + ' was last seen ' + datestr + '.', [
+                            'color': 'gold'
+                        },
                         {
-                            'text': player,
+                            'text': ' at ' + lastseen.strftime('%H:%M UTC.'),
+                            'color': 'gold'
+                        }
+                    ]
+                elif lastseen.date() == datetime.utcnow().date() - timedelta(days=1):
+                    datestr = 'yesterday at ' + lastseen.strftime('%H:%M UTC')
+                    tellraw_date = [
+                        {
+                            'text': 'yesterday',
                             'hoverEvent': {
                                 'action': 'show_text',
-                                'value': person.minecraft + ' in Minecraft'
+                                'value': lastseen.strftime('%Y-%m-%d')
                             },
-                            'color': 'gold',
+                            'color': 'gold'
                         },
                         {
-                            'text': ' was last seen ',
+                            'text': ' at ' + lastseen.strftime('%H:%M UTC.'),
                             'color': 'gold'
                         }
-                    ] + tellraw_date)
+                    ]
+                else:
+                    datestr = lastseen.strftime('on %Y-%m-%d at %H:%M UTC')
+                    tellraw_date = [
+                        {
+                            'text': datestr + '.',
+                            'color': 'gold'
+                        }
+                    ]
+                self.reply(player + ' was last seen ' + datestr + '.', [
+                    {
+                        'text': player,
+                        'hoverEvent': {
+                            'action': 'show_text',
+                            'value': person.minecraft + ' in Minecraft'
+                        },
+                        'color': 'gold',
+                    },
+                    {
+                        'text': ' was last seen ',
+                        'color': 'gold'
+                    }
+                ] + tellraw_date)
 
 class Leak(BaseCommand):
     """tweet the last line_count (defaults to 1) chatlog lines"""
@@ -894,7 +892,7 @@ class Leak(BaseCommand):
             self.warning('Twitter is not configured.')
         else:
             tweet_url = 'https://twitter.com/' + core.config('twitter').get('screen_name', 'wurstmineberg') + '/status/' + str(twid)
-            minecraft.tellraw({
+            core.tellraw({
                 'text': 'leaked',
                 'clickEvent': {
                     'action': 'open_url',
@@ -1010,7 +1008,8 @@ class PasteMojira(BaseCommand):
         else:
             self.reply('http://mojang.atlassian.net/browse/MC')
             return
-        self.reply(core.paste_mojira(project_key, issue_id, link=link), core.paste_mojira(project_key, issue_id, link=link, tellraw=True))
+        ticket = core.fetch_mojira(project_key, issue_id)
+        self.reply(core.format_mojira(ticket, link=link), core.format_mojira(ticket, link=link, tellraw=True))
 
 class PasteTweet(BaseCommand):
     """print the contents of a tweet"""
@@ -1037,7 +1036,8 @@ class PasteTweet(BaseCommand):
         match = re.match('https?://twitter\\.com/[0-9A-Z_a-z]+/status/([0-9]+)', self.arguments[0])
         twid = int(match.group(1) if match else self.arguments[0])
         try:
-            self.reply(core.paste_tweet(twid, link=link), core.paste_tweet(twid, link=link, tellraw=True))
+            tweet = core.fetch_tweet(twid)
+            self.reply(core.format_tweet(tweet, link=link), core.format_tweet(tweet, link=link, tellraw=True))
         except core.TwitterError as e:
             self.warning('Error ' + str(e.status_code) + ': ' + str(e))
         except AttributeError:
@@ -1187,7 +1187,7 @@ class People(BaseCommand):
                             self.reply('no twitter nick')
                     else:
                         screen_name = self.arguments[2][1:] if self.arguments[2].startswith('@') else self.arguments[2]
-                        core.set_twitter(person, screen_name)
+                        core.set_twitter(person, screen_name, on_error=self.warning)
                         self.reply('@' + core.config('twitter')['screen_name'] + ' is now following @' + screen_name)
                 elif self.arguments[1].lower() == 'website':
                     if len(self.arguments) == 2:
@@ -1244,15 +1244,13 @@ class Quit(ExitingCommand):
     def run(self):
         quitMsg = ' '.join(self.arguments) if len(self.arguments) else None
         try:
-            minecraft.tellraw({
+            core.tellraw({
                 'text': ('Shutting down the bot: ' + quitMsg) if quitMsg else 'Shutting down the bot...',
                 'color': 'red'
             })
         except socket.error:
             self.warning('{} while announcing shutdown in-game: {}'.format(e.__class__.__name__, e))
-            core.debug_print('Exception in {} command from {} to {}:'.format(self.name, self.sender, self.channel or self.context))
-            if core.config('debug', False):
-                traceback.print_exc(file=sys.stdout)
+            core.debug_print('Exception in {} command from {} to {}:'.format(self.name, self.sender, self.channel or self.context), exc_info=True)
         irc_config = core.config('irc')
         if 'main_channel' in irc_config:
             core.state['bot'].say(irc_config['main_channel'], ('bye, ' + quitMsg) if quitMsg else random.choice(irc_config.get('quit_messages', ['bye'])))
@@ -1295,7 +1293,7 @@ class Restart(BaseCommand):
     def run(self):
         if len(self.arguments) == 0 or (len(self.arguments) == 1 and self.arguments[0].lower() == 'bot'):
             # restart the bot
-            minecraft.tellraw({
+            core.tellraw({
                 'text': 'Restarting the bot...',
                 'color': 'red'
             })
@@ -1362,10 +1360,12 @@ class Retweet(BaseCommand):
             if isinstance(first_error, str):
                 first_error = {'message': first_error}
             raise core.TwitterError(first_error.get('code', 0), message=first_error.get('message'), status_code=r.status_code, errors=j.get('errors', []))
+        tweets.tweet_cache().add(j) # the response is the retweet, so pasting it doesn't need another request
         url = 'https://twitter.com/' + core.config('twitter')['screen_name'] + '/status/' + str(twid)
         if paste:
+            tweet = core.fetch_tweet(twid)
             if self.context == 'minecraft':
-                minecraft.tellraw({
+                core.tellraw({
                     'text': '',
                     'extra': [
                         {
@@ -1379,12 +1379,12 @@ class Retweet(BaseCommand):
                     ]
                 })
             else:
-                minecraft.tellraw(core.paste_tweet(twid, tellraw=True, link=True))
+                core.tellraw(core.format_tweet(tweet, tellraw=True, link=True))
             if self.channel is not None:
                 core.state['bot'].say(self.channel, url)
             irc_config = core.config('irc')
             if 'main_channel' in irc_config and self.channel != irc_config['main_channel']:
-                for line in core.paste_tweet(twid, link=True).splitlines():
+                for line in core.format_tweet(tweet, link=True).splitlines():
                     core.state['bot'].say(irc_config['main_channel'], line)
         else:
             self.reply(url)
@@ -1399,10 +1399,9 @@ class Status(BaseCommand):
     
     @handle_exceptions
     def run(self):
-        import requests
         if minecraft.status():
             if self.context != 'minecraft':
-                players = nicksub.sorted_people(nicksub.person_or_dummy(minecraft_nick, context='minecraft') for minecraft_nick in minecraft.online_players())
+                players = nicksub.sorted_people(nicksub.person_or_dummy(minecraft_nick, context='minecraft') for minecraft_nick in core.online_players())
                 if len(players):
                     self.reply('Online players: ' + ', '.join(person.nick(self.context) for person in players))
                 else:
@@ -1428,7 +1427,7 @@ class Status(BaseCommand):
                 ])
         else:
             self.reply('The server is currently offline.')
-        response = requests.get('http://status.mojang.com/check')
+        response = web.get('http://status.mojang.com/check')
         for item in response.json():
             for key, value in item.items():
                 if value != 'green':
@@ -1546,8 +1545,9 @@ class Tweet(BaseCommand):
             self.warning('Twitter is not configured.')
             return
         url = 'https://twitter.com/' + core.config('twitter')['screen_name'] + '/status/' + str(twid)
+        tweet = core.fetch_tweet(twid)
         if self.context == 'minecraft':
-            minecraft.tellraw({
+            core.tellraw({
                 'text': '',
                 'extra': [
                     {
@@ -1561,12 +1561,12 @@ class Tweet(BaseCommand):
                 ]
             })
         else:
-            minecraft.tellraw(core.paste_tweet(twid, tellraw=True, link=True))
+            core.tellraw(core.format_tweet(tweet, tellraw=True, link=True))
         if self.channel is not None:
             core.state['bot'].say(self.channel, url)
         irc_config = core.config('irc')
         if 'main_channel' in irc_config and self.channel != irc_config['main_channel']:
-            for line in core.paste_tweet(twid, link=True).splitlines():
+            for line in core.format_tweet(tweet, link=True).splitlines():
                 core.state['bot'].say(irc_config['main_channel'], line)
 
 class UltraSoftcore(BaseCommand):
@@ -1656,7 +1656,7 @@ class UltraSoftcore(BaseCommand):
             if self.sender.minecraft is None:
                 self.warning('could not op you. You will need in-game op for the preparations.')
             else:
-                minecraft.command('op', self.sender.minecraft)
+                core.command('op', [self.sender.minecraft])
             #TODO if a datetime is specified, announce on twitter
             core.update_topic(special_status='The server is down for USC preparations.')
             minecraft.stop(reply=self.reply, log_path=os.path.join(core.config('paths')['logs'], 'logins.log'))
@@ -1840,7 +1840,7 @@ class Whitelist(BaseCommand):
         else:
             self.reply(minecraft_nick + ' is now whitelisted')
             if screen_name is not None:
-                core.set_twitter(nicksub.Person(self.arguments[0]), screen_name)
+                core.set_twitter(nicksub.Person(self.arguments[0]), screen_name, on_error=self.warning)
                 self.reply('@' + core.config('twitter')['screen_name'] + ' is now following @' + screen_name)
 
 def parse(command, sender, context, channel=None):
@@ -1866,6 +1866,116 @@ def parse(command, sender, context, channel=None):
     else:
         raise ValueError('No such command')
 
+class CommandPool:
+    """Runs commands on a fixed number of worker threads.
+    
+    Queued commands are kept in one queue per sender, and the workers take turns between senders, so someone spamming commands only delays their own. When the queue is full, submit refuses the command.
+    """
+    
+    def __init__(self, workers=4, queue_size=32, queue_size_per_sender=4):
+        self.condition = threading.Condition()
+        self.queue_size = queue_size
+        self.queue_size_per_sender = queue_size_per_sender
+        self.queues = collections.OrderedDict() # sender key → deque of (command, submit time)
+        self.queued = 0
+        self.running = 0
+        self.stats = {}
+        self.stopped = False
+        self.threads = [threading.Thread(target=self.work, name='wurstminebot command worker ' + str(i), daemon=True) for i in range(workers)]
+    
+    @staticmethod
+    def sender_key(command):
+        if isinstance(command.sender, nicksub.Person):
+            return command.sender.id
+        return command.context, command.sender.display_name()
+    
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+    
+    def stop(self):
+        """Stops the workers after their current command and discards queued commands. Doesn't block, since it may be called from a command."""
+        with self.condition:
+            self.stopped = True
+            for queue in self.queues.values():
+                for command, submit_time in queue:
+                    if isinstance(command, ExitingCommand):
+                        command.exits = False # unblock callers waiting for the result
+            self.queues.clear()
+            self.queued = 0
+            self.condition.notify_all()
+    
+    def status(self):
+        """Returns a dict with the current queue depth, the number of running commands, and per-command counts and latencies in seconds."""
+        with self.condition:
+            return {
+                'commands': {name: dict(command_stats) for name, command_stats in self.stats.items()},
+                'queued': self.queued,
+                'running': self.running,
+                'workers': len(self.threads)
+            }
+    
+    def submit(self, command):
+        """Queues the command. Returns False if the queue or the sender's queue is full."""
+        key = self.sender_key(command)
+        with self.condition:
+            if self.stopped or self.queued >= self.queue_size or len(self.queues.get(key, ())) >= self.queue_size_per_sender:
+                return False
+            self.queues.setdefault(key, collections.deque()).append((command, time.monotonic()))
+            self.queued += 1
+            self.condition.notify()
+        return True
+    
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.stopped and not self.queued:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                key, queue = self.queues.popitem(last=False)
+                command, submit_time = queue.popleft()
+                if len(queue):
+                    self.queues[key] = queue # back of the line
+                self.queued -= 1
+                self.running += 1
+            start_time = time.monotonic()
+            try:
+                command.run()
+            except Exception:
+                core.debug_print('Exception in command ' + command.name + ':', exc_info=True)
+                if isinstance(command, ExitingCommand) and not command.exit_event.is_set():
+                    command.exits = False # unblock callers waiting for the result
+            finally:
+                end_time = time.monotonic()
+                with self.condition:
+                    self.running -= 1
+                    command_stats = self.stats.setdefault(command.name, {
+                        'count': 0,
+                        'maxRunTime': 0.0,
+                        'maxWaitTime': 0.0,
+                        'totalRunTime': 0.0,
+                        'totalWaitTime': 0.0
+                    })
+                    command_stats['count'] += 1
+                    command_stats['maxRunTime'] = max(command_stats['maxRunTime'], end_time - start_time)
+                    command_stats['maxWaitTime'] = max(command_stats['maxWaitTime'], start_time - submit_time)
+                    command_stats['totalRunTime'] += end_time - start_time
+                    command_stats['totalWaitTime'] += start_time - submit_time
+                    queued = self.queued
+                core.debug_print('[command] {} finished in {:.3f}s after waiting {:.3f}s ({} queued)'.format(command.name, end_time - start_time, start_time - submit_time, queued))
+
+_pool_lock = threading.Lock()
+
+def pool():
+    """Returns the command pool, creating and starting it if necessary."""
+    with _pool_lock:
+        if core.state.get('command_pool') is None:
+            pool_config = core.config('commands')
+            core.state['command_pool'] = CommandPool(workers=pool_config.get('workers', 4), queue_size=pool_config.get('queueSize', 32), queue_size_per_sender=pool_config.get('queueSizePerSender', 4))
+            core.state['command_pool'].start()
+        return core.state['command_pool']
+
 def run(command_name, sender, context, channel=None, wait=False, return_exits=False):
     """Runs a command.
     
@@ -1910,8 +2020,9 @@ def run(command_name, sender, context, channel=None, wait=False, return_exits=Fa
         return False
     if wait:
         command.run()
-    else:
-        command.start()
+    elif not pool().submit(command):
+        command.warning(core.ErrorMessage.busy)
+        return False
     if return_exits and command.exits:
         return True
     return False
@@ -2,23 +2,26 @@ import sys
 
 sys.path.append('/opt/py')
 
+import copy
 from datetime import datetime
 import json
+from wurstminebot import logger
 import minecraft
 from wurstminebot import nicksub
 import os
 import os.path
 import re
-import requests
+import shutil
 import subprocess
 import threading
 import time
 from datetime import timezone
-import traceback
 import tzlocal
+from wurstminebot import web
 import xml.sax.saxutils
 
 class ErrorMessage:
+    busy = "I'm busy right now, please try again in a moment"
     log = "I can't find that in my chatlog"
     
     @staticmethod
@@ -45,6 +48,67 @@ class ErrorMessage:
         else:
             return "you don't have permission to do this"
 
+class TopicUpdater:
+    """Applies IRC topic updates on a single worker thread.
+    
+    Update requests are coalesced: the first one after a quiet period is applied right away, later ones at most once every interval seconds, always from the latest state. If the online players can't be fetched, a single retry is scheduled instead of one timer per failure.
+    """
+    
+    def __init__(self, interval=10, retry_interval=60):
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.condition = threading.Condition()
+        self.force = False
+        self.last_update = None
+        self.pending = False
+        self.retry_at = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self.work, name='wurstminebot topic updater', daemon=True)
+        self.thread.start()
+    
+    def request(self, force=False):
+        with self.condition:
+            self.pending = True
+            self.force = self.force or force
+            self.condition.notify()
+    
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+    
+    def work(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.stopped:
+                        return
+                    if self.pending:
+                        due = 0 if self.last_update is None else self.last_update + self.interval
+                    elif self.retry_at is not None:
+                        due = self.retry_at
+                    else:
+                        self.condition.wait()
+                        continue
+                    now = time.monotonic()
+                    if now >= due:
+                        break
+                    self.condition.wait(due - now)
+                force = self.force
+                self.force = False
+                self.pending = False
+                self.retry_at = None
+                self.last_update = time.monotonic()
+            try:
+                success = _update_topic(force)
+            except Exception:
+                debug_print('Exception while updating the topic:', exc_info=True)
+                success = True
+            if not success:
+                with self.condition:
+                    if not self.pending:
+                        self.retry_at = time.monotonic() + self.retry_interval
+
 class TwitterError(Exception):
     def __init__(self, code, message=None, status_code=0, errors=None):
         self.code = code
@@ -56,89 +120,179 @@ class TwitterError(Exception):
         return str(self.code) if self.message is None else str(self.message)
 
 def cleanup(*args, **kwargs):
-    for thread in 'input_loop', 'time_loop', 'twitter_stream', 'bot':
+    for thread in 'input_loop', 'time_loop', 'twitter_stream', 'mention_stream', 'command_pool', 'topic_updater', 'bot', 'outbox', 'rcon', 'http', 'runtime', 'logger':
         if state.get(thread) is not None:
             state[thread].stop()
         state[thread] = None
 
-def config(key=None, default_value=None):
-    default_config = {
-        'aliases': {
-            'dg': {
-                'command_name': 'DeathGames',
-                'type': 'command'
-            },
-            'mwiki': {
-                'command_name': 'MinecraftWiki',
-                'type': 'command'
-            },
-            'opt': {
-                'command_name': 'Option',
-                'type': 'command'
-            },
-            'ping': {
-                'text': 'pong',
-                'type': 'reply'
-            },
-            'usc': {
-                'command_name': 'UltraSoftcore',
-                'type': 'command'
-            }
-        },
-        'commentLines': {
-            'death': ['Well done.'],
-            'serverJoin': []
-        },
-        'dailyRestart': True,
-        'death_games': {
-            'logfile': '/opt/wurstmineberg/config/deathgames.json',
-            'enabled': False
+def command(cmd, args=[]):
+    """Runs a Minecraft server command and returns its output, using the rcon transport if rcon is configured."""
+    from wurstminebot import rcon
+    transport = rcon.transport()
+    if transport is None:
+        return minecraft.command(cmd, args)
+    return transport.command(cmd, args, block=True)
+
+DEFAULT_CONFIG = {
+    'aliases': {
+        'dg': {
+            'command_name': 'DeathGames',
+            'type': 'command'
         },
-        'debug': False,
-        'irc': {
-            'channels': [],
-            'dev_channel': None,
-            'ignore': [],
-            'live_channel': None,
-            'live_topic': None,
-            'main_channel': '#wurstmineberg',
-            'nick': 'wurstminebot',
-            'password': '',
-            'player_list': 'announce',
-            'port': 6667,
-            'quit_messages': ['brb'],
-            'ssl': False,
-            'topic': None
+        'mwiki': {
+            'command_name': 'MinecraftWiki',
+            'type': 'command'
         },
-        'ops': [],
-        'paths': {
-            'assets': '/var/www/wurstmineberg.de/assets/serverstatus',
-            'deathgames': '/opt/wurstmineberg/log/deathgames.json',
-            'keepalive': '/var/local/wurstmineberg/wurstminebot_keepalive',
-            'json': '/opt/git/github.com/wurstmineberg/assets.wurstmineberg.de/master/json',
-            'logs': '/opt/wurstmineberg/log',
-            'minecraft_server': '/opt/wurstmineberg/server',
-            'people': '/opt/wurstmineberg/config/people.json',
-            'scripts': '/opt/wurstmineberg/bin'
+        'opt': {
+            'command_name': 'Option',
+            'type': 'command'
         },
-        'twitter': {
-            'screen_name': 'wurstmineberg'
+        'ping': {
+            'text': 'pong',
+            'type': 'reply'
         },
         'usc': {
-            'completedSeasons': 0,
-            'nextDate': None,
-            'nextPoll': None,
-            'state': None
+            'command_name': 'UltraSoftcore',
+            'type': 'command'
+        }
+    },
+    'commands': {
+        'queueSize': 32,
+        'queueSizePerSender': 4,
+        'workers': 4
+    },
+    'commentLines': {
+        'death': ['Well done.'],
+        'serverJoin': []
+    },
+    'dailyRestart': True,
+    'death_games': {
+        'logfile': '/opt/wurstmineberg/config/deathgames.json',
+        'enabled': False
+    },
+    'debug': False,
+    'http': {
+        'cacheRetention': 604800,
+        'cacheSize': 512,
+        'cacheTTL': 3600,
+        'hostTimeouts': {},
+        'maxConnections': 8,
+        'negativeCacheTTL': 60,
+        'timeout': 10,
+        'workers': 4
+    },
+    'irc': {
+        'channels': [],
+        'client': 'ircbotframe',
+        'dev_channel': None,
+        'ignore': [],
+        'live_channel': None,
+        'live_topic': None,
+        'main_channel': '#wurstmineberg',
+        'nick': 'wurstminebot',
+        'password': '',
+        'player_list': 'announce',
+        'port': 6667,
+        'quit_messages': ['brb'],
+        'send_burst': 5,
+        'send_merge': True,
+        'send_rate': 1.0,
+        'ssl': False,
+        'sync_burst': 3,
+        'sync_window': 1.0,
+        'topic': None,
+        'topic_interval': 10
+    },
+    'logWatcher': {
+        'backend': 'auto',
+        'interval': 0.5
+    },
+    'logging': {
+        'queueSize': 10000,
+        'rateLimits': {
+            'logpipe': 50
         }
+    },
+    'ops': [],
+    'paths': {
+        'assets': '/var/www/wurstmineberg.de/assets/serverstatus',
+        'cache': '/var/local/wurstmineberg/wurstminebot_cache',
+        'deathgames': '/opt/wurstmineberg/log/deathgames.json',
+        'keepalive': '/var/local/wurstmineberg/wurstminebot_keepalive',
+        'json': '/opt/git/github.com/wurstmineberg/assets.wurstmineberg.de/master/json',
+        'logs': '/opt/wurstmineberg/log',
+        'minecraft_server': '/opt/wurstmineberg/server',
+        'outbox': '/var/local/wurstmineberg/wurstminebot_outbox.json',
+        'people': '/opt/wurstmineberg/config/people.json',
+        'scripts': '/opt/wurstmineberg/bin',
+        'twitter_deferred': '/var/local/wurstmineberg/wurstminebot_twitter_deferred.json'
+    },
+    'presence': {
+        'interval': 300
+    },
+    'rcon': {
+        'flushWindow': 0.05,
+        'host': 'localhost',
+        'password': None,
+        'port': 25575
+    },
+    'runtime': {
+        'mode': 'threads',
+        'workers': 8
+    },
+    'twitter': {
+        'batch_window': 0.1,
+        'coalesce_window': 5,
+        'outbox_max_attempts': 10,
+        'outbox_max_backoff': 900,
+        'reserve': 2,
+        'screen_name': 'wurstmineberg',
+        'tweet_cache_size': 256,
+        'tweet_cache_ttl': 600
+    },
+    'usc': {
+        'completedSeasons': 0,
+        'nextDate': None,
+        'nextPoll': None,
+        'state': None
     }
-    try:
-        with open(state['config_path']) as config_file:
-            j = json.load(config_file)
-    except:
-        j = default_config
+} # returned for missing keys and shared between callers, like the parsed config file, so it must not be modified
+
+def config(key=None, default_value=None):
+    j = load_config()
+    if j is None:
+        j = DEFAULT_CONFIG
     if key is None:
         return j
-    return j.get(key, default_config.get(key)) if default_value is None else j.get(key, default_value)
+    return j.get(key, DEFAULT_CONFIG.get(key)) if default_value is None else j.get(key, default_value)
+
+def load_config():
+    """Returns the parsed config file, or None if it can't be read.
+    
+    The file is only parsed again if its inode, modification time, or size has changed since it was last read, so the returned object is shared between callers and must not be modified. Use update_config or set_config to make changes.
+    """
+    cache = state['config_cache']
+    path = state['config_path']
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    stamp = path, stat.st_ino, stat.st_mtime_ns, stat.st_size
+    with cache['lock']:
+        if cache['stamp'] == stamp:
+            cache['hits'] += 1
+            return cache['value']
+        try:
+            with open(path) as config_file:
+                value = json.load(config_file)
+        except:
+            return None
+        cache['stamp'] = stamp
+        cache['value'] = value
+        cache['reloads'] += 1
+        reloads, hits = cache['reloads'], cache['hits']
+    debug_print('[config] loaded {} ({} reloads, {} cache hits)'.format(path, reloads, hits))
+    return value
 
 def death_games_log(attacker, target, success=True):
     with open(config('paths').get('deathgames', '/opt/wurstmineberg/log/deathgames.json')) as logfile:
@@ -151,7 +305,7 @@ def death_games_log(attacker, target, success=True):
     })
     with open(config('paths').get('deathgames', '/opt/wurstmineberg/log/deathgames.json'), 'w') as logfile:
         json.dump(log, logfile, sort_keys=True, indent=4, separators=(',', ': '))
-    minecraft.tellraw([
+    tellraw([
         {
             'text': '[Death Games]',
             'clickEvent': {
@@ -193,155 +347,91 @@ def death_games_log(attacker, target, success=True):
     if 'main_channel' in irc_config:
         state['bot'].say(irc_config['main_channel'], '[Death Games] ' + attacker.irc_nick() + "'s attempt on " + target.irc_nick() + (' succeeded.' if success else ' failed.'))
 
-def debug_print(msg):
-    if state.get('is_daemon', False) or config('debug', False):
-        if state.get('is_daemon', False):
-            sys.stdout = open('/opt/wurstmineberg/log/wurstminebot.log', 'a')
-        print('DEBUG] ' + datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S') + ' ' + msg)
-        sys.stdout.flush()
+def debug_print(msg, level='debug', exc_info=False):
+    """Logs a message using the background logger. If exc_info is true, the traceback of the exception being handled is included and the level defaults to error."""
+    if exc_info and level == 'debug':
+        level = 'error'
+    logger.logger().log(msg, level=level, exc_info=exc_info)
 
-def minecraft_wiki_lookup(article, reply=None):
-    if reply is None:
-        def reply(*args, **kwargs):
-            pass
+def fetch_mojira(project, issue_id):
+    """Returns a dict describing a Mojira ticket, to be rendered using format_mojira.
     
-    match = re.match('http://(?:minecraft\\.gamepedia\\.com|minecraftwiki\\.net(?:/wiki)?)/(.*)', article)
-    if match:
-        article = match.group(1)
-    request = requests.get('http://minecraft.gamepedia.com/' + article, params={'action': 'raw'})
-    if request.status_code == 200:
-        if request.text.lower().startswith('#redirect'):
-            match = re.match('#[Rr][Ee][Dd][Ii][Rr][Ee][Cc][Tt] \\[\\[(.+)(\\|.*)?\\]\\]', request.text)
-            if match:
-                redirect_target = 'http://minecraft.gamepedia.com/' + re.sub(' ', '_', match.group(1))
-                reply('Redirect ' + redirect_target, {
-                    'clickEvent': {
-                        'action': 'open_url',
-                        'value': redirect_target
-                    },
-                    'color': 'gold',
-                    'text': 'Redirect'
-                })
-                return 'Redirect ' + redirect_target
-            else:
-                reply('Broken redirect')
-                return 'Broken redirect'
-        else:
-            reply('Article http://minecraft.gamepedia.com/' + article, {
-                'clickEvent': {
-                    'action': 'open_url',
-                    'value': 'http://minecraft.gamepedia.com/' + article
-                },
-                'color': 'gold',
-                'text': 'Article'
-            })
-            return 'Article http://minecraft.gamepedia.com/' + article
-    else:
-        reply('Error ' + str(request.status_code))
-        return 'Error ' + str(request.status_code)
-
-def parse_version_string():
-    path = os.path.abspath(__file__)
-    while os.path.islink(path):
-        path = os.path.join(os.path.dirname(path), os.readlink(path))
-    for _ in range(2): # go up two levels, from wurstminebot/wurstminebot/core.py to wurstminebot, where README.md is located
-        path = os.path.dirname(path)
-        while os.path.islink(path):
-            path = os.path.join(os.path.dirname(path), os.readlink(path))
-    try:
-        version = subprocess.check_output(['git', 'rev-parse', '--abbrev-ref', 'HEAD'], cwd=path).decode('utf-8').strip('\n')
-        if version == 'master':
-            try:
-                with open(os.path.join(path, 'README.md')) as readme:
-                    for line in readme.read().splitlines():
-                        if line.startswith('This is `wurstminebot` version'):
-                            return line.split(' ')[4]
-            except:
-                pass
-        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=path).decode('utf-8').strip('\n')
-    except:
-        pass
+    The dict has the keys error (None, or a message if the ticket page couldn't be fetched), key (like MC-4), title (None if it couldn't be found on the page), and url.
+    """
+    def extract_title(response):
+        match = re.search('<title>\\[([A-Z]+)-([0-9]+)\\] (.+) - M?o?[Jj][Ii][Rr][Aa]</title>', web.read_until(response, '</title>')) # the title is near the top, don't download the rest of the page
+        if match:
+            return xml.sax.saxutils.unescape(match.group(3))
+    
+    url = 'http://bugs.mojang.com/browse/' + project + '-' + str(issue_id)
+    status_code, title = web.get_cached(url, extract_title)
+    return {
+        'error': None if status_code == 200 else 'Error ' + str(status_code),
+        'key': project + '-' + str(issue_id),
+        'title': title,
+        'url': url
+    }
 
-def parse_timedelta(time_string):
-    ret = 0
-    time_string = time_string[:]
-    while len(time_string) > 0:
-        match = re.match('([0-9]+)([dhms])', time_string)
-        if not match:
-            if re.match('[0-9]+$', time_string):
-                return ret + int(time_string)
-            else:
-                raise ValueError(str(time_string) + ' is not a valid time interval')
-        number, unit = match.group(1, 2)
-        ret += int(number) * {
-            'd': 86400,
-            'h': 3600,
-            'm': 60,
-            's': 1
-        }[unit]
-        time_string = time_string[len(number) + 1:]
-    return ret
+def fetch_tweet(status):
+    """Returns a dict describing a tweet, to be rendered using format_tweet.
+    
+    The dict has the keys author (the screen name of the tweet's author), retweeted_author (the screen name of the original author if it's a retweet, otherwise None), text (the unescaped text, of the original tweet for retweets), and url. Raises TwitterError if the tweet can't be fetched, or AttributeError if Twitter isn't configured.
+    """
+    from wurstminebot import tweets
+    if twitter is None:
+        raise AttributeError('Twitter is not configured')
+    j = tweets.tweet_cache().get(status)
+    if 'retweeted_status' in j:
+        rj = tweets.tweet_cache().get(j['retweeted_status']['id_str']) # usually cached along with the retweet
+    else:
+        rj = None
+    return {
+        'author': j['user']['screen_name'],
+        'retweeted_author': None if rj is None else rj['user']['screen_name'],
+        'text': xml.sax.saxutils.unescape(j['text'] if rj is None else rj['text']),
+        'url': 'https://twitter.com/' + j['user']['screen_name'] + '/status/' + j['id_str']
+    }
 
-def paste_mojira(project, issue_id, link=False, tellraw=False):
-    request = requests.get('http://bugs.mojang.com/browse/' + project + '-' + str(issue_id))
-    if request.status_code == 200:
-        for line in request.text.splitlines():
-            match = re.match('<title>\\[([A-Z]+)-([0-9]+)\\] (.+) - M?o?[Jj][Ii][Rr][Aa]</title>', line)
-            if match:
-                break
+def format_mojira(ticket, link=False, tellraw=False):
+    """Renders a ticket returned by fetch_mojira as an IRC line, or as tellraw JSON if tellraw is true."""
+    if ticket['error'] is not None:
+        if tellraw:
+            return {
+                'text': ticket['error'],
+                'color': 'red'
+            }
         else:
-            if tellraw:
-                return {
-                    'text': 'could not get title',
-                    'color': 'red'
-                }
-            else:
-                return 'could not get title'
-        title = xml.sax.saxutils.unescape(match.group(3))
+            return ticket['error']
+    if ticket['title'] is None:
         if tellraw:
             return {
-                'text': '[' + project + '-' + str(issue_id) + '] ' + title,
-                'color': 'gold',
-                'clickEvent': {
-                    'action': 'open_url',
-                    'value': 'http://bugs.mojang.com/browse/' + project + '-' + str(issue_id)
-                }
+                'text': 'could not get title',
+                'color': 'red'
             }
         else:
-            return '[' + project + '-' + str(issue_id) + '] ' + title + (' [http://bugs.mojang.com/browse/' + project + '-' + str(issue_id) + ']' if link else '')
-    elif tellraw:
+            return 'could not get title'
+    if tellraw:
         return {
-            'text': 'Error ' + str(request.status_code),
-            'color': 'red'
+            'text': '[' + ticket['key'] + '] ' + ticket['title'],
+            'color': 'gold',
+            'clickEvent': {
+                'action': 'open_url',
+                'value': ticket['url']
+            }
         }
     else:
-        return 'Error ' + str(request.status_code)
+        return '[' + ticket['key'] + '] ' + ticket['title'] + (' [' + ticket['url'] + ']' if link else '')
 
-def paste_tweet(status, link=False, tellraw=False, multi_line='all'):
-    r = twitter.request('statuses/show/:' + str(status))
-    if isinstance(r, TwitterAPI.TwitterResponse):
-        j = r.response.json()
-    else:
-        j = r.json()
-    if r.status_code != 200:
-        first_error = j['errors'][0] if len(j.get('errors', [])) else {}
-        raise TwitterError(first_error.get('code', 0), message=first_error.get('message'), status_code=r.status_code, errors = j.get('errors', []))
-    if 'retweeted_status' in j:
-        retweeted_request = twitter.request('statuses/show/:' + str(j['retweeted_status']['id']))
-        if isinstance(retweeted_request, TwitterAPI.TwitterResponse):
-            rj = retweeted_request.response.json()
-        else:
-            rj = retweeted_request.json()
-        if retweeted_request.status_code != 200:
-            first_error = rj['errors'][0] if len(rj.get('errors', [])) else {}
-            raise TwitterError(first_error.get('code', 0), message=first_error.get('message'), status_code=retweeted_request.status_code, errors = rj.get('errors', []))
-        tweet_author = '<@' + j['user']['screen_name'] + ' RT @' + rj['user']['screen_name'] + '> '
+def format_tweet(tweet, link=False, tellraw=False, multi_line='all'):
+    """Renders a tweet returned by fetch_tweet as IRC text, or as tellraw JSON if tellraw is true."""
+    if tweet['retweeted_author'] is not None:
+        tweet_author = '<@' + tweet['author'] + ' RT @' + tweet['retweeted_author'] + '> '
         tweet_author_tellraw = [
             {
-                'text': '@' + j['user']['screen_name'],
+                'text': '@' + tweet['author'],
                 'clickEvent': {
                     'action': 'open_url',
-                    'value': 'https://twitter.com/' + j['user']['screen_name']
+                    'value': 'https://twitter.com/' + tweet['author']
                 },
                 'color': 'gold'
             },
@@ -350,29 +440,28 @@ def paste_tweet(status, link=False, tellraw=False, multi_line='all'):
                 'color': 'gold'
             },
             {
-                'text': '@' + rj['user']['screen_name'],
+                'text': '@' + tweet['retweeted_author'],
                 'clickEvent': {
                     'action': 'open_url',
-                    'value': 'https://twitter.com/' + rj['user']['screen_name']
+                    'value': 'https://twitter.com/' + tweet['retweeted_author']
                 },
                 'color': 'gold'
             }
         ]
-        text = xml.sax.saxutils.unescape(rj['text'])
     else:
-        tweet_author = '<@' + j['user']['screen_name'] + '> '
+        tweet_author = '<@' + tweet['author'] + '> '
         tweet_author_tellraw = [
             {
-                'text': '@' + j['user']['screen_name'],
+                'text': '@' + tweet['author'],
                 'clickEvent': {
                     'action': 'open_url',
-                    'value': 'https://twitter.com/' + j['user']['screen_name']
+                    'value': 'https://twitter.com/' + tweet['author']
                 },
                 'color': 'gold'
             }
         ]
-        text = xml.sax.saxutils.unescape(j['text'])
-    tweet_url = 'https://twitter.com/' + j['user']['screen_name'] + '/status/' + j['id_str']
+    text = tweet['text']
+    tweet_url = tweet['url']
     if tellraw:
         return {
             'text': '<',
@@ -417,11 +506,138 @@ def paste_tweet(status, link=False, tellraw=False, multi_line='all'):
             text += ((' [' + tweet_url + ']') if link else '')
         return tweet_author + text
 
+def invalidate_online_players():
+    """Makes the next online_players call ask the server."""
+    with state['presence']['lock']:
+        state['presence']['generation'] += 1
+        state['presence']['stamp'] = None
+
+def log_status():
+    """Logs the queue depths and counters of the command pool and the IRC send queue, for monitoring."""
+    for name, key in [('commands', 'command_pool'), ('irc', 'bot')]:
+        component = state.get(key)
+        if component is not None:
+            debug_print('[status] {} {}'.format(name, json.dumps(component.status(), sort_keys=True)), level='info')
+
+def minecraft_wiki_lookup(article, reply=None):
+    if reply is None:
+        def reply(*args, **kwargs):
+            pass
+    
+    match = re.match('http://(?:minecraft\\.gamepedia\\.com|minecraftwiki\\.net(?:/wiki)?)/(.*)', article)
+    if match:
+        article = match.group(1)
+    status_code, first_line = web.get_cached('http://minecraft.gamepedia.com/' + article, lambda response: web.read_until(response, '\n', max_bytes=4096), params={'action': 'raw'}) # only the first line is needed to detect redirects
+    if status_code == 200:
+        if first_line.lower().startswith('#redirect'):
+            match = re.match('#[Rr][Ee][Dd][Ii][Rr][Ee][Cc][Tt] \\[\\[(.+)(\\|.*)?\\]\\]', first_line)
+            if match:
+                redirect_target = 'http://minecraft.gamepedia.com/' + re.sub(' ', '_', match.group(1))
+                reply('Redirect ' + redirect_target, {
+                    'clickEvent': {
+                        'action': 'open_url',
+                        'value': redirect_target
+                    },
+                    'color': 'gold',
+                    'text': 'Redirect'
+                })
+                return 'Redirect ' + redirect_target
+            else:
+                reply('Broken redirect')
+                return 'Broken redirect'
+        else:
+            reply('Article http://minecraft.gamepedia.com/' + article, {
+                'clickEvent': {
+                    'action': 'open_url',
+                    'value': 'http://minecraft.gamepedia.com/' + article
+                },
+                'color': 'gold',
+                'text': 'Article'
+            })
+            return 'Article http://minecraft.gamepedia.com/' + article
+    else:
+        reply('Error ' + str(status_code))
+        return 'Error ' + str(status_code)
+
+def online_players(allow_exceptions=False, refresh=False):
+    """Returns a list of the Minecraft usernames of the players currently online.
+    
+    The list is kept up to date by the join and leave events the InputLoop sees, so this usually doesn't talk to the server. It is checked against minecraft.online_players when it's older than presence.interval seconds, after invalidate_online_players, or if refresh is true. The answer is only cached if no join, leave, or invalidation happened while the server was being asked, since it may not include them. If asking the server fails, the exception is raised if allow_exceptions is true, otherwise an empty list is returned, and nothing is cached either way.
+    """
+    presence = state['presence']
+    with presence['lock']:
+        if not refresh and presence['stamp'] is not None and time.monotonic() - presence['stamp'] < config('presence').get('interval', 300):
+            return list(presence['players'])
+        generation = presence['generation']
+    try:
+        players = minecraft.online_players(allow_exceptions=True)
+    except Exception:
+        if allow_exceptions:
+            raise
+        return []
+    with presence['lock']:
+        if presence['generation'] == generation:
+            presence['players'] = list(players)
+            presence['stamp'] = time.monotonic()
+    return list(players)
+
+def parse_version_string():
+    path = os.path.abspath(__file__)
+    while os.path.islink(path):
+        path = os.path.join(os.path.dirname(path), os.readlink(path))
+    for _ in range(2): # go up two levels, from wurstminebot/wurstminebot/core.py to wurstminebot, where README.md is located
+        path = os.path.dirname(path)
+        while os.path.islink(path):
+            path = os.path.join(os.path.dirname(path), os.readlink(path))
+    try:
+        version = subprocess.check_output(['git', 'rev-parse', '--abbrev-ref', 'HEAD'], cwd=path).decode('utf-8').strip('\n')
+        if version == 'master':
+            try:
+                with open(os.path.join(path, 'README.md')) as readme:
+                    for line in readme.read().splitlines():
+                        if line.startswith('This is `wurstminebot` version'):
+                            return line.split(' ')[4]
+            except:
+                pass
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=path).decode('utf-8').strip('\n')
+    except:
+        pass
+
+def parse_timedelta(time_string):
+    ret = 0
+    time_string = time_string[:]
+    while len(time_string) > 0:
+        match = re.match('([0-9]+)([dhms])', time_string)
+        if not match:
+            if re.match('[0-9]+$', time_string):
+                return ret + int(time_string)
+            else:
+                raise ValueError(str(time_string) + ' is not a valid time interval')
+        number, unit = match.group(1, 2)
+        ret += int(number) * {
+            'd': 86400,
+            'h': 3600,
+            'm': 60,
+            's': 1
+        }[unit]
+        time_string = time_string[len(number) + 1:]
+    return ret
+
+def paste_mojira(project, issue_id, link=False, tellraw=False):
+    return format_mojira(fetch_mojira(project, issue_id), link=link, tellraw=tellraw)
+
+def paste_tweet(status, link=False, tellraw=False, multi_line='all'):
+    return format_tweet(fetch_tweet(status), link=link, tellraw=tellraw, multi_line=multi_line)
+
 def run():
     try:
         minecraft.status()
     except KeyError:
         sys.exit(minecraft.user_not_found_error)
+    if config('runtime').get('mode', 'threads') == 'asyncio':
+        from wurstminebot import runtime
+        runtime.run()
+        return
     from wurstminebot import loop
     state['time_loop'] = loop.TimeLoop(on_exception=('log_stdout',) if config('debug', False) or state.get('is_daemon', False) else ())
     state['time_loop'].start()
@@ -436,29 +652,74 @@ def run():
         try:
             state['bot'].run()
         except Exception:
+            debug_print('Exception in bot.run:', exc_info=True)
             cleanup()
-            debug_print('Exception in bot.run:')
-            if config('debug', False) or state.get('is_daemon', False):
-                traceback.print_exc(file=sys.stdout)
             sys.exit(1)
     cleanup()
 
 def set_config(config_dict):
-    with open(state['config_path'], 'w') as config_file:
-        json.dump(config_dict, config_file, sort_keys=True, indent=4, separators=(',', ': '))
+    path = state['config_path']
+    with state['config_cache']['lock']:
+        with open(path + '.tmp', 'w') as config_file:
+            json.dump(config_dict, config_file, sort_keys=True, indent=4, separators=(',', ': '))
+        try:
+            shutil.copymode(path, path + '.tmp')
+        except OSError:
+            pass # config file doesn't exist yet
+        os.replace(path + '.tmp', path) # readers see either the old or the new config, never a partial one
+        state['config_cache']['stamp'] = None
 
-def set_twitter(person, screen_name):
+def set_twitter(person, screen_name, on_error=None):
+    """Sets the person's Twitter screen name, and follows them and adds them to the members list once the rate limit allows it.
+    
+    If on_error is given, it is called with an error message for each of these requests that fails.
+    """
+    def check(action):
+        def callback(future):
+            try:
+                r = future.result()
+            except Exception as e:
+                error = str(e)
+            else:
+                if r.status_code == 200:
+                    return
+                error = 'status ' + str(r.status_code)
+            debug_print('[twitter] could not ' + action + ': ' + error)
+            if on_error is not None:
+                on_error('Could not ' + action + ' [' + error + ']')
+        
+        return callback
+    
     person.twitter = screen_name
     members_list_id = config('twitter').get('members_list')
     if members_list_id is not None:
-        twitter.request('lists/members/create', {'list_id': members_list_id, 'screen_name': screen_name})
-    twitter.request('friendships/create', {'screen_name': screen_name})
+        twitter.defer('lists/members/create', {'list_id': members_list_id, 'screen_name': screen_name}).add_done_callback(check('add @' + screen_name + ' to the members list'))
+    twitter.defer('friendships/create', {'screen_name': screen_name}).add_done_callback(check('follow @' + screen_name))
 
 def status(pidfile):
     if pidfile.is_locked():
         return os.path.exists(os.path.join('/proc/', str(pidfile.read_pid())))
     return False
 
+def _log_tellraw_error(future):
+    if future.exception() is not None:
+        debug_print('[rcon] tellraw failed: {}'.format(future.exception()), level='warning')
+
+def tellraw(message, player=None, block=False):
+    """Sends a tellraw message to the given player, or to everyone if player is None.
+    
+    If rcon is configured, this doesn't wait for the server unless block is true, and tellraws sent in quick succession are sent in a single batch. Without block, errors are only logged. With block, they are raised: OSError if the server couldn't be reached, or rcon.RconError if the connection failed after the message was sent.
+    """
+    from wurstminebot import rcon
+    transport = rcon.transport()
+    if transport is None:
+        return minecraft.tellraw(message, player=player)
+    future = transport.command('tellraw', ['@a' if player is None else player, json.dumps(message)])
+    if block:
+        future.result()
+    else:
+        future.add_done_callback(_log_tellraw_error)
+
 def tweet(status):
     r = twitter.request('statuses/update', {'status': status})
     if isinstance(r, TwitterAPI.TwitterResponse):
@@ -466,12 +727,14 @@ def tweet(status):
     else:
         j = r.json()
     if r.status_code == 200:
+        from wurstminebot import tweets
+        tweets.tweet_cache().add(j) # the response is the new tweet, so pasting it doesn't need another request
         return j['id']
     first_error = j.get('errors', [])[0] if len(j.get('errors', [])) else {}
     raise TwitterError(first_error.get('code', 0), message=first_error.get('message'), status_code=r.status_code, errors=j.get('errors', []))
 
 def update_config(path, value):
-    config_dict = config()
+    config_dict = copy.deepcopy(config())
     full_config_dict = config_dict
     if len(path) > 1:
         for key in path[:-1]:
@@ -493,6 +756,20 @@ def update_all(force=False):
         debug_print('Did not update whitelist due to a FileNotFoundError')
     update_topic(force=force)
 
+def update_presence(player, joined):
+    """Records a join or leave seen in the server log in the cache used by online_players."""
+    presence = state['presence']
+    with presence['lock']:
+        presence['generation'] += 1 # an answer from the server that is still on its way may not include this
+        if presence['stamp'] is None:
+            return # the next online_players call asks the server anyway
+        if player in presence['players']:
+            presence['players'].remove(player)
+        if joined:
+            presence['players'].append(player)
+
+_topic_updater_lock = threading.Lock()
+
 def update_topic(force=None, special_status=object()):
     """Update the IRC topic and optionally set the special status topic.
     
@@ -500,6 +777,18 @@ def update_topic(force=None, special_status=object()):
     force -- If true, and fetching the list of online players fails, an error message will be added to the topic instead. By default, this is true iff the special status topic is being set.
     special_status -- A string that specifies the special status topic to set before updating the topic, or None to reset the special status topic. By default, the special status topic is left unchanged.
     """
+    if special_status is None or isinstance(special_status, str):
+        invalidate_online_players() # special statuses are set around restarts, stops, updates, and world switches, which disconnect everyone
+        state['special_status'] = special_status
+    if force is None:
+        force = special_status is None or isinstance(special_status, str)
+    with _topic_updater_lock:
+        if state.get('topic_updater') is None:
+            state['topic_updater'] = TopicUpdater(interval=config('irc').get('topic_interval', 10))
+        state['topic_updater'].request(force=force)
+
+def _update_topic(force):
+    """Builds the topic and sets it. Returns False if the online players couldn't be fetched and the update should be retried later."""
     from wurstminebot import irc
     
     topic_parts = []
@@ -519,26 +808,25 @@ def update_topic(force=None, special_status=object()):
         else:
             topic_parts.append('USC {} poll: {}'.format(usc_config['completedSeasons'] + 1, usc_config['nextPoll']))
     # special server status or online players
-    if special_status is None or isinstance(special_status, str):
-        state['special_status'] = special_status
-    if force is None:
-        force = special_status is None or isinstance(special_status, str)
     main_channel = config('irc').get('main_channel')
     if main_channel is None:
-        return
+        return True
+    retry = False
+    error_status = None
     try:
-        state['online_players'] = nicksub.sorted_people(minecraft.online_players(allow_exceptions=True), context='minecraft')
+        state['online_players'] = nicksub.sorted_people(online_players(allow_exceptions=True), context='minecraft')
     except Exception as e:
         if force:
             state['online_players'] = []
-            if state['special_status'] is None:
-                special_status = 'Error getting online players: ' + str(e)
+            error_status = 'Error getting online players: ' + str(e)
         else:
-            threading.Timer(60, update_topic).start()
+            retry = True
             if state['special_status'] is None:
-                return
+                return False
     if len(state['online_players']) and config('irc').get('playerList', 'announce') == 'topic' and state['special_status'] is None:
         server_status = 'Currently online: ' + ', '.join(p.irc_nick(respect_highlight_option=False) for p in state['online_players'])
+    elif state['special_status'] is None:
+        server_status = error_status
     else:
         server_status = state['special_status']
     if server_status:
@@ -546,30 +834,55 @@ def update_topic(force=None, special_status=object()):
     # build the topic
     new_topic = ' | '.join(topic_parts)
     irc.set_topic(main_channel, new_topic, force=force)
+    return not retry
 
 __version__ = str(parse_version_string())
 
 state = {
     'achievement_tweets': True,
     'bot': None,
+    'command_pool': None,
+    'config_cache': {
+        'hits': 0,
+        'lock': threading.Lock(),
+        'reloads': 0,
+        'stamp': None,
+        'value': None
+    },
     'config_path': '/opt/wurstmineberg/config/wurstminebot.json',
     'death_tweets': True,
     'dst': bool(time.localtime().tm_isdst),
+    'http': None,
+    'http_cache': None,
     'input_loop': None,
     'irc_topics': {},
     'is_daemon': False,
     'last_death': '',
     'log_lock': threading.Lock(),
-    'minecraft_username_cache': {},
+    'logger': None,
+    'mention_stream': None,
+    'minecraft_username_cache': None,
     'online_players': [],
+    'outbox': None,
+    'presence': {
+        'generation': 0,
+        'lock': threading.Lock(),
+        'players': [],
+        'stamp': None
+    },
+    'rcon': None,
+    'runtime': None,
     'server_control_lock': threading.Lock(),
     'special_status': None,
     'time_loop': None,
+    'topic_updater': None,
+    'tweet_cache': None,
     'twitter_stream': None
 }
 
 try:
     import TwitterAPI
-    twitter = TwitterAPI.TwitterAPI(config('twitter')['consumer_key'], config('twitter')['consumer_secret'], config('twitter')['access_token_key'], config('twitter')['access_token_secret'])
+    from wurstminebot import twitterclient
+    twitter = twitterclient.Client(TwitterAPI.TwitterAPI(config('twitter')['consumer_key'], config('twitter')['consumer_secret'], config('twitter')['access_token_key'], config('twitter')['access_token_secret']), coalesce_window=config('twitter').get('coalesce_window', 5), reserve=config('twitter').get('reserve', 2), path=config('paths').get('twitter_deferred', '/var/local/wurstmineberg/wurstminebot_twitter_deferred.json'))
 except KeyError:
     twitter = None
@@ -1,3 +1,4 @@
+from wurstminebot import core
 from datetime import date
 from datetime import datetime
 import minecraft
@@ -220,27 +221,40 @@ messages = [
     }
 ] # http://minecraft.gamepedia.com/Server#Death_messages
 
+def compile_messages(messages):
+    """Combines the death messages into a single regex matching a full log line.
+    
+    Returns a tuple (regex, ids) where regex has the named groups timestamp and player, and ids maps the name of the group wrapping each death message to a tuple (death_id, first_group, group_count) locating that message's own groups in match.groups(). Messages are tried in list order.
+    """
+    alternatives = []
+    ids = {}
+    group_count = 2 + re.compile(minecraft.regexes.timestamp + '|' + minecraft.regexes.full_timestamp).groups + re.compile(minecraft.regexes.player).groups
+    for i, death in enumerate(messages):
+        death_group_count = re.compile(death['regex']).groups
+        ids['death' + str(i)] = death['id'], group_count + 1, death_group_count
+        group_count += 1 + death_group_count
+        alternatives.append('(?P<death' + str(i) + '>' + death['regex'] + ')$')
+    regex = re.compile('(?P<timestamp>' + minecraft.regexes.timestamp + '|' + minecraft.regexes.full_timestamp + ') \\[Server thread/INFO\\]: (?P<player>' + minecraft.regexes.player + ') (?:' + '|'.join(alternatives) + ')')
+    return regex, ids
+
+messages_regex, messages_ids = compile_messages(messages)
+
 class Death:
     def __init__(self, log_line, time=None):
-        for death in messages:
-            match = re.match('(' + minecraft.regexes.timestamp + '|' + minecraft.regexes.full_timestamp + ') \\[Server thread/INFO\\]: (' + minecraft.regexes.player + ') ' + death['regex'] + '$', log_line)
-            if not match:
-                continue
-            # death
-            self.id = death['id']
-            if time is None:
-                if match.group(1).startswith('['):
-                    self.timestamp = minecraft.regexes.strptime(date.today(), match.group(1)).astimezone(timezone.utc) # not guaranteed to be accurate
-                else:
-                    self.timestamp = datetime.strptime(match.group(1) + ' +0000', '%Y-%m-%d %H:%M:%S %z')
+        match = messages_regex.match(log_line)
+        if not match:
+            raise ValueError('Log line is not a death')
+        self.id, first_group, group_count = messages_ids[match.lastgroup] # the wrapper group of the matching message is the last one to close
+        if time is None:
+            if match.group('timestamp').startswith('['):
+                self.timestamp = minecraft.regexes.strptime(date.today(), match.group('timestamp')).astimezone(timezone.utc) # not guaranteed to be accurate
             else:
-                self.timestamp = time
-            self.person = nicksub.person_or_dummy(match.group(2), context='minecraft')
-            self.partial_message = log_line[len('1970-01-01 00:00:00 [Server thread/INFO]: ' + self.person.nick('minecraft') + ' '):]
-            self.groups = match.groups()[2:]
-            break
+                self.timestamp = datetime.strptime(match.group('timestamp') + ' +0000', '%Y-%m-%d %H:%M:%S %z')
         else:
-            raise ValueError('Log line is not a death')
+            self.timestamp = time
+        self.person = nicksub.person_or_dummy(match.group('player'), context='minecraft')
+        self.partial_message = log_line[len('1970-01-01 00:00:00 [Server thread/INFO]: ' + self.person.nick('minecraft') + ' '):]
+        self.groups = match.groups()[first_group:first_group + group_count]
     
     def irc_message(self, tweet_info=None, respect_highlight_option=True):
         victim_irc = self.person.irc_nick(respect_highlight_option=respect_highlight_option)
@@ -249,7 +263,7 @@ class Death:
     def log(self, file_obj=None):
         log_message = self.timestamp.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S') + ' ' + self.message()
         if file_obj is None:
-            print(log_message)
+            core.debug_print('[death] ' + log_message, level='info')
         else:
             print(log_message, file=file_obj)
     
@@ -1,14 +1,18 @@
 import sys
 
+import collections
 from wurstminebot import commands
 from wurstminebot import core
 import json
 from wurstminebot import loop
 import minecraft
 from wurstminebot import nicksub
+from wurstminebot import outbox
 import random
 import re
-import traceback
+import threading
+import time
+from wurstminebot import web
 
 def endMOTD(sender, headers, message):
     irc_config = core.config('irc')
@@ -23,17 +27,20 @@ def endMOTD(sender, headers, message):
         try:
             core.state['bot'].joinchan(chan)
         except:
-            core.debug_print('Exception while joining channel ' + str(chan) + ':')
-            if core.config('debug', False) or core.state.get('is_daemon', False):
-                traceback.print_exc(file=sys.stdout)
+            core.debug_print('Exception while joining channel ' + str(chan) + ':', exc_info=True)
     if irc_config.get('main_channel') is not None:
         core.state['bot'].say(irc_config['main_channel'], "aaand I'm back.")
-    minecraft.tellraw({
+    core.tellraw({
         'text': "aaand I'm back.",
         'color': 'gold'
     })
     core.debug_print("aaand I'm back.")
     core.update_all()
+    if core.twitter is not None:
+        outbox.outbox() # post tweets left over from before a restart
+    if core.state.get('runtime') is not None:
+        core.state['runtime'].on_connected()
+        return
     if core.state.get('input_loop') is None:
         core.state['input_loop'] = loop.InputLoop()
         core.state['input_loop'].start()
@@ -220,13 +227,250 @@ def format_text(message):
         curmsg = ''
     return messages
 
+class SendQueue:
+    """Wraps the IRC bot, sending messages from a queue at a limited rate.
+    
+    say calls from any thread only queue the message. A worker thread sends them using a token bucket: up to send_burst lines at once, then send_rate lines per second. Messages to the dev channel, to ops, and to NickServ are sent before everything else. When the queue is backed up, consecutive short lines to the same target are merged into one line that fits the 512-byte IRC limit. All other attributes are passed through to the bot.
+    """
+    
+    max_line_bytes = 512 - 2 - 100 # minus CRLF and room for the nick!user@host prefix the server adds
+    separator = ' | '
+    
+    def __init__(self, bot):
+        irc_config = core.config('irc')
+        self.bot = bot
+        self.burst = irc_config.get('send_burst', 5)
+        self.rate = irc_config.get('send_rate', 1.0)
+        self.merge = irc_config.get('send_merge', True)
+        self.condition = threading.Condition()
+        self.high = collections.deque()
+        self.normal = collections.deque()
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.sending = False
+        self.stopped = False
+        self.stats = {
+            'maxQueued': 0,
+            'merged': 0,
+            'sent': 0
+        }
+        self.thread = threading.Thread(target=self.work, name='wurstminebot IRC send queue', daemon=True)
+        self.thread.start()
+    
+    def __getattr__(self, name):
+        return getattr(self.bot, name)
+    
+    def disconnect(self, *args, **kwargs):
+        self.flush()
+        return self.bot.disconnect(*args, **kwargs)
+    
+    def flush(self, timeout=10):
+        """Blocks until all queued messages have been sent or timeout seconds have passed. Returns whether the queue is empty."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.sending or len(self.high) or len(self.normal):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.thread.is_alive():
+                    return False
+                self.condition.wait(remaining)
+        return True
+    
+    def is_high_priority(self, target):
+        irc_config = core.config('irc')
+        if target == irc_config.get('dev_channel') or target.lower() == 'nickserv':
+            return True
+        if target.startswith('#') or target.startswith('&'):
+            return False
+        try:
+            return nicksub.Person(target, context='irc').id in core.config('ops')
+        except nicksub.PersonNotFoundError:
+            return False
+    
+    def say(self, target, message):
+        queue = self.high if self.is_high_priority(target) else self.normal
+        with self.condition:
+            queue.append((target, message))
+            self.stats['maxQueued'] = max(self.stats['maxQueued'], len(self.high) + len(self.normal))
+            self.condition.notify_all()
+    
+    def status(self):
+        """Returns a dict with the current queue depths, available tokens, and counts of sent and merged lines."""
+        with self.condition:
+            return dict(self.stats, queued=len(self.high) + len(self.normal), queuedHighPriority=len(self.high), tokens=self.tokens)
+    
+    def stop(self):
+        self.flush()
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        return self.bot.stop()
+    
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.stopped and not (len(self.high) or len(self.normal)):
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens < 1:
+                    self.condition.wait((1 - self.tokens) / self.rate)
+                    continue
+                queue = self.high if len(self.high) else self.normal
+                target, message = queue.popleft()
+                if self.merge and len(self.high) + len(self.normal) >= self.tokens:
+                    # not all queued lines can be sent right away, so save lines by merging
+                    limit = self.max_line_bytes - len('PRIVMSG {} :'.format(target).encode('utf-8'))
+                    while len(queue) and queue[0][0] == target and len((message + self.separator + queue[0][1]).encode('utf-8')) <= limit:
+                        message += self.separator + queue.popleft()[1]
+                        self.stats['merged'] += 1
+                self.tokens -= 1
+                self.sending = True
+            try:
+                self.bot.say(target, message)
+            except Exception:
+                core.debug_print('Exception while sending to ' + str(target) + ':', exc_info=True)
+            finally:
+                with self.condition:
+                    self.sending = False
+                    self.stats['sent'] += 1
+                    self.condition.notify_all()
+
+class StateSync:
+    """Relays IRC joins, parts, and nick changes in-game to the people who have opted in.
+    
+    Events arriving within sync_window seconds of each other are sent together, with one tellraw per recipient. If more than sync_burst events of the same kind for the same channel arrive in one window (for example when people rejoin after a netsplit), they are summarized in a single line.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = collections.OrderedDict() # (option, kind, channel) → list of events
+        self.timer = None
+    
+    def add(self, option, kind, channel, event):
+        """Queues an event for the people who have the given option enabled.
+        
+        Required arguments:
+        option -- The nicksub option people use to opt in, e.g. 'sync_join_part'.
+        kind -- 'join', 'part', or 'nick'.
+        channel -- The channel(s) as displayed in the message, or None for nick changes.
+        event -- The nick for joins and parts, or an (old nick, new nick) tuple for nick changes.
+        """
+        window = core.config('irc').get('sync_window', 1.0)
+        with self.lock:
+            self.pending.setdefault((option, kind, channel), []).append(event)
+            if window > 0 and self.timer is None:
+                self.timer = threading.Timer(window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if window <= 0:
+            self.flush()
+    
+    def flush(self):
+        try:
+            with self.lock:
+                pending = self.pending
+                self.pending = collections.OrderedDict()
+                self.timer = None
+            if len(pending) == 0:
+                return
+            burst = core.config('irc').get('sync_burst', 3)
+            lines = []
+            for (option, kind, channel), events in pending.items():
+                if len(events) > burst:
+                    lines.append((option, self.summary(kind, channel, events)))
+                else:
+                    lines += [(option, self.line(kind, channel, event)) for event in events]
+            options = {option for option, line in lines}
+            for person in nicksub.everyone():
+                if person.minecraft is None:
+                    continue
+                enabled_options = {option for option in options if person.option(option)}
+                message = []
+                for option, line in lines:
+                    if option in enabled_options:
+                        if len(message):
+                            message.append({'text': '\n'})
+                        message += line
+                if len(message):
+                    core.tellraw(message, player=person.minecraft)
+        except:
+            core.debug_print('Exception while relaying IRC joins/parts/nick changes:', exc_info=True)
+    
+    @staticmethod
+    def line(kind, channel, event):
+        if kind == 'join':
+            return [
+                {
+                    'text': event,
+                    'color': 'yellow',
+                    'clickEvent': {
+                        'action': 'suggest_command',
+                        'value': event + ': '
+                    }
+                },
+                {
+                    'text': ' joined ' + channel,
+                    'color': 'yellow'
+                }
+            ]
+        elif kind == 'nick':
+            old_nick, new_nick = event
+            return [
+                {
+                    'text': old_nick + ' is now known as ',
+                    'color': 'yellow'
+                },
+                {
+                    'text': new_nick,
+                    'color': 'yellow',
+                    'clickEvent': {
+                        'action': 'suggest_command',
+                        'value': new_nick + ': '
+                    }
+                }
+            ]
+        else:
+            return [
+                {
+                    'text': event + ' left ' + channel,
+                    'color': 'yellow'
+                }
+            ]
+    
+    @staticmethod
+    def summary(kind, channel, events):
+        if kind == 'join':
+            text = '{} people joined {}'.format(len(events), channel)
+            details = ', '.join(events)
+        elif kind == 'nick':
+            text = '{} people changed their nicks'.format(len(events))
+            details = '\n'.join(old_nick + ' is now known as ' + new_nick for old_nick, new_nick in events)
+        else:
+            text = '{} people left {}'.format(len(events), channel)
+            details = ', '.join(events)
+        return [
+            {
+                'text': text,
+                'color': 'yellow',
+                'hoverEvent': {
+                    'action': 'show_text',
+                    'value': details
+                }
+            }
+        ]
+
+state_sync = StateSync()
+
 def action(sender, headers, message):
     try:
         irc_config = core.config('irc')
         if sender == irc_config.get('nick', 'wurstminebot'):
             return
         if 'main_channel' in irc_config and headers[0] == irc_config['main_channel']:
-            minecraft.tellraw([
+            core.tellraw([
                 {
                     'text': '* ' + nicksub.sub(sender, 'irc', 'minecraft'),
                     'color': 'aqua',
@@ -248,13 +492,16 @@ def action(sender, headers, message):
         core.cleanup()
         raise
     except:
-        core.debug_print('Exception in ACTION:')
-        if core.config('debug', False) or core.state.get('is_daemon', False):
-            traceback.print_exc(file=sys.stdout)
+        core.debug_print('Exception in ACTION:', exc_info=True)
 
 def bot():
-    import ircbotframe
-    ret = ircbotframe.ircBot(core.config('irc')['server'], core.config('irc').get('port', 6667), core.config('irc')['nick'], core.config('irc')['nick'], password=core.config('irc').get('password'), ssl=core.config('irc').get('ssl', False))
+    if core.config('irc').get('client', 'ircbotframe') == 'native':
+        from wurstminebot import ircclient
+        bot_class = ircclient.Client
+    else:
+        import ircbotframe
+        bot_class = ircbotframe.ircBot
+    ret = bot_class(core.config('irc')['server'], core.config('irc').get('port', 6667), core.config('irc')['nick'], core.config('irc')['nick'], password=core.config('irc').get('password'), ssl=core.config('irc').get('ssl', False))
     ret.log_own_messages = False
     ret.bind('376', endMOTD)
     ret.bind('433', error_nick_in_use)
@@ -263,7 +510,7 @@ def bot():
     ret.bind('JOIN', join)
     ret.bind('PART', part)
     ret.bind('PRIVMSG', privmsg)
-    return ret
+    return SendQueue(ret)
 
 def join(sender, headers, message):
     try:
@@ -274,60 +521,26 @@ def join(sender, headers, message):
             chan = message
         else:
             return
-        for person in nicksub.everyone():
-            if person.minecraft is not None and person.option('sync_join_part'):
-                minecraft.tellraw([
-                    {
-                        'text': sender,
-                        'color': 'yellow',
-                        'clickEvent': {
-                            'action': 'suggest_command',
-                            'value': sender + ': '
-                        }
-                    },
-                    {
-                        'text': ' joined ' + chan,
-                        'color': 'yellow'
-                    }
-                ], player=person.minecraft)
+        state_sync.add('sync_join_part', 'join', chan, sender)
     except SystemExit:
         core.debug_print('Exit in JOIN')
         core.cleanup()
         raise
     except:
-        core.debug_print('Exception in JOIN:')
-        if core.config('debug', False) or core.state.get('is_daemon', False):
-            traceback.print_exc(file=sys.stdout)
+        core.debug_print('Exception in JOIN:', exc_info=True)
 
 def nick(sender, headers, message):
     try:
         core.debug_print('[irc] ' + sender + ' is now known as ' + message)
         if message is None or len(message) == 0:
             return
-        for person in nicksub.everyone():
-            if person.minecraft is not None and person.option('sync_nick_changes'):
-                minecraft.tellraw([
-                    {
-                        'text': sender + ' is now known as ',
-                        'color': 'yellow'
-                    },
-                    {
-                        'text': message,
-                        'color': 'yellow',
-                        'clickEvent': {
-                            'action': 'suggest_command',
-                            'value': message + ': '
-                        }
-                    }
-                ], player=person.minecraft)
+        state_sync.add('sync_nick_changes', 'nick', None, (sender, message))
     except SystemExit:
         core.debug_print('Exit in NICK')
         core.cleanup()
         raise
     except:
-        core.debug_print('Exception in NICK:')
-        if core.config('debug', False) or core.state.get('is_daemon', False):
-            traceback.print_exc(file=sys.stdout)
+        core.debug_print('Exception in NICK:', exc_info=True)
 
 def part(sender, headers, message):
     try:
@@ -341,20 +554,13 @@ def part(sender, headers, message):
             chans = chans[0] + ' and ' + chans[1]
         else:
             chans = ', '.join(chans[:-1]) + ', and ' + chans[-1]
-        for person in nicksub.everyone():
-            if person.minecraft is not None and person.option('sync_join_part'):
-                minecraft.tellraw({
-                    'text': sender + ' left ' + chans,
-                    'color': 'yellow'
-                }, player=person.minecraft)
+        state_sync.add('sync_join_part', 'part', chans, sender)
     except SystemExit:
         core.debug_print('Exit in PART')
         core.cleanup()
         raise
     except:
-        core.debug_print('Exception in PART:')
-        if core.config('debug', False) or core.state.get('is_daemon', False):
-            traceback.print_exc(file=sys.stdout)
+        core.debug_print('Exception in PART:', exc_info=True)
 
 def privmsg(sender, headers, message):
     irc_config = core.config('irc')
@@ -390,7 +596,7 @@ def privmsg(sender, headers, message):
                         sys.exit()
             elif headers[0] == irc_config.get('main_channel') and core.config('usc').get('state') is None:
                 if re.match('https?://(mojang\\.atlassian\\.net|bugs\\.mojang\\.com)/browse/[A-Z]+-[0-9]+', message):
-                    minecraft.tellraw([
+                    core.tellraw([
                         {
                             'text': '<' + sender_person.nick('minecraft') + '>',
                             'color': 'aqua',
@@ -415,23 +621,21 @@ def privmsg(sender, headers, message):
                             }
                         }
                     ])
-                    try:
-                        match = re.match('https?://(mojang\\.atlassian\\.net|bugs\\.mojang\\.com)/browse/([A-Z]+)-([0-9]+)', message)
-                        project = match.group(2)
-                        issue_id = int(match.group(3))
-                        core.state['bot'].say(headers[0], core.paste_mojira(project, issue_id))
-                        minecraft.tellraw(core.paste_mojira(project, issue_id, tellraw=True))
-                    except SystemExit:
-                        core.debug_print('Exit while pasting mojira ticket')
-                        core.cleanup()
-                        raise
-                    except Exception as e:
-                        core.state['bot'].say(headers[0], 'Error pasting mojira ticket: ' + str(e))
-                        core.debug_print('Exception while pasting mojira ticket:')
-                        if core.config('debug', False) or core.state.get('is_daemon', False):
-                            traceback.print_exc(file=sys.stdout)
+                    def paste_mojira_ticket(): # runs on the HTTP worker pool, so a slow Mojira doesn't hold up chat relay
+                        try:
+                            match = re.match('https?://(mojang\\.atlassian\\.net|bugs\\.mojang\\.com)/browse/([A-Z]+)-([0-9]+)', message)
+                            project = match.group(2)
+                            issue_id = int(match.group(3))
+                            ticket = core.fetch_mojira(project, issue_id)
+                            core.state['bot'].say(headers[0], core.format_mojira(ticket))
+                            core.tellraw(core.format_mojira(ticket, tellraw=True))
+                        except Exception as e:
+                            core.state['bot'].say(headers[0], 'Error pasting mojira ticket: ' + str(e))
+                            core.debug_print('Exception while pasting mojira ticket:', exc_info=True)
+                    
+                    web.submit(paste_mojira_ticket)
                 elif re.match('https?://twitter\\.com/[0-9A-Z_a-z]+/status/[0-9]+$', message):
-                    minecraft.tellraw([
+                    core.tellraw([
                         {
                             'text': '<' + sender_person.nick('minecraft') + '>',
                             'color': 'aqua',
@@ -458,8 +662,9 @@ def privmsg(sender, headers, message):
                     ])
                     try:
                         twid = re.match('https?://twitter\\.com/[0-9A-Z_a-z]+/status/([0-9]+)$', message).group(1)
-                        minecraft.tellraw(core.paste_tweet(twid, link=False, tellraw=True))
-                        botsay(core.paste_tweet(twid, link=False, tellraw=False))
+                        tweet = core.fetch_tweet(twid)
+                        core.tellraw(core.format_tweet(tweet, link=False, tellraw=True))
+                        botsay(core.format_tweet(tweet, link=False, tellraw=False))
                     except SystemExit:
                         core.debug_print('Exit while pasting tweet')
                         core.cleanup()
@@ -472,14 +677,12 @@ def privmsg(sender, headers, message):
                         core.debug_print('Tried to paste a tweet from IRC, but Twitter is not configured')
                     except Exception as e:
                         core.state['bot'].say(headers[0], 'Error while pasting tweet: ' + str(e))
-                        core.debug_print('Exception while pasting tweet:')
-                        if core.config('debug', False) or core.state.get('is_daemon', False):
-                            traceback.print_exc(file=sys.stdout)
+                        core.debug_print('Exception while pasting tweet:', exc_info=True)
                 else:
                     match = re.match('([a-z0-9]+:[^ ]+)(.*)$', message)
                     if match:
                         url, remaining_message = match.group(1, 2)
-                        minecraft.tellraw([
+                        core.tellraw([
                             {
                                 'text': '<' + sender_person.nick('minecraft') + '>',
                                 'color': 'aqua',
@@ -509,7 +712,7 @@ def privmsg(sender, headers, message):
                             }
                         ])
                     else:
-                        minecraft.tellraw({
+                        core.tellraw({
                             'text': '',
                             'extra': [
                                 {
@@ -541,9 +744,7 @@ def privmsg(sender, headers, message):
         core.cleanup()
         raise
     except:
-        core.debug_print('Exception in PRIVMSG:')
-        if core.config('debug', False) or core.state.get('is_daemon', False):
-            traceback.print_exc(file=sys.stdout)
+        core.debug_print('Exception in PRIVMSG:', exc_info=True)
 
 def set_topic(channel, new_topic, force=False):
     if new_topic is None:
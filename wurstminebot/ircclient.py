@@ -0,0 +1,208 @@
+import asyncio
+import collections
+import concurrent.futures
+from wurstminebot import core
+import ssl as ssl_module
+import threading
+
+LOG_SIZE = 1000 # messages kept per channel in channel_data
+
+class Client:
+    """An IRC client using asyncio streams, with the same interface as ircbotframe.ircBot.
+    
+    The socket is read in large chunks and split into lines from a single buffer. PINGs are answered directly on the event loop, all other messages are passed to the bound callbacks on a dispatcher thread, in the order they arrived, so slow callbacks never delay the connection. say, send, and the other commands can be called from any thread. They only append to an output buffer, which is written to the socket once per event loop iteration, so lines sent in quick succession go out in a single write.
+    """
+    
+    def __init__(self, network, port, name, description, password=None, ssl=False):
+        self.network = network
+        self.port = port
+        self.nick = name
+        self.description = description
+        self.password = password
+        self.ssl = ssl
+        self.binds = {}
+        self.channel_data = {}
+        self.debug = False
+        self.log_own_messages = True
+        self.loop = None
+        self.writer = None
+        self.outbuf = collections.deque()
+        self.out_lock = threading.Lock()
+        self.flush_scheduled = False
+        self.stopped = False
+        self.dispatcher = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='wurstminebot IRC dispatcher')
+        self.stats = {
+            'linesRead': 0,
+            'linesWritten': 0,
+            'reads': 0,
+            'writes': 0
+        }
+    
+    def _debug_print(self, msg):
+        if self.debug:
+            core.debug_print('[irc] ' + msg)
+    
+    def _dispatch(self, msgtype, sender, headers, message):
+        if msgtype in ('ACTION', 'PRIVMSG') and len(headers):
+            self.log(headers[0], msgtype, sender, headers, message)
+        callback = self.binds.get(msgtype)
+        if callback is None:
+            return
+        try:
+            callback(sender, headers, message)
+        except Exception:
+            core.debug_print('Exception in ' + msgtype + ' callback:', exc_info=True)
+    
+    def _flush(self):
+        """Writes everything in the output buffer to the socket. Runs on the event loop."""
+        with self.out_lock:
+            self.flush_scheduled = False
+            if self.writer is None or not len(self.outbuf):
+                return
+            lines = list(self.outbuf)
+            self.outbuf.clear()
+        self.writer.write(b''.join(lines))
+        self.stats['linesWritten'] += len(lines)
+        self.stats['writes'] += 1
+    
+    def _process_line(self, line):
+        """Parses a line from the server. Runs on the event loop."""
+        if line.startswith(':'):
+            prefix, _, line = line[1:].partition(' ')
+        else:
+            prefix = ''
+        if ' :' in line:
+            line, _, message = line.partition(' :')
+        elif line.startswith(':'):
+            line, message = '', line[1:]
+        else:
+            message = ''
+        params = line.split()
+        if not len(params):
+            return
+        command = params[0].upper()
+        headers = params[1:]
+        sender = prefix.split('!', 1)[0]
+        if command == 'PING':
+            self._write_line('PONG :' + (message if message else ' '.join(headers)), urgent=True)
+            return
+        if command == '001' and len(headers):
+            self.nick = headers[0]
+        elif command == 'NICK' and sender == self.nick:
+            self.nick = message if message else headers[0]
+        elif command == 'JOIN' and sender == self.nick:
+            self.channel_data.setdefault(headers[0] if len(headers) else message, {'log': []})
+        elif command == 'PRIVMSG' and message.startswith('\x01'):
+            if not (message.startswith('\x01ACTION ') and message.endswith('\x01')):
+                return # other CTCP requests are ignored
+            command = 'ACTION'
+            message = message[len('\x01ACTION '):-1]
+        if '!' not in prefix:
+            self._debug_print('[' + command + '] ' + message)
+        self.dispatcher.submit(self._dispatch, command, sender, headers, message)
+    
+    def _write_line(self, line, urgent=False):
+        """Queues a raw line for sending. Can be called from any thread."""
+        data = line.replace('\r', ' ').replace('\n', ' ').encode('utf-8') + b'\r\n'
+        with self.out_lock:
+            if urgent:
+                self.outbuf.appendleft(data)
+            else:
+                self.outbuf.append(data)
+            if self.flush_scheduled or self.loop is None or self.loop.is_closed():
+                return
+            self.flush_scheduled = True
+        self.loop.call_soon_threadsafe(self._flush)
+    
+    def bind(self, msgtype, callback):
+        self.binds[msgtype] = callback
+    
+    def debugging(self, state):
+        self.debug = state
+    
+    def disconnect(self, message='bye'):
+        self._write_line('QUIT :' + message)
+    
+    def joinchan(self, channel):
+        self.channel_data.setdefault(channel, {'log': []})
+        self._write_line('JOIN ' + channel)
+    
+    def log(self, channel, msgtype, sender, headers, message):
+        if channel in self.channel_data:
+            channel_log = self.channel_data[channel].setdefault('log', [])
+            channel_log.append((msgtype, sender, headers, message))
+            if len(channel_log) > LOG_SIZE:
+                del channel_log[:len(channel_log) - LOG_SIZE]
+    
+    async def main(self):
+        """Connects to the server and processes messages until the connection is closed or stop is called."""
+        self.loop = asyncio.get_event_loop()
+        reader, writer = await asyncio.open_connection(self.network, self.port, ssl=ssl_module.create_default_context() if self.ssl else None, limit=2 ** 16)
+        with self.out_lock:
+            registration = []
+            if self.password:
+                registration.append('PASS ' + self.password)
+            registration += ['NICK ' + self.nick, 'USER ' + self.nick + ' 0 * :' + self.description]
+            self.outbuf.extendleft(reversed([line.encode('utf-8') + b'\r\n' for line in registration])) # lines queued before connecting go out after registration
+            self.writer = writer
+            self.flush_scheduled = False
+        self._flush()
+        buf = bytearray()
+        try:
+            while not self.stopped:
+                data = await reader.read(2 ** 16)
+                if not data:
+                    break
+                self.stats['reads'] += 1
+                buf += data
+                start = 0
+                while True:
+                    end = buf.find(b'\n', start)
+                    if end == -1:
+                        break
+                    line = buf[start:end].rstrip(b'\r').decode('utf-8', errors='replace')
+                    start = end + 1
+                    self.stats['linesRead'] += 1
+                    if len(line):
+                        self._process_line(line)
+                del buf[:start] # keep an incomplete line for the next read
+                await writer.drain()
+        finally:
+            with self.out_lock:
+                self.writer = None
+            writer.close()
+            self.dispatcher.shutdown(wait=False)
+            self._debug_print('disconnected from ' + self.network)
+    
+    def run(self):
+        """Runs the client on a new event loop in the calling thread, until it disconnects."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.main())
+        finally:
+            self.loop = None
+            loop.close()
+    
+    def say(self, recipient, message):
+        for line in message.splitlines():
+            if self.log_own_messages:
+                self.log(recipient, 'PRIVMSG', self.nick, [recipient], line)
+            self._write_line('PRIVMSG ' + recipient + ' :' + line)
+    
+    def send(self, message):
+        self._write_line(message)
+    
+    def status(self):
+        return dict(self.stats, connected=self.writer is not None, queued=len(self.outbuf))
+    
+    def stop(self):
+        self.stopped = True
+        with self.out_lock:
+            writer = self.writer
+            loop = self.loop
+        if writer is not None and loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(writer.close)
+    
+    def topic(self, channel, message):
+        self._write_line('TOPIC ' + channel + ' :' + message)
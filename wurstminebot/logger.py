@@ -0,0 +1,187 @@
+import atexit
+import collections
+from wurstminebot import core
+from datetime import datetime
+import os
+import os.path
+import sys
+import threading
+import time
+import traceback
+
+LEVELS = ['debug', 'info', 'warning', 'error']
+ROTATION_CHECK_INTERVAL = 1 # seconds between checks whether the log file has been moved away
+
+class Logger:
+    """Writes log messages to a file, or to stdout, on a background thread.
+    
+    log appends the message to a bounded in-memory queue and returns, so callers never wait for the disk. When the queue is full, new messages are dropped and counted. Messages below the level are discarded right away, and level None discards everything. Categories (the [name] prefix of a message, like [logpipe]) can be limited to a number of messages per second. Suppressed messages are counted and reported once the category is allowed again. Errors are never suppressed. The writer keeps a single file handle open, writes everything that is queued at once with a single flush, and reopens the file when it has been rotated or deleted.
+    """
+    
+    def __init__(self, path=None, level='debug', queue_size=10000, rate_limits={}):
+        """Optional arguments:
+        path -- The log file. Defaults to stdout.
+        level -- The lowest level that is written, one of LEVELS, or None to discard everything.
+        queue_size -- The maximum number of messages waiting to be written.
+        rate_limits -- A dict mapping categories to the number of messages per second allowed for them.
+        """
+        self.path = path
+        self.level = len(LEVELS) if level is None else LEVELS.index(level)
+        self.queue_size = queue_size
+        self.rate_limits = dict(rate_limits)
+        self.buckets = {} # category → (tokens left, time of the last refill)
+        self.suppressed = collections.Counter() # category → messages suppressed since the last one that was let through
+        self.condition = threading.Condition()
+        self.queue = collections.deque() # (time, level, message) tuples
+        self.file = None
+        self.config_stamp = None # the config_cache stamp of the config the level and rate limits were read from
+        self.last_rotation_check = time.monotonic()
+        self.pid = os.getpid()
+        self.stopped = False
+        self.stats = {
+            'dropped': 0,
+            'errors': 0,
+            'suppressed': 0,
+            'writes': 0,
+            'written': 0
+        }
+        self.thread = threading.Thread(target=self.work, name='wurstminebot logger', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop) # the writer is a daemon thread, so write what's left before exiting
+    
+    def _allow(self, category, now):
+        """Takes a token from the category's bucket, returns False if there is none left. Must be called with the condition held."""
+        rate = self.rate_limits[category]
+        tokens, last_refill = self.buckets.get(category, (rate, now))
+        tokens = min(rate, tokens + (now - last_refill) * rate)
+        if tokens < 1:
+            self.buckets[category] = tokens, now
+            return False
+        self.buckets[category] = tokens - 1, now
+        return True
+    
+    def _open(self):
+        """Returns the file to write to, reopening it if it has been rotated. Runs on the writer thread."""
+        if self.path is None:
+            return sys.stdout
+        if self.file is not None and time.monotonic() - self.last_rotation_check >= ROTATION_CHECK_INTERVAL:
+            self.last_rotation_check = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+                open_stat = os.fstat(self.file.fileno())
+                rotated = (stat.st_dev, stat.st_ino) != (open_stat.st_dev, open_stat.st_ino)
+            except (IOError, OSError):
+                rotated = True
+            if rotated:
+                self.file.close()
+                self.file = None
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.path, 'a', encoding='utf-8')
+        return self.file
+    
+    def configure(self, level='debug', rate_limits={}):
+        """Changes the level and rate limits of a running logger."""
+        with self.condition:
+            self.level = len(LEVELS) if level is None else LEVELS.index(level)
+            self.rate_limits = dict(rate_limits)
+    
+    def log(self, msg, level='debug', exc_info=False):
+        """Queues a message and returns right away. If exc_info is true, the traceback of the exception being handled is appended."""
+        level = LEVELS.index(level)
+        if level < self.level:
+            return
+        if exc_info:
+            msg += '\n' + traceback.format_exc().rstrip('\n')
+        now = time.monotonic()
+        category = msg[1:msg.find(']')] if msg.startswith('[') else None
+        with self.condition:
+            if self.stopped:
+                return
+            if category in self.rate_limits and level < LEVELS.index('error') and not self._allow(category, now):
+                self.suppressed[category] += 1
+                self.stats['suppressed'] += 1
+                return
+            if len(self.queue) >= self.queue_size:
+                self.stats['dropped'] += 1
+                return
+            if self.suppressed[category]:
+                self.queue.append((time.time(), LEVELS.index('warning'), '[{}] {} messages suppressed'.format(category, self.suppressed[category])))
+                del self.suppressed[category]
+            self.queue.append((time.time(), level, msg))
+            self.condition.notify()
+    
+    def status(self):
+        with self.condition:
+            return dict(self.stats, queued=len(self.queue))
+    
+    def stop(self):
+        """Writes the messages that are still queued, then stops the writer."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if threading.current_thread() is not self.thread:
+            self.thread.join(5)
+    
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.stopped and not len(self.queue):
+                    self.condition.wait()
+                batch = list(self.queue)
+                self.queue.clear()
+                stopped = self.stopped
+            if len(batch):
+                try:
+                    log_file = self._open()
+                    log_file.write(''.join(format_message(*message) for message in batch))
+                    log_file.flush()
+                    self.stats['writes'] += 1
+                    self.stats['written'] += len(batch)
+                except (IOError, OSError):
+                    self.stats['errors'] += 1
+            if stopped:
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+                return
+
+def format_message(timestamp, level, msg):
+    return LEVELS[level].upper() + '] ' + datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') + ' ' + msg + '\n'
+
+_logger_lock = threading.Lock()
+
+def logger():
+    """Returns the logger, creating it and starting its writer if necessary.
+    
+    When running as a daemon, messages go to wurstminebot.log in the logs directory, in debug mode to stdout. Otherwise, only messages at logging.level or above are written, and only if that level is configured explicitly. The level and rate limits are updated whenever the config file has changed, so debug mode can be turned on while the bot is running. A logger inherited from the parent process when daemonizing is replaced, since its writer thread doesn't survive the fork.
+    """
+    current = core.state.get('logger')
+    if current is not None and current.pid == os.getpid():
+        stamp = core.state['config_cache']['stamp']
+        if stamp != current.config_stamp:
+            current.config_stamp = stamp # before reading the config, which may log that it was reloaded
+            level, rate_limits = settings()
+            current.configure(level=level, rate_limits=rate_limits)
+        return current
+    stamp = core.state['config_cache']['stamp']
+    level, rate_limits = settings() # may log the config being loaded, which creates the logger below
+    if core.state.get('is_daemon', False):
+        path = os.path.join(core.config('paths').get('logs', '/opt/wurstmineberg/log'), 'wurstminebot.log')
+    else:
+        path = None
+    with _logger_lock:
+        current = core.state.get('logger')
+        if current is None or current.pid != os.getpid():
+            core.state['logger'] = Logger(path, level=level, queue_size=core.config('logging').get('queueSize', 10000), rate_limits=rate_limits)
+            core.state['logger'].config_stamp = stamp
+        return core.state['logger']
+
+def settings():
+    """Returns the level and rate limits from the config, as a tuple."""
+    logging_config = core.config('logging')
+    if core.state.get('is_daemon', False) or core.config('debug', False):
+        level = logging_config.get('level', 'debug')
+    else:
+        level = logging_config.get('level')
+    return level, logging_config.get('rateLimits', {})
@@ -0,0 +1,148 @@
+from wurstminebot import core
+from datetime import datetime
+import json
+import os
+import os.path
+import threading
+from datetime import timezone
+
+class LoginsIndex:
+    """A summary of logins.log, kept in a JSON file next to the log.
+    
+    For each Wurstmineberg ID, the index stores when the person was first and last seen and how many sessions they have had. Lines appended to the log by other programs (like the server's stop and restart scripts) are picked up incrementally by byte offset. If the sidecar is missing, unreadable, or belongs to a different or truncated log file, it is rebuilt from the whole log.
+    """
+    
+    def __init__(self, log_path, index_path=None):
+        self.log_path = log_path
+        self.index_path = log_path + '.index.json' if index_path is None else index_path
+        self.lock = threading.Lock()
+        self.data = None
+    
+    def _empty(self, inode=None):
+        return {
+            'inode': inode,
+            'offset': 0,
+            'online': {},
+            'people': {}
+        }
+    
+    def _load(self):
+        try:
+            with open(self.index_path) as index_file:
+                self.data = json.load(index_file)
+        except (IOError, OSError, ValueError):
+            self.data = None
+        if not isinstance(self.data, dict) or any(key not in self.data for key in ('inode', 'offset', 'online', 'people')):
+            self.data = self._empty()
+    
+    def _save(self):
+        with open(self.index_path + '.tmp', 'w') as index_file:
+            json.dump(self.data, index_file, sort_keys=True, indent=4, separators=(',', ': '))
+        os.replace(self.index_path + '.tmp', self.index_path)
+    
+    def _process_line(self, line):
+        fields = line.split(' ', 4)
+        if len(fields) < 3:
+            return # malformed line
+        timestamp = fields[0] + ' ' + fields[1]
+        person_id = fields[2]
+        if person_id.startswith('@'):
+            # server event (stop, restart, update…), everyone who was online has left
+            for online_id in self.data['online']:
+                self.data['people'][online_id]['lastSeen'] = max(self.data['people'][online_id]['lastSeen'], timestamp)
+            self.data['online'] = {}
+            return
+        if person_id == '?' or len(fields) < 4:
+            return # player not in people.json, or malformed line
+        event = fields[3]
+        person = self.data['people'].setdefault(person_id, {
+            'firstSeen': timestamp,
+            'sessions': 0
+        })
+        person['lastSeen'] = max(person.get('lastSeen', timestamp), timestamp)
+        if event == 'joined':
+            person['sessions'] += 1
+            self.data['online'][person_id] = timestamp
+        elif event == 'left':
+            self.data['online'].pop(person_id, None)
+    
+    def _update(self):
+        """Brings the index up to date with the log. Must be called with the lock held."""
+        if self.data is None:
+            self._load()
+        try:
+            log = open(self.log_path, 'rb')
+        except (IOError, OSError):
+            return # no logins yet
+        with log:
+            stat = os.fstat(log.fileno())
+            inode = [stat.st_dev, stat.st_ino]
+            if self.data['inode'] != inode or stat.st_size < self.data['offset']:
+                core.debug_print('[logins] rebuilding index for ' + self.log_path)
+                self.data = self._empty(inode=inode)
+            if stat.st_size == self.data['offset']:
+                return
+            log.seek(self.data['offset'])
+            data = log.read()
+        complete = data.rfind(b'\n') + 1 # a line that is still being written is read on the next update
+        if complete == 0:
+            return
+        for line in data[:complete].decode('utf-8', errors='replace').splitlines():
+            self._process_line(line)
+        self.data['offset'] += complete
+        self._save()
+    
+    def first_seen(self, person_id):
+        """Returns the time of the person's first login as an aware datetime in UTC, or None if they have never logged in."""
+        return self.person_info(person_id).get('firstSeen')
+    
+    def last_seen(self, person_id):
+        """Returns the time of the person's latest join or leave as an aware datetime in UTC, or None if they have never logged in."""
+        return self.person_info(person_id).get('lastSeen')
+    
+    def person_info(self, person_id):
+        """Returns a dict with the keys firstSeen, lastSeen, and sessions for the person, or an empty dict if they have never logged in."""
+        with self.lock:
+            self._update()
+            info = self.data['people'].get(person_id)
+        if info is None:
+            return {}
+        return {
+            'firstSeen': datetime.strptime(info['firstSeen'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc),
+            'lastSeen': datetime.strptime(info['lastSeen'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc),
+            'sessions': info['sessions']
+        }
+    
+    def record(self, person_id, joined, player):
+        """Appends a join or leave to the log and updates the index.
+        
+        Required arguments:
+        person_id -- The Wurstmineberg ID of the player, or None if they are not in people.json.
+        joined -- True for a join, False for a leave.
+        player -- The player's Minecraft username.
+        """
+        with self.lock:
+            self._update()
+            with open(self.log_path, 'a') as loginslog:
+                print(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), ('?' if person_id is None else person_id), ('joined' if joined else 'left'), player, file=loginslog) # logs in UTC
+            self._update()
+    
+    def seen(self, person_id):
+        """Returns True if the person has logged in before."""
+        with self.lock:
+            self._update()
+            return person_id in self.data['people']
+
+_logins_index = None
+_logins_index_lock = threading.Lock()
+
+def logins_index():
+    """Returns the LoginsIndex for the logins.log in the configured logs directory, or None if no logs directory is configured."""
+    global _logins_index
+    if 'logs' not in core.config('paths'):
+        return None
+    log_path = os.path.join(core.config('paths')['logs'], 'logins.log')
+    with _logins_index_lock:
+        if _logins_index is None or _logins_index.log_path != log_path:
+            _logins_index = LoginsIndex(log_path)
+        return _logins_index
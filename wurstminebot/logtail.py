@@ -0,0 +1,226 @@
+import ctypes
+import ctypes.util
+import os
+import os.path
+import select
+import struct
+import threading
+import time
+
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_inotify_event = struct.Struct('iIII')
+
+class LogTail:
+    """Follows a growing log file, returning only the lines appended since the last read.
+    
+    The tail remembers the byte offset and inode of the file it has open, so each read only touches newly written bytes. An incomplete trailing line is held back until its newline arrives. If the path is replaced by a new file (log rotation) or the file shrinks (truncation), the tail starts over at the beginning of the new contents.
+    """
+    
+    def __init__(self, path, from_end=True, encoding='utf-8'):
+        """Optional arguments:
+        from_end -- If true (the default), lines that already exist in the file when the tail is created are skipped. Lines appearing in a rotated or newly created file are always read from the beginning.
+        encoding -- The encoding used to decode lines. Undecodable bytes are replaced.
+        """
+        self.path = path
+        self.encoding = encoding
+        self.file = None
+        self.inode = None
+        self.offset = 0
+        self.partial = b''
+        try:
+            self._open(skip_existing=from_end)
+        except (IOError, OSError):
+            pass # the file will be opened from the start once it exists
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _open(self, skip_existing=False):
+        self.close()
+        self.file = open(self.path, 'rb')
+        stat = os.fstat(self.file.fileno())
+        self.inode = stat.st_dev, stat.st_ino
+        self.offset = 0
+        self.partial = b''
+        if skip_existing and stat.st_size > 0:
+            # skip everything up to the last newline, so a line that is still being written is yielded once it's complete
+            block_start = max(0, stat.st_size - 65536)
+            self.file.seek(block_start)
+            last_newline = self.file.read(stat.st_size - block_start).rfind(b'\n')
+            self.offset = stat.st_size if last_newline == -1 else block_start + last_newline + 1
+        self.file.seek(self.offset)
+    
+    def _read_available(self):
+        data = self.file.read()
+        self.offset += len(data)
+        if not data:
+            return []
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        return [line.rstrip(b'\r').decode(self.encoding, errors='replace') for line in lines]
+    
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+    
+    def read_lines(self):
+        """Returns a list of the complete lines appended to the file since the last call.
+        
+        Raises IOError or OSError if the file does not exist or can't be read.
+        """
+        if self.file is None:
+            self._open()
+        stat = os.stat(self.path)
+        lines = []
+        if (stat.st_dev, stat.st_ino) != self.inode:
+            # log has been rotated, finish reading the old file before switching
+            lines += self._read_available()
+            self._open()
+        elif stat.st_size < self.offset:
+            # log has been truncated
+            self.file.seek(0)
+            self.offset = 0
+            self.partial = b''
+        return lines + self._read_available()
+
+class PollWatcher:
+    """Waits for changes to a file by sleeping for a fixed interval."""
+    
+    backend = 'poll'
+    
+    def __init__(self, path, interval=0.5):
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+    
+    def close(self):
+        self.stop()
+    
+    def stop(self):
+        """Makes wait return False, interrupting it if it's blocking. Can be called from any thread."""
+        self.stopped.set()
+    
+    def wait(self):
+        """Blocks until the file may have changed. Returns False if the watcher has been stopped or closed."""
+        return not self.stopped.wait(self.interval)
+
+class InotifyWatcher:
+    """Waits for changes to a file using Linux inotify.
+    
+    The directory containing the file is watched rather than the file itself, so the watcher keeps working when the file is rotated, deleted, or created. wait() only returns early for events concerning the watched file name or when stop is called, and otherwise returns after interval seconds so the caller can check whether it should stop.
+    """
+    
+    backend = 'inotify'
+    mask = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    
+    def __init__(self, path, interval=0.5):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('libc not found')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError('inotify is not supported on this system')
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.name = os.fsencode(os.path.basename(path))
+        self.interval = interval
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.wake_read, self.wake_write = os.pipe() # written to by stop to interrupt select
+        self.stopped = False
+        self.wd = None
+        self._add_watch()
+    
+    def _add_watch(self):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(self.directory), self.mask)
+        self.wd = None if wd < 0 else wd
+    
+    def _read_events(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+        relevant = False
+        offset = 0
+        while offset + _inotify_event.size <= len(data):
+            wd, mask, cookie, name_length = _inotify_event.unpack_from(data, offset)
+            offset += _inotify_event.size
+            name = data[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+            if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                self.wd = None # the directory itself is gone, rewatch on the next wait
+                relevant = True
+            elif mask & IN_Q_OVERFLOW or name == self.name:
+                relevant = True
+        return relevant
+    
+    def close(self):
+        """Closes the inotify file descriptor. Must not be called while another thread is in wait, call stop and wait for it to return first."""
+        self.stopped = True
+        if self.fd is not None:
+            os.close(self.fd)
+            os.close(self.wake_read)
+            os.close(self.wake_write)
+            self.fd = None
+    
+    def stop(self):
+        """Makes wait return False, interrupting it if it's blocking. Can be called from any thread."""
+        self.stopped = True
+        try:
+            os.write(self.wake_write, b'\0')
+        except OSError:
+            pass # already closed
+    
+    def wait(self):
+        """Blocks until the file has changed or interval seconds have passed. Returns False if the watcher has been stopped or closed."""
+        if self.fd is None or self.stopped:
+            return False
+        if self.wd is None:
+            self._add_watch()
+            if self.wd is None: # directory doesn't exist (yet)
+                select.select([self.wake_read], [], [], self.interval)
+                return not self.stopped
+        deadline = time.monotonic() + self.interval
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            readable, _, _ = select.select([self.fd, self.wake_read], [], [], remaining)
+            if self.stopped:
+                return False
+            if readable and self._read_events():
+                return True
+
+def watcher(path, backend='auto', interval=0.5):
+    """Returns an object whose wait method blocks until the file at path may have changed.
+    
+    Optional arguments:
+    backend -- 'inotify', 'poll', or 'auto' (the default), which uses inotify if it's available and falls back to polling.
+    interval -- For the poll backend, the time in seconds between checks. For inotify, the longest time wait blocks without an event.
+    """
+    if backend in ('auto', 'inotify'):
+        try:
+            return InotifyWatcher(path, interval=interval)
+        except (AttributeError, OSError):
+            if backend == 'inotify':
+                raise
+    elif backend != 'poll':
+        raise ValueError('unknown log watcher backend: ' + str(backend))
+    return PollWatcher(path, interval=interval)
@@ -6,42 +6,59 @@ from datetime import datetime
 from wurstminebot import deaths
 import json
 import lazyjson
+from wurstminebot import logins
+from wurstminebot import logtail
 import minecraft
 import loops
 from wurstminebot import nicksub
 import os.path
+from wurstminebot import outbox
 import random
+from wurstminebot import rcon
 import re
-import socket
 import threading
 import time
 from datetime import timedelta
 from datetime import timezone
-import traceback
+from wurstminebot import tweets
+from wurstminebot import web
+
+log_line_regex = re.compile('(?:' + minecraft.regexes.timestamp + '|' + minecraft.regexes.full_timestamp + ') \\[Server thread/INFO\\]: (?:'
+    + '(?P<achievement_player>' + minecraft.regexes.player + ') has just earned the achievement \\[(?P<achievement>.+)\\]$'
+    + '|\\* (?P<action_player>' + minecraft.regexes.player + ') (?P<action>.*)'
+    + '|<(?P<chat_message_player>' + minecraft.regexes.player + ')> (?P<chat_message>.*)'
+    + '|(?P<join_leave_player>' + minecraft.regexes.player + ') (?P<join_leave>left|joined) the game'
+    + ')') # the alternatives are tried in order, like the separate patterns they replace
+
+def classify_log_line(log_line):
+    """Returns a tuple (match_type, match) for a line from the server log.
+    
+    match_type is one of 'achievement', 'action', 'chat_message', or 'join_leave', or None if the line is none of these, in which case match is also None. The player is in the match group named match_type + '_player', the achievement name, message, or 'joined'/'left' in the group named match_type.
+    """
+    match = log_line_regex.match(log_line)
+    if match is None:
+        return None, None
+    return match.lastgroup, match # each alternative ends with the group named after its type
 
 class InputLoop(loops.Loop):
     def iterable(self):
-        timeout = 0.5
         error_timeout = 10
-        logpath = os.path.join(core.config('paths')['minecraft_server'], 'logs', 'latest.log')
+        logpath, watcher = watch_log()
         try:
-            with open(logpath) as log:
-                lines_read = len(list(log.read().split('\n'))) - 1 # don't yield lines that already existed
-        except (IOError, OSError):
-            lines_read = 0
-        while not self.stopped:
-            time.sleep(timeout)
-            try:
-                with open(logpath) as log:
-                    lines = log.read().split('\n')
-                    if len(lines) <= lines_read: # log has restarted
-                        lines_read = 0
-                    for line in lines[lines_read:-1]:
-                        lines_read += 1
+            with logtail.LogTail(logpath) as log: # don't yield lines that already existed
+                while not self.stopped:
+                    if not watcher.wait():
+                        break
+                    try:
+                        lines = log.read_lines()
+                    except (IOError, OSError):
+                        core.debug_print('Log does not exist, retrying in {} seconds'.format(error_timeout))
+                        time.sleep(error_timeout)
+                        continue
+                    for line in lines:
                         yield line
-            except (IOError, OSError):
-                core.debug_print('Log does not exist, retrying in {} seconds'.format(error_timeout))
-                time.sleep(error_timeout)
+        finally:
+            watcher.close()
     
     @staticmethod
     def process_value(value):
@@ -49,254 +66,233 @@ class InputLoop(loops.Loop):
         try:
             # server log output processing
             core.debug_print('[logpipe] ' + log_line)
-            match_prefix = '(' + minecraft.regexes.timestamp + '|' + minecraft.regexes.full_timestamp + ') \\[Server thread/INFO\\]: '
-            matches = {
-                'achievement': '(' + minecraft.regexes.player + ') has just earned the achievement \\[(.+)\\]$',
-                'action': '\\* (' + minecraft.regexes.player + ') (.*)',
-                'chat_message': '<(' + minecraft.regexes.player + ')> (.*)',
-                'join_leave': '(' + minecraft.regexes.player + ') (left|joined) the game'
-            }
-            for match_type, match_string in matches.items():
-                match = re.match(match_prefix + match_string, log_line)
-                if not match:
-                    continue
-                if match_type == 'achievement':
-                    player, achievement = match.group(2, 3)
-                    person = nicksub.person_or_dummy(player, context='minecraft')
-                    if core.state['achievement_tweets']:
-                        twitter_nick = person.nick('twitter', twitter_at_prefix=True)
-                        status = '[Achievement Get] ' + twitter_nick + ' got ' + achievement
-                        try:
-                            twid = core.tweet(status)
-                        except core.TwitterError as e:
-                            twid = 'error ' + str(e.status_code) + ': ' + str(e)
-                        except AttributeError:
-                            twid = 'Twitter is not configured'
-                        else:
-                            twid = 'https://twitter.com/wurstmineberg/status/' + str(twid)
+            match_type, match = classify_log_line(log_line)
+            if match_type == 'achievement':
+                player, achievement = match.group('achievement_player', 'achievement')
+                person = nicksub.person_or_dummy(player, context='minecraft')
+                if core.state['achievement_tweets']:
+                    twitter_nick = person.nick('twitter', twitter_at_prefix=True)
+                    status = '[Achievement Get] ' + twitter_nick + ' got ' + achievement
+                    if core.twitter is None:
+                        twid = 'Twitter is not configured'
                     else:
-                        twid = 'achievement tweets are disabled'
-                    irc_config = core.config('irc')
-                    if 'main_channel' in irc_config:
-                        core.state['bot'].say(irc_config['main_channel'], 'Achievement Get: ' + person.irc_nick() + ' got ' + achievement + ' [' + twid + ']')
-                elif match_type == 'action':
+                        outbox.outbox().put(status, kind='achievement', info={'nick': person.irc_nick()}) # the tweet URL is announced when it has been posted
+                        twid = None
+                else:
+                    twid = 'achievement tweets are disabled'
+                irc_config = core.config('irc')
+                if 'main_channel' in irc_config:
+                    core.state['bot'].say(irc_config['main_channel'], 'Achievement Get: ' + person.irc_nick() + ' got ' + achievement + ('' if twid is None else ' [' + twid + ']'))
+            elif match_type == 'action':
+                irc_config = core.config('irc')
+                if 'main_channel' in irc_config:
+                    player, message = match.group('action_player', 'action')
+                    sender_person = nicksub.person_or_dummy(player, context='minecraft')
+                    sender = sender_person.irc_nick()
+                    subbed_message = nicksub.textsub(message, 'minecraft', 'irc')
+                    core.state['bot'].log(irc_config['main_channel'], 'ACTION', sender, [irc_config['main_channel']], subbed_message)
+                    core.state['bot'].say(irc_config['main_channel'], '* ' + sender + ' ' + subbed_message)
+            elif match_type == 'chat_message':
+                player, message = match.group('chat_message_player', 'chat_message')
+                sender_person = nicksub.person_or_dummy(player, context='minecraft')
+                if re.match('![A-Za-z]', message): # command
+                    cmd = message[1:].split(' ')
+                    if commands.run(cmd, sender=sender_person, context='minecraft', return_exits=True):
+                        core.debug_print('Exit in ' + str(cmd[0]) + ' command from ' + str(player) + ' to in-game chat')
+                        core.cleanup()
+                        sys.exit()
+                elif re.match('https?://bugs\\.mojang\\.com/browse/[A-Z]+-[0-9]+', message): # Mojira ticket
                     irc_config = core.config('irc')
                     if 'main_channel' in irc_config:
-                        player, message = match.group(2, 3)
-                        sender_person = nicksub.person_or_dummy(player, context='minecraft')
                         sender = sender_person.irc_nick()
                         subbed_message = nicksub.textsub(message, 'minecraft', 'irc')
-                        core.state['bot'].log(irc_config['main_channel'], 'ACTION', sender, [irc_config['main_channel']], subbed_message)
-                        core.state['bot'].say(irc_config['main_channel'], '* ' + sender + ' ' + subbed_message)
-                elif match_type == 'chat_message':
-                    player, message = match.group(2, 3)
-                    sender_person = nicksub.person_or_dummy(player, context='minecraft')
-                    if re.match('![A-Za-z]', message): # command
-                        cmd = message[1:].split(' ')
-                        if commands.run(cmd, sender=sender_person, context='minecraft', return_exits=True):
-                            core.debug_print('Exit in ' + str(cmd[0]) + ' command from ' + str(player) + ' to in-game chat')
-                            core.cleanup()
-                            sys.exit()
-                    elif re.match('https?://bugs\\.mojang\\.com/browse/[A-Z]+-[0-9]+', message): # Mojira ticket
-                        irc_config = core.config('irc')
-                        if 'main_channel' in irc_config:
-                            sender = sender_person.irc_nick()
-                            subbed_message = nicksub.textsub(message, 'minecraft', 'irc')
-                            core.state['bot'].log(irc_config['main_channel'], 'PRIVMSG', sender, [irc_config['main_channel']], subbed_message)
-                            core.state['bot'].say(irc_config['main_channel'], '<' + sender + '> ' + subbed_message)
+                        core.state['bot'].log(irc_config['main_channel'], 'PRIVMSG', sender, [irc_config['main_channel']], subbed_message)
+                        core.state['bot'].say(irc_config['main_channel'], '<' + sender + '> ' + subbed_message)
+                    def paste_mojira_ticket(): # runs on the HTTP worker pool, so a slow Mojira doesn't hold up log processing
                         try:
                             match = re.match('https?://(mojang\\.atlassian\\.net|bugs\\.mojang\\.com)/browse/([A-Z]+)-([0-9]+)', message)
                             project = match.group(2)
                             issue_id = int(match.group(3))
+                            ticket = core.fetch_mojira(project, issue_id)
                             if 'main_channel' in irc_config:
-                                core.state['bot'].say(irc_config['main_channel'], core.paste_mojira(project, issue_id))
-                            minecraft.tellraw(core.paste_mojira(project, issue_id, tellraw=True))
-                        except SystemExit:
-                            core.debug_print('Exit while pasting mojira ticket')
-                            core.cleanup()
-                            raise
+                                core.state['bot'].say(irc_config['main_channel'], core.format_mojira(ticket))
+                            core.tellraw(core.format_mojira(ticket, tellraw=True))
                         except Exception as e:
-                            minecraft.tellraw({
+                            core.tellraw({
                                 'text': 'Error pasting mojira ticket: ' + str(e),
                                 'color': 'red'
                             })
-                            core.debug_print('Exception while pasting mojira ticket:')
-                            if core.config('debug', False) or core.state.get('is_daemon', False):
-                                traceback.print_exc(file=sys.stdout)
-                    elif re.match('https?://twitter\\.com/[0-9A-Z_a-z]+/status/[0-9]+$', message): # tweet
-                        irc_config = core.config('irc')
-                        if 'main_channel' in irc_config:
-                            sender = sender_person.irc_nick()
-                            subbed_message = nicksub.textsub(message, 'minecraft', 'irc')
-                            core.state['bot'].log(irc_config['main_channel'], 'PRIVMSG', sender, [irc_config['main_channel']], subbed_message)
-                            core.state['bot'].say(irc_config['main_channel'], '<' + sender + '> ' + subbed_message)
-                        try:
-                            twid = re.match('https?://twitter\\.com/[0-9A-Z_a-z]+/status/([0-9]+)$', message).group(1)
-                            minecraft.tellraw(core.paste_tweet(twid, link=False, tellraw=True))
-                            if 'main_channel' in irc_config:
-                                pasted_tweet_irc = core.paste_tweet(twid, link=False, tellraw=False)
-                                for line in pasted_tweet_irc.splitlines():
-                                    core.state['bot'].say(irc_config['main_channel'], line)
-                        except SystemExit:
-                            core.debug_print('Exit while pasting tweet')
-                            core.cleanup()
-                            raise
-                        except core.TwitterError as e:
-                            minecraft.tellraw({
-                                'text': 'Error ' + str(e.status_code) + ' while pasting tweet: ' + str(e),
-                                'color': 'red'
-                            })
-                            core.debug_print('TwitterError ' + str(e.status_code) + ' while pasting tweet:')
-                            core.debug_print(json.dumps(e.errors, sort_keys=True, indent=4, separators=(',', ': ')))
-                        except AttributeError:
-                            core.debug_print('Tried to paste a tweet from in-game chat, but Twitter is not configured')
-                        except Exception as e:
-                            minecraft.tellraw({
-                                'text': 'Error while pasting tweet: ' + str(e),
-                                'color': 'red'
-                            })
-                            core.debug_print('Exception while pasting tweet:')
-                            if core.config('debug', False) or core.state.get('is_daemon', False):
-                                traceback.print_exc(file=sys.stdout)
-                    else: # chat message
-                        irc_config = core.config('irc')
-                        if 'main_channel' in irc_config:
-                            sender = sender_person.irc_nick()
-                            subbed_message = nicksub.textsub(message, 'minecraft', 'irc')
-                            core.state['bot'].log(irc_config['main_channel'], 'PRIVMSG', sender, [irc_config['main_channel']], subbed_message)
-                            core.state['bot'].say(irc_config['main_channel'], '<' + sender + '> ' + subbed_message)
-                elif match_type == 'join_leave':
-                    player = match.group(2)
+                            core.debug_print('Exception while pasting mojira ticket:', exc_info=True)
+                    
+                    web.submit(paste_mojira_ticket)
+                elif re.match('https?://twitter\\.com/[0-9A-Z_a-z]+/status/[0-9]+$', message): # tweet
+                    irc_config = core.config('irc')
+                    if 'main_channel' in irc_config:
+                        sender = sender_person.irc_nick()
+                        subbed_message = nicksub.textsub(message, 'minecraft', 'irc')
+                        core.state['bot'].log(irc_config['main_channel'], 'PRIVMSG', sender, [irc_config['main_channel']], subbed_message)
+                        core.state['bot'].say(irc_config['main_channel'], '<' + sender + '> ' + subbed_message)
                     try:
-                        person = nicksub.Person(player, context='minecraft')
-                    except nicksub.PersonNotFoundError:
-                        person = None
-                    joined = bool(match.group(3) == 'joined')
-                    if person is None:
-                        unknown_player = True
+                        twid = re.match('https?://twitter\\.com/[0-9A-Z_a-z]+/status/([0-9]+)$', message).group(1)
+                        tweet = core.fetch_tweet(twid)
+                        core.tellraw(core.format_tweet(tweet, link=False, tellraw=True))
+                        if 'main_channel' in irc_config:
+                            pasted_tweet_irc = core.format_tweet(tweet, link=False, tellraw=False)
+                            for line in pasted_tweet_irc.splitlines():
+                                core.state['bot'].say(irc_config['main_channel'], line)
+                    except SystemExit:
+                        core.debug_print('Exit while pasting tweet')
+                        core.cleanup()
+                        raise
+                    except core.TwitterError as e:
+                        core.tellraw({
+                            'text': 'Error ' + str(e.status_code) + ' while pasting tweet: ' + str(e),
+                            'color': 'red'
+                        })
+                        core.debug_print('TwitterError ' + str(e.status_code) + ' while pasting tweet:')
+                        core.debug_print(json.dumps(e.errors, sort_keys=True, indent=4, separators=(',', ': ')))
+                    except AttributeError:
+                        core.debug_print('Tried to paste a tweet from in-game chat, but Twitter is not configured')
+                    except Exception as e:
+                        core.tellraw({
+                            'text': 'Error while pasting tweet: ' + str(e),
+                            'color': 'red'
+                        })
+                        core.debug_print('Exception while pasting tweet:', exc_info=True)
+                else: # chat message
+                    irc_config = core.config('irc')
+                    if 'main_channel' in irc_config:
+                        sender = sender_person.irc_nick()
+                        subbed_message = nicksub.textsub(message, 'minecraft', 'irc')
+                        core.state['bot'].log(irc_config['main_channel'], 'PRIVMSG', sender, [irc_config['main_channel']], subbed_message)
+                        core.state['bot'].say(irc_config['main_channel'], '<' + sender + '> ' + subbed_message)
+            elif match_type == 'join_leave':
+                player = match.group('join_leave_player')
+                try:
+                    person = nicksub.Person(player, context='minecraft')
+                except nicksub.PersonNotFoundError:
+                    person = None
+                joined = bool(match.group('join_leave') == 'joined')
+                core.update_presence(player, joined)
+                logins_index = logins.logins_index() # None if no logs directory is configured
+                if person is None:
+                    unknown_player = True
+                else:
+                    unknown_player = False
+                    new_player = logins_index is not None and not logins_index.seen(person.id)
+                if logins_index is not None:
+                    logins_index.record(None if person is None else person.id, joined, player)
+                if joined:
+                    if unknown_player:
+                        welcome_message = (0, 3) # The “you're not in the database” message
+                    elif new_player:
+                        welcome_message = (0, 2) # The “welcome to the server” message
                     else:
-                        unknown_player = False
-                        with open(os.path.join(core.config('paths')['logs'], 'logins.log')) as loginslog:
-                            for line in loginslog:
-                                if person.id in line:
-                                    new_player = False
-                                    break
+                        welcome_messages = {}
+                        if person.description is None:
+                            welcome_messages[0, 1] = 1.0 # The “you still don't have a description” welcome message
+                        for index, adv_welcome_msg in enumerate(core.config('commentLines').get('serverJoin', [])):
+                            if 'text' not in adv_welcome_msg:
+                                continue
+                            welcome_messages[2, index] = adv_welcome_msg.get('weight', 1.0) * adv_welcome_msg.get('personWeights', {}).get(person.id, adv_welcome_msg.get('personWeights', {}).get('@default', 1.0))
+                        random_index = random.uniform(0.0, sum(welcome_messages.values()))
+                        index = 0.0
+                        for welcome_message, weight in welcome_messages.items():
+                            if random_index - index < weight:
+                                break
                             else:
-                                new_player = True
-                    with open(os.path.join(core.config('paths')['logs'], 'logins.log'), 'a') as loginslog:
-                        print(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), ('?' if person is None else person.id), ('joined' if joined else 'left'), player, file=loginslog) # logs in UTC
-                    if joined:
-                        if unknown_player:
-                            welcome_message = (0, 3) # The “you're not in the database” message
-                        elif new_player:
-                            welcome_message = (0, 2) # The “welcome to the server” message
+                                index += weight
                         else:
-                            welcome_messages = {}
-                            if person.description is None:
-                                welcome_messages[0, 1] = 1.0 # The “you still don't have a description” welcome message
-                            for index, adv_welcome_msg in enumerate(core.config('commentLines').get('serverJoin', [])):
-                                if 'text' not in adv_welcome_msg:
-                                    continue
-                                welcome_messages[2, index] = adv_welcome_msg.get('weight', 1.0) * adv_welcome_msg.get('personWeights', {}).get(person.id, adv_welcome_msg.get('personWeights', {}).get('@default', 1.0))
-                            random_index = random.uniform(0.0, sum(welcome_messages.values()))
-                            index = 0.0
-                            for welcome_message, weight in welcome_messages.items():
-                                if random_index - index < weight:
-                                    break
-                                else:
-                                    index += weight
-                            else:
-                                welcome_message = (0, 0) # The “um… sup?” welcome message
-                        if welcome_message == (0, 0):
-                            minecraft.tellraw({
-                                'text': 'Hello ' + player + '. Um... sup?',
+                            welcome_message = (0, 0) # The “um… sup?” welcome message
+                    if welcome_message == (0, 0):
+                        core.tellraw({
+                            'text': 'Hello ' + player + '. Um... sup?',
+                            'color': 'gray'
+                        }, player)
+                        welcome_message_stub = 'Um... sup?'
+                    elif welcome_message == (0, 1):
+                        core.tellraw([
+                            {
+                                'text': 'Hello ' + player + ". You still don't have a description for ",
                                 'color': 'gray'
-                            }, player)
-                            welcome_message_stub = 'Um... sup?'
-                        elif welcome_message == (0, 1):
-                            minecraft.tellraw([
-                                {
-                                    'text': 'Hello ' + player + ". You still don't have a description for ",
-                                    'color': 'gray'
-                                },
-                                {
-                                    'text': 'the people page',
-                                    'hoverEvent': {
-                                        'action': 'show_text',
-                                        'value': 'http://wurstmineberg.de/people'
-                                    },
-                                    'clickEvent': {
-                                        'action': 'open_url',
-                                        'value': 'http://wurstmineberg.de/people'
-                                    },
-                                    'color': 'gray'
+                            },
+                            {
+                                'text': 'the people page',
+                                'hoverEvent': {
+                                    'action': 'show_text',
+                                    'value': 'http://wurstmineberg.de/people'
                                 },
-                                {
-                                    'text': '. ',
-                                    'color': 'gray'
+                                'clickEvent': {
+                                    'action': 'open_url',
+                                    'value': 'http://wurstmineberg.de/people'
                                 },
-                                {
-                                    'text': 'Write one today',
-                                    'clickEvent': {
-                                        'action': 'suggest_command',
-                                        'value': '!People ' + person.id + ' description '
-                                    },
-                                    'color': 'gray'
+                                'color': 'gray'
+                            },
+                            {
+                                'text': '. ',
+                                'color': 'gray'
+                            },
+                            {
+                                'text': 'Write one today',
+                                'clickEvent': {
+                                    'action': 'suggest_command',
+                                    'value': '!People ' + person.id + ' description '
                                 },
-                                {
-                                    'text': '!',
-                                    'color': 'gray'
-                                }
-                            ], player)
-                            welcome_message_stub = "You still don't have a description […]"
-                        elif welcome_message == (0, 2):
-                            minecraft.tellraw({
-                                'text': 'Hello ' + player + '. Welcome to the server!',
                                 'color': 'gray'
-                            }, player)
-                            welcome_message_stub = 'Welcome to the server!'
-                        elif welcome_message == (0, 3):
-                            minecraft.tellraw({
-                                'color': 'gray',
-                                'text': 'Hello ' + player + '. Do I know you?'
-                            }, player)
-                            welcome_message_stub = 'Do I know you?'
-                        elif welcome_message[0] == 2: # regular comment lines (formerly known as advanced comment lines)
-                            message_dict = core.config('commentLines')['serverJoin'][welcome_message[1]]
-                            message_list = message_dict['text']
-                            if isinstance(message_list, str):
-                                message_list = [{'text': message_list, 'color': message_dict.get('commentColor', message_dict.get('color', 'gray'))}]
-                            elif isinstance(message_list, dict) or isinstance(message_list, lazyjson.Dict):
-                                message_list = [message_list]
-                            prefix_list = []
-                            if 'prefix' in message_dict:
-                                prefix_list = message_dict['prefix']
-                                if isinstance(prefix_list, str):
-                                    prefix_list = [{'text': prefix_list, 'color': message_dict.get('prefixColor', message_dict.get('color', 'gray'))}]
-                                elif isinstance(prefix_list, dict) or isinstance(prefix_list, lazyjson.Dict):
-                                    prefix_list = [prefix_list]
-                            minecraft.tellraw(prefix_list + ([
-                                {
-                                    'text': 'Hello ' + player + '. ',
-                                    'color': message_dict.get('helloColor', message_dict.get('color', 'gray'))
-                                }
-                            ] if message_dict.get('helloPrefix', True) else []) + message_list, player)
-                            if len(message_list) and 'text' in message_list[0]:
-                                welcome_message_stub = (message_list[0]['text'][:80] if len(message_list[0]['text']) > 80 else message_list[0]['text']) + (' […]' if len(message_list[0]['text']) > 80 or len(message_list) > 1 else '')
-                            else:
-                                welcome_message_stub = '[…]'
-                        else:
-                            minecraft.tellraw({
-                                'text': 'Hello ' + player + '. How did you do that?',
+                            },
+                            {
+                                'text': '!',
                                 'color': 'gray'
-                            }, player)
-                            welcome_message_stub = 'How did you do that?'
-                        core.debug_print('[join] ' + ('@unknown' if person is None else person.id) + ' ' + repr(welcome_message) + ' ' + welcome_message_stub)
-                    irc_config = core.config('irc')
-                    if 'main_channel' in irc_config and irc_config.get('playerList', 'announce') == 'announce':
-                        core.state['bot'].say(irc_config['main_channel'], (player if person is None else person.irc_nick()) + ' ' + ('joined' if joined else 'left') + ' the game')
-                    core.update_all()
-                break
+                            }
+                        ], player)
+                        welcome_message_stub = "You still don't have a description […]"
+                    elif welcome_message == (0, 2):
+                        core.tellraw({
+                            'text': 'Hello ' + player + '. Welcome to the server!',
+                            'color': 'gray'
+                        }, player)
+                        welcome_message_stub = 'Welcome to the server!'
+                    elif welcome_message == (0, 3):
+                        core.tellraw({
+                            'color': 'gray',
+                            'text': 'Hello ' + player + '. Do I know you?'
+                        }, player)
+                        welcome_message_stub = 'Do I know you?'
+                    elif welcome_message[0] == 2: # regular comment lines (formerly known as advanced comment lines)
+                        message_dict = core.config('commentLines')['serverJoin'][welcome_message[1]]
+                        message_list = message_dict['text']
+                        if isinstance(message_list, str):
+                            message_list = [{'text': message_list, 'color': message_dict.get('commentColor', message_dict.get('color', 'gray'))}]
+                        elif isinstance(message_list, dict) or isinstance(message_list, lazyjson.Dict):
+                            message_list = [message_list]
+                        prefix_list = []
+                        if 'prefix' in message_dict:
+                            prefix_list = message_dict['prefix']
+                            if isinstance(prefix_list, str):
+                                prefix_list = [{'text': prefix_list, 'color': message_dict.get('prefixColor', message_dict.get('color', 'gray'))}]
+                            elif isinstance(prefix_list, dict) or isinstance(prefix_list, lazyjson.Dict):
+                                prefix_list = [prefix_list]
+                        core.tellraw(prefix_list + ([
+                            {
+                                'text': 'Hello ' + player + '. ',
+                                'color': message_dict.get('helloColor', message_dict.get('color', 'gray'))
+                            }
+                        ] if message_dict.get('helloPrefix', True) else []) + message_list, player)
+                        if len(message_list) and 'text' in message_list[0]:
+                            welcome_message_stub = (message_list[0]['text'][:80] if len(message_list[0]['text']) > 80 else message_list[0]['text']) + (' […]' if len(message_list[0]['text']) > 80 or len(message_list) > 1 else '')
+                        else:
+                            welcome_message_stub = '[…]'
+                    else:
+                        core.tellraw({
+                            'text': 'Hello ' + player + '. How did you do that?',
+                            'color': 'gray'
+                        }, player)
+                        welcome_message_stub = 'How did you do that?'
+                    core.debug_print('[join] ' + ('@unknown' if person is None else person.id) + ' ' + repr(welcome_message) + ' ' + welcome_message_stub)
+                irc_config = core.config('irc')
+                if 'main_channel' in irc_config and irc_config.get('playerList', 'announce') == 'announce':
+                    core.state['bot'].say(irc_config['main_channel'], (player if person is None else person.irc_nick()) + ' ' + ('joined' if joined else 'left') + ' the game')
+                core.update_all()
             else:
                 try:
                     death = deaths.Death(log_line, time=datetime.now(timezone.utc))
@@ -341,39 +337,9 @@ class InputLoop(loops.Loop):
                             comment = "I don't even."
                     core.state['last_death'] = death.message()
                     status = death.tweet(comment=comment)
-                    try:
-                        twid = core.tweet(status)
-                    except core.TwitterError as e:
-                        twid = 'error ' + str(e.status_code) + ': ' + str(e)
-                        minecraft.tellraw([
-                            {
-                                'text': 'Your fail has ',
-                                'color': 'gold'
-                            },
-                            {
-                                'text': 'not',
-                                'color': 'red'
-                            },
-                            {
-                                'text': ' been reported because of ',
-                                'color': 'gold'
-                            },
-                            {
-                                'text': 'reasons',
-                                'hoverEvent': {
-                                    'action': 'show_text',
-                                    'value': str(e.status_code) + ': ' + str(e)
-                                },
-                                'color': 'gold'
-                            },
-                            {
-                                'text': '.',
-                                'color': 'gold'
-                            }
-                        ])
-                    except AttributeError:
+                    if core.twitter is None:
                         twid = 'Twitter is not configured'
-                        minecraft.tellraw([
+                        core.tellraw([
                             {
                                 'text': 'Your fail has ',
                                 'color': 'gold'
@@ -388,15 +354,8 @@ class InputLoop(loops.Loop):
                             }
                         ])
                     else:
-                        twid = 'https://twitter.com/wurstmineberg/status/' + str(twid)
-                        minecraft.tellraw({
-                            'text': 'Your fail has been reported. Congratulations.',
-                            'color': 'gold',
-                            'clickEvent': {
-                                'action': 'open_url',
-                                'value': twid
-                            }
-                        })
+                        outbox.outbox().put(status, kind='death', info={'nick': death.person.irc_nick()}) # the tweet URL is announced when it has been posted
+                        twid = None
                 else:
                     twid = 'deathtweets are disabled'
                 core.debug_print('[death] ' + death.irc_message(tweet_info=twid, respect_highlight_option=False))
@@ -408,9 +367,7 @@ class InputLoop(loops.Loop):
             core.cleanup()
             raise
         except:
-            core.debug_print('Exception in log input loop:')
-            if core.state.get('is_daemon', False) or core.config('debug', False):
-                traceback.print_exc(file=sys.stdout)
+            core.debug_print('Exception in log input loop:', exc_info=True)
 
 class TimeLoop(loops.Loop):
     def iterable(self):
@@ -436,6 +393,7 @@ class TimeLoop(loops.Loop):
     
     @staticmethod
     def process_value(value):
+        core.log_status()
         tell_time(comment=True, restart=core.config('dailyRestart', True))
 
 class TwitterStream(loops.Loop):
@@ -443,23 +401,19 @@ class TwitterStream(loops.Loop):
         super().__init__(iterable=self.iterable(twitter_api))
     
     def iterable(self, twitter_api):
-        response = twitter_api.request('user')
-        for tweet in response:
+        for tweet_id in twitter_mentions(twitter_api):
             if self.stopped:
                 break
-            if not ('id' in tweet and 'entities' in tweet and 'user_mentions' in tweet['entities']):
-                continue
-            if not any(entity.get('screen_name') == core.config('twitter').get('screen_name') for entity in tweet.get('entities', {}).get('user_mentions', [])):
-                continue
-            yield tweet['id']
+            yield tweet_id
         core.debug_print('TwitterStream stopping')
     
     @staticmethod
     def process_value(value):
-        minecraft.tellraw(core.paste_tweet(value, link=True, tellraw=True))
+        tweet = core.fetch_tweet(value)
+        core.tellraw(core.format_tweet(tweet, link=True, tellraw=True))
         irc_config = core.config('irc')
         if core.state.get('bot') and 'main_channel' in irc_config:
-            core.state['bot'].say(irc_config['main_channel'], core.paste_tweet(value, link=True, multi_line='truncate'))
+            core.state['bot'].say(irc_config['main_channel'], core.format_tweet(tweet, link=True, multi_line='truncate'))
 
 def tell_time(func=None, comment=False, restart=False):
     if func is None:
@@ -470,9 +424,9 @@ def tell_time(func=None, comment=False, restart=False):
                 lines = [msg]
             for line in lines:
                 try:
-                    minecraft.tellraw(line)
-                except socket.error:
-                    core.debug_print('telltime is disconnected from Minecraft')
+                    core.tellraw(line, block=True)
+                except (OSError, rcon.RconError) as e:
+                    core.debug_print('telltime is disconnected from Minecraft: {}'.format(e))
                     irc_config = core.config('irc')
                     if 'main_channel' in irc_config:
                         core.state['bot'].say(irc_config['main_channel'], 'Warning! Telltime is disconnected from Minecraft.')
@@ -534,19 +488,19 @@ def tell_time(func=None, comment=False, restart=False):
             ]))
         elif localnow.hour == 11:
             if restart:
-                players = set(minecraft.online_players())
+                players = set(core.online_players())
                 if len(players):
                     warning('The server is going to restart in 5 minutes.')
                     for _ in range(4):
                         time.sleep(60)
-                        new_players = set(minecraft.online_players())
+                        new_players = set(core.online_players())
                         if len(new_players) == 0:
                             break
                         players |= new_players
                     else:
                         warning('The server is going to restart in 60 seconds.')
                         time.sleep(50)
-                        players |= set(minecraft.online_players())
+                        players |= set(core.online_players())
                 if not core.state['server_control_lock'].acquire():
                     warning('Server access is locked. Not restarting server.')
                     core.debug_print('Server access locked. Not restarting server.')
@@ -595,3 +549,16 @@ def tell_time(func=None, comment=False, restart=False):
                 func('The next season of USC is {}. Are you participating?'.format('on ' + next_usc_date.strftime('%m-%d at %H:%M UTC' if next_usc_date.year == utcnow.year else '%Y-%m-%d at %H:%M UTC')))
     core.update_topic()
     core.state['dst'] = dst
+
+def twitter_mentions(twitter_api):
+    """Yields the IDs of the tweets that mention the bot's Twitter account, reconnecting to the user stream as needed. The stream is kept in core.state so cleanup can stop it."""
+    core.state['mention_stream'] = tweets.MentionStream(twitter_api, path=os.path.join(core.config('paths').get('cache', '/var/local/wurstmineberg/wurstminebot_cache'), 'twitter_mentions.json'))
+    return iter(core.state['mention_stream'])
+
+def watch_log():
+    """Returns the path of the server log and a logtail watcher for it, configured using the logWatcher config."""
+    logpath = os.path.join(core.config('paths')['minecraft_server'], 'logs', 'latest.log')
+    watcher_config = core.config('logWatcher')
+    watcher = logtail.watcher(logpath, backend=watcher_config.get('backend', 'auto'), interval=watcher_config.get('interval', 0.5))
+    core.debug_print('Watching ' + logpath + ' using ' + watcher.backend + ' with a ' + str(watcher.interval) + ' second interval')
+    return logpath, watcher
@@ -1,38 +1,108 @@
 import sys
 
-import datetime
+import copy
 import json
+import os
 import re
-import requests
+import shutil
+import threading
 import uuid
+import wurstminebot.cache
 import wurstminebot.core
+import wurstminebot.web
 
 CONFIG_FILE = '/opt/wurstmineberg/config/people.json'
 
-def config(person_id=None):
+class PeopleIndex:
+    """The parsed people file, with dicts for looking up people by their Wurstmineberg ID or their nicks.
+    
+    Nick keys are lowercase. Where several people share a nick, the one listed first in the file wins, like a linear search would.
+    """
+    
+    def __init__(self, people, stamp=None):
+        self.people = people
+        self.stamp = stamp
+        self.by_id = {}
+        self.by_irc_nick = {}
+        self.by_minecraft = {}
+        self.by_minecraft_uuid = {}
+        self.by_reddit = {}
+        self.by_twitter = {}
+        self.positions = {}
+        self.textsubs = {}
+        for position, person in enumerate(people):
+            if 'id' not in person:
+                continue
+            person_id = person['id']
+            self.by_id.setdefault(person_id, person)
+            self.positions.setdefault(person_id, position)
+            for nick in person.get('irc', {}).get('nicks', []):
+                self.by_irc_nick.setdefault(nick.lower(), person_id)
+            if 'minecraft' in person:
+                self.by_minecraft.setdefault(person['minecraft'].lower(), person_id)
+            if 'minecraftUUID' in person:
+                try:
+                    minecraft_uuid = uuid.UUID(person['minecraftUUID'])
+                except ValueError:
+                    wurstminebot.core.debug_print('[nicksub] invalid Minecraft UUID {!r} for {}, ignoring it'.format(person['minecraftUUID'], person_id), level='warning')
+                else:
+                    self.by_minecraft_uuid.setdefault(minecraft_uuid, person_id)
+            if 'reddit' in person:
+                self.by_reddit.setdefault(person['reddit'].lower(), person_id)
+            if 'twitter' in person:
+                self.by_twitter.setdefault(person['twitter'].lower(), person_id)
+
+_people_index = PeopleIndex([])
+_people_index_lock = threading.Lock()
+
+def people_index():
+    """Returns the PeopleIndex for the current contents of the people file.
+    
+    The file is only parsed again if its inode, modification time, or size has changed. The returned index and the person dicts in it are shared and must not be modified.
+    """
+    global _people_index
     try:
-        with open(CONFIG_FILE) as config_file:
-            j = json.load(config_file)
-    except:
-        j = []
-    if isinstance(j, dict):
-        j = j['people']
+        stat = os.stat(CONFIG_FILE)
+    except OSError:
+        return PeopleIndex([])
+    stamp = CONFIG_FILE, stat.st_ino, stat.st_mtime_ns, stat.st_size
+    with _people_index_lock:
+        if _people_index.stamp != stamp:
+            try:
+                with open(CONFIG_FILE) as config_file:
+                    j = json.load(config_file)
+            except:
+                j = []
+            if isinstance(j, dict):
+                j = j['people']
+            _people_index = PeopleIndex(j, stamp=stamp)
+        return _people_index
+
+def config(person_id=None):
+    index = people_index()
     if person_id is None:
-        return j
-    for person in j:
-        if person.get('id') == person_id:
-            return person
-    else:
+        return index.people
+    try:
+        return index.by_id[person_id]
+    except KeyError:
         raise PersonNotFoundError('person with id ' + str(person_id) + ' not found')
 
 def set_config(config_dict):
+    global _people_index
     if not isinstance(config_dict, dict):
         config_dict = {'people': config_dict}
-    with open(CONFIG_FILE, 'w') as config_file:
-        json.dump(config_dict, config_file, sort_keys=True, indent=4, separators=(',', ': '))
+    with _people_index_lock:
+        with open(CONFIG_FILE + '.tmp', 'w') as config_file:
+            json.dump(config_dict, config_file, sort_keys=True, indent=4, separators=(',', ': '))
+        try:
+            shutil.copymode(CONFIG_FILE, CONFIG_FILE + '.tmp')
+        except OSError:
+            pass # people file doesn't exist yet
+        os.replace(CONFIG_FILE + '.tmp', CONFIG_FILE)
+        _people_index = PeopleIndex([])
 
 def update_config(person_id, path, value=None, delete=False):
-    config_dict = config()
+    config_dict = copy.deepcopy(config())
     if isinstance(config_dict, dict):
         full_config_dict = config_dict
     else:
@@ -83,6 +153,29 @@ def minecraft_nicks(include_ids=False):
         if 'minecraft' in person:
             yield (person['id'], person['minecraft']) if include_ids else person['minecraft']
 
+_minecraft_profile_cache_lock = threading.Lock()
+
+def minecraft_profile(username):
+    """Returns a dict with the keys id (the UUID as a hex string) and name (the case-corrected username) for the given Minecraft username, or None if there is no such user.
+    
+    Results, including nonexistent users, are cached for 10 minutes in a cache that persists across restarts.
+    """
+    def _fetch():
+        response = wurstminebot.web.get('https://api.mojang.com/users/profiles/minecraft/{}'.format(username))
+        if response.status_code == 204:
+            return None
+        response.raise_for_status()
+        return {
+            'id': response.json()['id'],
+            'name': response.json()['name']
+        }
+    
+    with _minecraft_profile_cache_lock:
+        if wurstminebot.core.state.get('minecraft_username_cache') is None:
+            wurstminebot.core.state['minecraft_username_cache'] = wurstminebot.cache.TTLCache(max_size=1024, ttl=600, path=os.path.join(wurstminebot.core.config('paths').get('cache', '/var/local/wurstmineberg/wurstminebot_cache'), 'minecraft_profiles.json'))
+        profile_cache = wurstminebot.core.state['minecraft_username_cache']
+    return profile_cache.get_or_fetch(username.lower(), _fetch)
+
 def minecraft_uuids(include_wurstmineberg_ids=False):
     for person in config():
         if 'minecraftUUID' in person:
@@ -210,59 +303,42 @@ class Person(BasePerson):
                 self.id = self.id.lower()
             config(self.id) # raises PersonNotFoundError if the id is invalid
         elif context == 'irc':
-            for wurstmineberg_id, irc_nick in irc_nicks(mode='all', include_ids=True):
-                if irc_nick.lower() == id_or_nick.lower():
-                    self.id = wurstmineberg_id
-                    return
-            else:
+            try:
+                self.id = people_index().by_irc_nick[id_or_nick.lower()]
+            except KeyError:
                 raise PersonNotFoundError('person with IRC nick ' + str(id_or_nick) + ' not found')
         elif context == 'minecraft':
             try:
                 minecraft_uuid = uuid.UUID(id_or_nick)
             except ValueError:
-                if id_or_nick in wurstminebot.core.state['minecraft_username_cache'] and wurstminebot.core.state['minecraft_username_cache'][id_or_nick]['timestamp'] + datetime.timedelta(minutes=10) > datetime.datetime.utcnow(): # UUID is cached
-                    minecraft_uuid = wurstminebot.core.state['minecraft_username_cache'][id_or_nick]['uuid']
+                profile = minecraft_profile(id_or_nick)
+                if profile is None:
+                    minecraft_uuid = None
                 else:
-                    response = requests.get('https://api.mojang.com/users/profiles/minecraft/{}'.format(id_or_nick))
-                    if response.status_code == 204:
-                        minecraft_uuid = None
-                    else:
-                        minecraft_uuid = uuid.UUID(response.json()['id'])
-                        id_or_nick = response.json()['name'] # case-corrected username
-                        wurstminebot.core.state['minecraft_username_cache'][id_or_nick] = {
-                            'timestamp': datetime.datetime.utcnow(),
-                            'uuid': minecraft_uuid
-                        }
-            if minecraft_uuid is not None:
-                for wurstmineberg_id, iter_uuid in minecraft_uuids(include_wurstmineberg_ids=True):
-                    if minecraft_uuid == iter_uuid:
-                        self.id = wurstmineberg_id
-                        self.minecraft = id_or_nick
-                        return
-            for wurstmineberg_id, minecraft_nick in minecraft_nicks(include_ids=True):
-                if minecraft_nick.lower() == id_or_nick.lower():
-                    self.id = wurstmineberg_id
-                    return
-            
+                    minecraft_uuid = uuid.UUID(profile['id'])
+                    id_or_nick = profile['name'] # case-corrected username
+            index = people_index()
+            if minecraft_uuid is not None and minecraft_uuid in index.by_minecraft_uuid:
+                self.id = index.by_minecraft_uuid[minecraft_uuid]
+                if self.minecraft != id_or_nick:
+                    self.minecraft = id_or_nick # the player has changed their name
+            elif id_or_nick.lower() in index.by_minecraft:
+                self.id = index.by_minecraft[id_or_nick.lower()]
             else:
                 raise PersonNotFoundError('person with Minecraft username or UUID {!r} not found'.format(id_or_nick))
         elif context == 'reddit':
-            for wurstmineberg_id, reddit_nick in reddit_nicks(include_ids=True, format='plain'):
-                if id_or_nick.startswith('/u/'):
-                    id_or_nick = id_or_nick[len('/u/'):]
-                if reddit_nick.lower() == id_or_nick.lower():
-                    self.id = wurstmineberg_id
-                    return
-            else:
+            if id_or_nick.startswith('/u/'):
+                id_or_nick = id_or_nick[len('/u/'):]
+            try:
+                self.id = people_index().by_reddit[id_or_nick.lower()]
+            except KeyError:
                 raise PersonNotFoundError('person with reddit nick {!r} not found'.format(id_or_nick))
         elif context == 'twitter':
-            for wurstmineberg_id, twitter_nick in twitter_nicks(include_ids=True, twitter_at_prefix=False):
-                if id_or_nick.startswith('@'):
-                    id_or_nick = id_or_nick[len('@'):]
-                if twitter_nick.lower() == id_or_nick.lower():
-                    self.id = wurstmineberg_id
-                    return
-            else:
+            if id_or_nick.startswith('@'):
+                id_or_nick = id_or_nick[len('@'):]
+            try:
+                self.id = people_index().by_twitter[id_or_nick.lower()]
+            except KeyError:
                 raise PersonNotFoundError('person with twitter nick {!r} not found'.format(id_or_nick))
         else:
             raise ValueError('no such nicksub context: {!r}'.format(context))
@@ -376,7 +452,7 @@ class Person(BasePerson):
     
     @property
     def options(self):
-        return config(self.id).get('options', {})
+        return dict(config(self.id).get('options', {}))
     
     @options.setter
     def options(self, value):
@@ -510,10 +586,10 @@ def index(person, default=False):
         raise TypeError('cannot get index of non-person object')
     else:
         return default
-    for i, person_dict in enumerate(config()):
-        if person_dict.get('id') == person_id:
-            return i
-    raise PersonNotFoundError('person with id ' + str(person_id) + ' not found')
+    try:
+        return people_index().positions[person_id]
+    except KeyError:
+        raise PersonNotFoundError('person with id ' + str(person_id) + ' not found')
 
 def person_or_dummy(id_or_nick, context=None):
     try:
@@ -561,27 +637,66 @@ def sub(nick, source, target, strict=True, exit_on_fail=False, twitter_at_prefix
         except PersonNotFoundError:
             return nick
 
-def textsub(text, source, target, strict=False):
-    def _nicks_for_context(context):
-        if context == 'irc':
-            mode = 'main' if strict else 'all'
-            return reversed(list(irc_nicks(include_ids=True, mode=mode)))
-        elif context == 'minecraft':
-            return minecraft_nicks(include_ids=True)
-        elif context == 'reddit':
-            return reddit_nicks(include_ids=True)
-        elif context == 'twitter':
-            return twitter_nicks(include_ids=True, twitter_at_prefix=True)
+class TextSub:
+    """A compiled textsub for one combination of source context, target context, and strictness.
+    
+    All nicks are matched by a single regex, so the text is scanned once no matter how many people there are. Where several nicks match at the same position, the one that would have been substituted first wins.
+    """
+    
+    url_characters = "[0-9A-Za-z-._~:/?#\\[\\]@!$&'()*+\\,;=%]"
+    
+    def __init__(self, index, source, target, strict=False):
+        people = [person for person in index.people if 'id' in person]
+        if source == 'irc':
+            nicks = []
+            for person in people:
+                if len(person.get('irc', {}).get('nicks', [])):
+                    if strict:
+                        nicks.append((person['id'], person['irc']['nicks'][0]))
+                    else:
+                        nicks += [(person['id'], nick) for nick in person['irc']['nicks']]
+            nicks.reverse()
+        elif source == 'minecraft':
+            nicks = [(person['id'], person['minecraft']) for person in people if 'minecraft' in person]
+        elif source == 'reddit':
+            nicks = [(person['id'], person['reddit']) for person in people if 'reddit' in person]
+        elif source == 'twitter':
+            nicks = [(person['id'], '@' + person['twitter']) for person in people if 'twitter' in person]
         else:
-            return []
-    
-    url_characters = "[0-9A-Za-z-._~:/?#\[\]@!$&'()*+\,;=%]"
-    text = text[:]
-    for person_id, nick in _nicks_for_context(source):
-        if Person(person_id).nick(target):
-            text = re.sub('(?<!' + url_characters + ')(' + re.sub('\\|', '\\|', nick) + ')(?!' + url_characters + ')', Person(person_id).nick(target, twitter_at_prefix=True), text, flags=re.IGNORECASE)
-    if not strict:
-        for person_id, nick in other_nicks(include_ids=True, mode='all'):
-            if Person(person_id).nick(target):
-                text = re.sub('(?<!' + url_characters + ')(' + re.sub('\\|', '\\|', nick) + ')(?!' + url_characters + ')', Person(person_id).nick(target, twitter_at_prefix=True), text, flags=re.IGNORECASE)
-    return text
+            nicks = []
+        if not strict:
+            for person in people:
+                nicks += [(person['id'], nick) for nick in person.get('nicks', [])]
+        buckets = {} # nicks grouped by first letter, so the regex only tries the nicks that can match at each position
+        seen_nicks = set()
+        for person_id, nick in nicks:
+            if not nick or nick.lower() in seen_nicks:
+                continue # an earlier substitution would already have replaced every occurrence
+            try:
+                person = Person(person_id)
+            except PersonNotFoundError:
+                continue
+            if person.nick(target):
+                seen_nicks.add(nick.lower())
+                buckets.setdefault(nick[0].lower(), []).append((nick, person.nick(target, twitter_at_prefix=True)))
+        self.replacements = []
+        alternatives = []
+        for first_letter, bucket in buckets.items():
+            alternatives.append('(?=' + re.escape(first_letter) + ')(?:' + '|'.join('(' + re.escape(nick) + ')' for nick, replacement in bucket) + ')')
+            self.replacements += [replacement for nick, replacement in bucket]
+        if len(alternatives):
+            self.regex = re.compile('(?<!' + self.url_characters + ')(?:' + '|'.join(alternatives) + ')(?!' + self.url_characters + ')', flags=re.IGNORECASE)
+        else:
+            self.regex = None
+    
+    def __call__(self, text):
+        if self.regex is None:
+            return text
+        return self.regex.sub(lambda match: self.replacements[match.lastindex - 1], text)
+
+def textsub(text, source, target, strict=False):
+    index = people_index()
+    key = source, target, bool(strict)
+    if key not in index.textsubs:
+        index.textsubs[key] = TextSub(index, source, target, strict=strict)
+    return index.textsubs[key](text)
@@ -0,0 +1,191 @@
+from wurstminebot import core
+import json
+import os
+import os.path
+import threading
+import time
+import uuid
+
+DUPLICATE_ERROR_CODE = 187 # status is a duplicate
+RATE_LIMIT_BACKOFF = 900 # seconds to wait after hitting a rate limit, the length of a Twitter rate limit window
+RETRY_ERROR_CODES = {88, 130, 131, 185} # rate limit exceeded, over capacity, internal error, over daily status update limit
+
+class Outbox:
+    """A queue of tweets to post, kept in a JSON file so that it survives restarts.
+    
+    A worker thread posts the tweets in order. Server errors, network errors, and rate limits are retried with exponential backoff (waiting at least a rate limit window after a rate limit error), other errors are permanent. When a tweet has been posted or has failed for good, the follow-up for its kind is sent: a line in the main channel with the tweet URL or the error, and for deaths, a message in-game.
+    """
+    
+    def __init__(self, path, max_attempts=10, max_backoff=900):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.condition = threading.Condition()
+        self.entries = self.load()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.work, name='wurstminebot Twitter outbox', daemon=True)
+        self.thread.start()
+    
+    def load(self):
+        try:
+            with open(self.path) as outbox_file:
+                entries = json.load(outbox_file)
+        except (IOError, OSError, ValueError):
+            return []
+        return entries if isinstance(entries, list) else []
+    
+    def put(self, status, kind=None, info={}):
+        """Queues a tweet and returns right away.
+        
+        Required arguments:
+        status -- The text of the tweet.
+        
+        Optional arguments:
+        kind -- 'achievement' or 'death', selects the follow-up message sent once the tweet is posted. None for no follow-up.
+        info -- A JSON-serializable dict with details for the follow-up. For achievements and deaths, it must contain the key nick, the IRC nick of the player.
+        """
+        with self.condition:
+            self.entries.append({
+                'attempts': 0,
+                'id': str(uuid.uuid4()),
+                'info': dict(info),
+                'kind': kind,
+                'notBefore': time.time(),
+                'status': status
+            })
+            self.save()
+            self.condition.notify_all()
+    
+    def save(self):
+        """Writes the queue to disk. Must be called with the condition held."""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as outbox_file:
+                json.dump(self.entries, outbox_file, sort_keys=True, indent=4, separators=(',', ': '))
+            os.replace(self.path + '.tmp', self.path)
+        except (IOError, OSError):
+            core.debug_print('[outbox] could not save ' + self.path)
+    
+    def status(self):
+        with self.condition:
+            return {
+                'failing': sum(1 for entry in self.entries if entry['attempts'] > 0),
+                'queued': len(self.entries)
+            }
+    
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+    
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.stopped and (not len(self.entries) or self.entries[0]['notBefore'] > time.time()):
+                    self.condition.wait(None if not len(self.entries) else self.entries[0]['notBefore'] - time.time())
+                if self.stopped:
+                    return
+                entry = self.entries[0]
+                maybe_posted = entry.get('posting', False) # an earlier attempt may have posted the tweet before failing or before the bot stopped
+                if not maybe_posted:
+                    entry['posting'] = True
+                    self.save()
+            screen_name = core.config('twitter').get('screen_name', 'wurstmineberg')
+            url = None
+            error = None
+            try:
+                url = 'https://twitter.com/' + screen_name + '/status/' + str(core.tweet(entry['status']))
+            except core.TwitterError as e:
+                if e.code == DUPLICATE_ERROR_CODE and maybe_posted:
+                    url = 'https://twitter.com/' + screen_name # posted by the earlier attempt, whose response was lost
+                else:
+                    error = 'error ' + str(e.status_code) + ': ' + str(e)
+                retry = e.status_code == 429 or e.status_code >= 500 or e.code in RETRY_ERROR_CODES
+                rate_limited = e.status_code == 429 or e.code in (88, 185)
+            except AttributeError:
+                error = 'Twitter is not configured'
+                retry = False
+                rate_limited = False
+            except Exception as e:
+                error = str(e)
+                retry = True # probably a network error
+                rate_limited = False
+            with self.condition:
+                if error is not None and retry and entry['attempts'] + 1 < self.max_attempts:
+                    entry['attempts'] += 1
+                    backoff = min(2 ** entry['attempts'], self.max_backoff)
+                    if rate_limited:
+                        backoff = max(backoff, RATE_LIMIT_BACKOFF)
+                    entry['notBefore'] = time.time() + backoff
+                    core.debug_print('[outbox] could not post tweet ({}), retrying in {} seconds'.format(error, backoff))
+                    self.save()
+                    continue
+                self.entries.remove(entry)
+                self.save()
+            try:
+                follow_up(entry, url=url, error=error)
+            except Exception:
+                core.debug_print('Exception in tweet follow-up:', exc_info=True)
+
+def follow_up(entry, url=None, error=None):
+    """Announces the outcome of a tweet from the outbox, depending on its kind."""
+    if entry['kind'] is None:
+        return
+    irc_config = core.config('irc')
+    if entry['kind'] == 'achievement':
+        what = 'achievement'
+    elif entry['kind'] == 'death':
+        what = 'death'
+        if url is None:
+            core.tellraw([
+                {
+                    'text': 'Your fail has ',
+                    'color': 'gold'
+                },
+                {
+                    'text': 'not',
+                    'color': 'red'
+                },
+                {
+                    'text': ' been reported because of ',
+                    'color': 'gold'
+                },
+                {
+                    'text': 'reasons',
+                    'hoverEvent': {
+                        'action': 'show_text',
+                        'value': error
+                    },
+                    'color': 'gold'
+                },
+                {
+                    'text': '.',
+                    'color': 'gold'
+                }
+            ])
+        else:
+            core.tellraw({
+                'text': 'Your fail has been reported. Congratulations.',
+                'color': 'gold',
+                'clickEvent': {
+                    'action': 'open_url',
+                    'value': url
+                }
+            })
+    else:
+        return
+    if 'main_channel' in irc_config and core.state.get('bot') is not None:
+        if url is None:
+            core.state['bot'].say(irc_config['main_channel'], 'Could not tweet ' + what + ' of ' + entry['info']['nick'] + ' [' + error + ']')
+        else:
+            core.state['bot'].say(irc_config['main_channel'], 'Tweeted ' + what + ' of ' + entry['info']['nick'] + ' [' + url + ']')
+
+_outbox_lock = threading.Lock()
+
+def outbox():
+    """Returns the Twitter outbox, creating it and starting its worker if necessary."""
+    with _outbox_lock:
+        if core.state.get('outbox') is None:
+            twitter_config = core.config('twitter')
+            core.state['outbox'] = Outbox(core.config('paths').get('outbox', '/var/local/wurstmineberg/wurstminebot_outbox.json'), max_attempts=twitter_config.get('outbox_max_attempts', 10), max_backoff=twitter_config.get('outbox_max_backoff', 900))
+        return core.state['outbox']
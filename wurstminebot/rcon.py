@@ -0,0 +1,235 @@
+import collections
+import concurrent.futures
+from wurstminebot import core
+import minecraft
+import socket
+import struct
+import threading
+import time
+
+SERVERDATA_AUTH = 3
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_RESPONSE_VALUE = 0
+
+MAX_COMMAND_BYTES = 1446 # the server can't read longer request packets
+MAX_PACKET_BYTES = 1048576 # the server splits responses into packets of 4096 bytes, anything much longer is garbage
+SENTINEL_COMMAND = '' # sent after each batch, the server answers it after all earlier responses are complete
+
+_header = struct.Struct('<iii')
+
+class RconError(Exception):
+    pass
+
+class Connection:
+    """A single rcon connection to the Minecraft server."""
+    
+    def __init__(self, host, port, password, timeout=5):
+        self.next_id = 0
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        try:
+            request_id = self.send_packets([(SERVERDATA_AUTH, password)])[0]
+            response_id, response_type, payload = self.read_packet()
+            if response_type == SERVERDATA_RESPONSE_VALUE: # some servers send an empty response before the auth response
+                response_id, response_type, payload = self.read_packet()
+            if response_id == -1 or response_id != request_id:
+                raise RconError('rcon authentication failed')
+        except:
+            self.close()
+            raise
+    
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+    
+    def read_exactly(self, length):
+        data = b''
+        while len(data) < length:
+            chunk = self.socket.recv(length - len(data))
+            if not chunk:
+                raise RconError('rcon connection closed by server')
+            data += chunk
+        return data
+    
+    def read_packet(self):
+        """Returns the next packet as a (request_id, packet_type, payload) tuple. Raises RconError if it is malformed."""
+        length = struct.unpack('<i', self.read_exactly(4))[0]
+        if not 10 <= length <= MAX_PACKET_BYTES:
+            raise RconError('malformed rcon packet of length {}'.format(length))
+        packet = self.read_exactly(length)
+        request_id, packet_type = struct.unpack_from('<ii', packet)
+        return request_id, packet_type, packet[8:-2].decode('utf-8', errors='replace')
+    
+    def read_responses(self, request_ids):
+        """Reads the responses to commands sent by send_commands and returns them in order.
+        
+        Long responses are split across several packets with the same request ID, and nothing marks the last one, so packets are collected until the response to the sentinel command arrives.
+        """
+        *request_ids, sentinel_id = request_ids
+        responses = collections.OrderedDict((request_id, '') for request_id in request_ids)
+        while True:
+            request_id, packet_type, payload = self.read_packet()
+            if request_id == sentinel_id:
+                return list(responses.values())
+            if request_id in responses:
+                responses[request_id] += payload
+    
+    def run(self, commands):
+        """Sends all commands in a single write, then returns their responses in order."""
+        return self.read_responses(self.send_commands(commands))
+    
+    def send_commands(self, commands):
+        """Sends all commands, followed by the sentinel command, in a single write. Returns the request IDs to pass to read_responses."""
+        return self.send_packets([(SERVERDATA_EXECCOMMAND, command) for command in list(commands) + [SENTINEL_COMMAND]])
+    
+    def send_packets(self, packets):
+        data = b''
+        request_ids = []
+        for packet_type, payload in packets:
+            self.next_id = self.next_id % 2147483647 + 1
+            payload = payload.encode('utf-8') + b'\x00\x00'
+            data += _header.pack(len(payload) + 8, self.next_id, packet_type) + payload
+            request_ids.append(self.next_id)
+        self.socket.sendall(data)
+        return request_ids
+
+class Transport:
+    """Sends commands to the Minecraft server over a persistent rcon connection.
+    
+    Commands are queued and sent by a worker thread. It waits flush_window seconds after the first queued command so that the commands of a multi-part reply go out in a single write. If the connection fails, it is reopened with exponential backoff, and in the meantime commands are sent using minecraft.command instead. Commands that were already written to the connection when it failed are not sent again, since the server may have run them; their futures get an RconError instead.
+    """
+    
+    def __init__(self, host, port, password, flush_window=0.05, max_backoff=60, timeout=5):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.flush_window = flush_window
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.connection = None
+        self.backoff = 1
+        self.next_attempt = 0
+        self.condition = threading.Condition()
+        self.queue = collections.deque()
+        self.stopped = False
+        self.stats = {
+            'batches': 0,
+            'commands': 0,
+            'fallbacks': 0,
+            'reconnects': 0,
+            'unanswered': 0
+        }
+        self.thread = threading.Thread(target=self.work, name='wurstminebot rcon', daemon=True)
+        self.thread.start()
+    
+    def command(self, cmd, args=[], block=False):
+        """Queues a command. If block is true, waits for it to run and returns the server's response, otherwise returns a Future."""
+        future = concurrent.futures.Future()
+        with self.condition:
+            stopped = self.stopped
+            if not stopped:
+                self.queue.append((cmd, args, future))
+                self.condition.notify()
+        if stopped:
+            self.fallback([(cmd, args, future)])
+        if block:
+            return future.result()
+        return future
+    
+    def connect(self):
+        """Returns the open connection, reconnecting if possible. Returns None while backing off after a failed attempt."""
+        if self.connection is not None:
+            return self.connection
+        if time.monotonic() < self.next_attempt:
+            return None
+        try:
+            self.connection = Connection(self.host, self.port, self.password, timeout=self.timeout)
+        except (OSError, RconError) as e:
+            core.debug_print('[rcon] could not connect ({}), retrying in {} seconds'.format(e, self.backoff))
+            self.next_attempt = time.monotonic() + self.backoff
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            return None
+        self.backoff = 1
+        self.stats['reconnects'] += 1
+        return self.connection
+    
+    def disconnect(self, error):
+        core.debug_print('[rcon] connection lost: {}'.format(error), exc_info=not isinstance(error, (OSError, RconError)))
+        self.connection.close()
+        self.connection = None
+    
+    def fallback(self, batch):
+        self.stats['fallbacks'] += len(batch)
+        for cmd, args, future in batch:
+            try:
+                future.set_result(minecraft.command(cmd, args))
+            except Exception as e:
+                future.set_exception(e)
+    
+    def status(self):
+        with self.condition:
+            return dict(self.stats, connected=self.connection is not None, queued=len(self.queue))
+    
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join(timeout=self.timeout)
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+    
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.stopped and not len(self.queue):
+                    self.condition.wait()
+                if self.stopped and not len(self.queue):
+                    return
+            time.sleep(self.flush_window) # collect the rest of a multi-part reply
+            with self.condition:
+                batch = list(self.queue)
+                self.queue.clear()
+            oversized = [item for item in batch if len(full_command(*item).encode('utf-8')) > MAX_COMMAND_BYTES]
+            batch = [item for item in batch if len(full_command(*item).encode('utf-8')) <= MAX_COMMAND_BYTES]
+            self.fallback(oversized)
+            if not len(batch):
+                continue
+            connection = self.connect()
+            if connection is None:
+                self.fallback(batch)
+                continue
+            try:
+                request_ids = connection.send_commands([full_command(*item) for item in batch])
+            except Exception as e: # the worker must not die, or commands waiting for it would block forever
+                self.disconnect(e)
+                self.fallback(batch) # some of the commands may have arrived, but losing a message is worse than sending it twice
+                continue
+            try:
+                responses = connection.read_responses(request_ids)
+            except Exception as e:
+                self.disconnect(e)
+                self.stats['unanswered'] += len(batch)
+                for cmd, args, future in batch:
+                    future.set_exception(RconError('no response to {} from the server, it may or may not have run: {}'.format(cmd, e)))
+                continue
+            self.stats['batches'] += 1
+            self.stats['commands'] += len(batch)
+            for (cmd, args, future), response in zip(batch, responses):
+                future.set_result(response)
+
+def full_command(cmd, args, future=None):
+    return ' '.join([cmd] + [str(arg) for arg in args])
+
+_transport_lock = threading.Lock()
+
+def transport():
+    """Returns the rcon transport, creating it if necessary, or None if rcon isn't configured."""
+    rcon_config = core.config('rcon')
+    if rcon_config.get('password') is None:
+        return None
+    with _transport_lock:
+        if core.state.get('rcon') is None:
+            core.state['rcon'] = Transport(rcon_config.get('host', 'localhost'), rcon_config.get('port', 25575), rcon_config['password'], flush_window=rcon_config.get('flushWindow', 0.05))
+        return core.state['rcon']
@@ -0,0 +1,145 @@
+import asyncio
+import concurrent.futures
+from wurstminebot import core
+import functools
+from wurstminebot import logtail
+import sys
+import time
+
+class Task:
+    """A coroutine running on the runtime's event loop, stoppable from any thread like the loops it replaces."""
+    
+    def __init__(self, runtime, coroutine, name):
+        self.name = name
+        self.future = asyncio.run_coroutine_threadsafe(runtime.guard(coroutine, name), runtime.loop)
+    
+    def stop(self):
+        self.future.cancel()
+
+class Runtime:
+    """Runs the bot's subsystems as coroutines on a single asyncio event loop.
+    
+    The log tailer, time loop, and Twitter stream are coroutines. Blocking legacy code, like processing a log line or running a command, runs in a thread pool with a bounded number of workers. The native IRC client runs on the event loop, while ircbotframe has its own blocking main loop, so it gets a dedicated thread.
+    """
+    
+    def __init__(self, workers=8):
+        self.loop = asyncio.new_event_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wurstminebot runtime')
+        self.irc_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='wurstminebot IRC')
+        self.loop.set_default_executor(self.executor)
+        self.stop_event = None
+    
+    async def guard(self, coroutine, name):
+        try:
+            await coroutine
+        except asyncio.CancelledError:
+            raise
+        except SystemExit:
+            core.debug_print('Exit in ' + name) # cleanup has already been called
+        except Exception:
+            core.debug_print('Exception in ' + name + ':', exc_info=True)
+    
+    async def input_loop(self):
+        from wurstminebot import loop
+        error_timeout = 10
+        logpath, watcher = loop.watch_log()
+        waiting = None
+        try:
+            with logtail.LogTail(logpath) as log: # don't process lines that already existed
+                while True:
+                    waiting = self.executor.submit(watcher.wait)
+                    if not await asyncio.wrap_future(waiting):
+                        break
+                    try:
+                        lines = log.read_lines()
+                    except (IOError, OSError):
+                        core.debug_print('Log does not exist, retrying in {} seconds'.format(error_timeout))
+                        await asyncio.sleep(error_timeout)
+                        continue
+                    for line in lines:
+                        await self.run_blocking(loop.InputLoop.process_value, line) # one at a time, to keep the lines in order
+        finally:
+            watcher.stop()
+            if waiting is not None and not waiting.done():
+                await asyncio.wait([asyncio.wrap_future(waiting)]) # the executor thread may still be inside wait, don't close the fd under it
+            watcher.close()
+    
+    async def irc(self):
+        from wurstminebot import irc
+        core.state['bot'] = irc.bot()
+        core.state['bot'].debugging(core.config('debug'))
+        if core.config('irc').get('client', 'ircbotframe') == 'native':
+            await core.state['bot'].main() # the native client runs on the event loop itself
+        else:
+            await self.loop.run_in_executor(self.irc_executor, core.state['bot'].run)
+    
+    async def main(self):
+        self.stop_event = asyncio.Event()
+        irc_task = self.loop.create_task(self.irc())
+        stop_task = self.loop.create_task(self.stop_event.wait())
+        await asyncio.wait([irc_task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+        stop_task.cancel()
+        if irc_task.done():
+            irc_task.result() # raise exceptions from the IRC bot
+    
+    def on_connected(self):
+        """Starts the log tailer and Twitter stream once the bot has connected to IRC. Called from the IRC thread."""
+        if core.state.get('input_loop') is None:
+            core.state['input_loop'] = Task(self, self.input_loop(), 'log input loop')
+        if core.state.get('twitter_stream') is None and core.twitter is not None:
+            core.state['twitter_stream'] = Task(self, self.twitter_stream(core.twitter), 'Twitter stream')
+    
+    def run(self):
+        """Runs the bot until it disconnects or cleanup is called."""
+        asyncio.set_event_loop(self.loop)
+        core.state['runtime'] = self
+        core.state['time_loop'] = Task(self, self.time_loop(), 'time loop')
+        try:
+            self.loop.run_until_complete(self.main())
+        except Exception:
+            core.debug_print('Exception in bot.run:', exc_info=True)
+            sys.exit(1)
+        finally:
+            core.cleanup()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.executor.shutdown(wait=False)
+            self.irc_executor.shutdown(wait=False)
+            self.loop.close()
+    
+    def run_blocking(self, func, *args, **kwargs):
+        """Runs a blocking function in the thread pool and returns an awaitable for its result."""
+        return self.loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+    
+    def stop(self):
+        """Makes run return. Can be called from any thread, including signal handlers."""
+        if self.stop_event is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+    
+    async def time_loop(self):
+        from wurstminebot import loop
+        while True:
+            next_hour = time.time() - time.time() % 3600 + 3601 # one second after the hour, to work with leap seconds
+            while time.time() < next_hour:
+                await asyncio.sleep(min(60, next_hour - time.time())) # short sleeps so a changed system clock doesn't make us skip an hour
+            await self.run_blocking(loop.TimeLoop.process_value, None)
+    
+    async def twitter_stream(self, twitter_api):
+        from wurstminebot import loop
+        mentions = await self.run_blocking(loop.twitter_mentions, twitter_api)
+        try:
+            while True:
+                tweet_id = await self.run_blocking(next, mentions, None)
+                if tweet_id is None:
+                    break
+                await self.run_blocking(loop.TwitterStream.process_value, tweet_id)
+        finally:
+            if core.state.get('mention_stream') is not None:
+                core.state['mention_stream'].stop() # unblocks the executor thread waiting in next
+        core.debug_print('TwitterStream stopping')
+
+def run():
+    """Runs the bot using the asyncio runtime, configured using the runtime config."""
+    Runtime(workers=core.config('runtime').get('workers', 8)).run()
@@ -0,0 +1,274 @@
+from wurstminebot import cache
+import collections
+import concurrent.futures
+from wurstminebot import core
+import json
+import os
+import os.path
+import threading
+import time
+import TwitterAPI
+
+LOOKUP_BATCH_SIZE = 100 # maximum number of IDs per statuses/lookup request
+MAX_RATE_LIMIT_BACKOFF = 960 # seconds
+STALL_TIMEOUT = 90 # Twitter sends a keepalive newline every 30 seconds, so a stream that's silent for this long is dead
+
+class TweetCache:
+    """Fetches tweets by ID, keeping recently seen tweets in memory so each one is fetched at most once.
+    
+    Lookups for tweets that aren't cached are collected for batch_window seconds and then sent together, as a single statuses/show request for one tweet or as statuses/lookup requests for several. Retweeted tweets embedded in a fetched tweet are cached too.
+    """
+    
+    def __init__(self, twitter_api, max_size=256, ttl=600, batch_window=0.1):
+        self.twitter_api = twitter_api
+        self.batch_window = batch_window
+        self.tweets = cache.TTLCache(max_size=max_size, ttl=ttl)
+        self.lock = threading.Lock()
+        self.pending = {} # tweet ID → Future for the tweet
+        self.stats = {
+            'hits': 0,
+            'requests': 0,
+            'tweets': 0
+        }
+    
+    def _flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+        tweet_ids = list(pending)
+        error = None
+        try:
+            if len(tweet_ids) == 1:
+                found = {tweet_ids[0]: self._request('statuses/show/:' + tweet_ids[0])}
+            else:
+                found = {}
+                for i in range(0, len(tweet_ids), LOOKUP_BATCH_SIZE):
+                    for tweet in self._request('statuses/lookup', {'id': ','.join(tweet_ids[i:i + LOOKUP_BATCH_SIZE])}):
+                        found[tweet['id_str']] = tweet
+            for tweet in found.values():
+                self.add(tweet)
+            for tweet_id, future in pending.items():
+                if tweet_id in found:
+                    future.set_result(found[tweet_id])
+                else:
+                    future.set_exception(core.TwitterError(144, message='No status found with that ID.', status_code=404))
+        except Exception as e:
+            error = e # passed on to every caller waiting for this batch
+        finally:
+            for future in pending.values():
+                if not future.done(): # so no caller waits forever, whatever went wrong
+                    future.set_exception(error if error is not None else RuntimeError('tweet lookup failed'))
+    
+    def _request(self, resource, params=None):
+        """Sends a request and returns the decoded JSON, raising TwitterError for errors."""
+        r = self.twitter_api.request(resource, params)
+        self.stats['requests'] += 1
+        if isinstance(r, TwitterAPI.TwitterResponse):
+            j = r.response.json()
+        else:
+            j = r.json()
+        if r.status_code != 200:
+            first_error = j['errors'][0] if len(j.get('errors', [])) else {}
+            raise core.TwitterError(first_error.get('code', 0), message=first_error.get('message'), status_code=r.status_code, errors=j.get('errors', []))
+        return j
+    
+    def add(self, tweet):
+        """Caches a tweet that was received some other way, for example from the streaming API."""
+        self.tweets.set(tweet['id_str'], tweet)
+        self.stats['tweets'] += 1
+        if 'retweeted_status' in tweet:
+            self.add(tweet['retweeted_status'])
+    
+    def get(self, tweet_id):
+        """Returns the tweet with the given ID as a dict, as returned by the Twitter API. Raises TwitterError if it can't be fetched."""
+        return self.get_many([tweet_id])[str(tweet_id)]
+    
+    def get_many(self, tweet_ids):
+        """Returns a dict mapping each of the given tweet IDs (as strings) to its tweet. Raises TwitterError if any of them can't be fetched."""
+        ret = {}
+        futures = {}
+        flush = False
+        with self.lock:
+            for tweet_id in map(str, tweet_ids):
+                tweet = self.tweets.get(tweet_id)
+                if tweet is not None:
+                    self.stats['hits'] += 1
+                    ret[tweet_id] = tweet
+                    continue
+                if tweet_id not in self.pending:
+                    if not len(self.pending):
+                        flush = True # this thread sends the batch
+                    self.pending[tweet_id] = concurrent.futures.Future()
+                futures[tweet_id] = self.pending[tweet_id]
+        if flush:
+            time.sleep(self.batch_window) # give other threads a chance to add their lookups to the batch
+            self._flush()
+        for tweet_id, future in futures.items():
+            ret[tweet_id] = future.result()
+        return ret
+    
+    def status(self):
+        with self.lock:
+            return dict(self.stats, cached=len(self.tweets), pending=len(self.pending))
+
+class MentionStream:
+    """Iterates over the IDs of tweets that mention the bot's Twitter account, using the user stream.
+    
+    The stream is read in chunks as they arrive and split into messages from a single buffer. Only messages that contain the bot's screen name are decoded. If the stream ends, fails, or stalls (no data, not even a keepalive, for STALL_TIMEOUT seconds), it is reopened with backoff as recommended by Twitter: linear for network errors, exponential for HTTP errors, and starting at a minute for rate limiting. After connecting, mentions newer than the last one yielded are fetched using statuses/mentions_timeline with since_id, so none are lost. If a path is given, the ID of the last mention is kept in that JSON file, so this also covers the time the bot wasn't running.
+    """
+    
+    def __init__(self, twitter_api, path=None):
+        self.twitter_api = twitter_api
+        self.path = path
+        self.screen_name = core.config('twitter').get('screen_name')
+        self.last_id = self.load() # ID of the latest mention yielded
+        self.recent_ids = collections.deque(maxlen=LOOKUP_BATCH_SIZE) # for skipping mentions both backfilled and received from the stream
+        self.response = None
+        self.last_data = None
+        self.stalled = False
+        self.stop_event = threading.Event()
+    
+    def __iter__(self):
+        network_errors = 0
+        http_errors = 0
+        rate_limit_errors = 0
+        while not self.stopped:
+            try:
+                r = self.twitter_api.request('user')
+                response = r.response if isinstance(r, TwitterAPI.TwitterResponse) else r
+                if r.status_code != 200:
+                    response.close()
+                    if r.status_code in (420, 429):
+                        rate_limit_errors += 1
+                        backoff = min(60 * 2 ** (rate_limit_errors - 1), MAX_RATE_LIMIT_BACKOFF)
+                    else:
+                        http_errors += 1
+                        backoff = min(5 * 2 ** (http_errors - 1), 320)
+                    core.debug_print('[twitter] user stream returned status {}, reconnecting in {} seconds'.format(r.status_code, backoff))
+                    self.stop_event.wait(backoff)
+                    continue
+                self.response = response
+                network_errors = http_errors = rate_limit_errors = 0
+                if self.last_id is not None:
+                    yield from self.backfill() # the stream is already open, so nothing is missed between the backfill and the stream
+                for tweet in self.read(self.response):
+                    yield from self.process(tweet)
+                if not self.stopped:
+                    core.debug_print('[twitter] user stream ended, reconnecting')
+            except GeneratorExit:
+                raise
+            except Exception as e:
+                if self.stopped:
+                    break
+                network_errors += 1
+                backoff = min(0.25 * network_errors, 16)
+                core.debug_print('[twitter] user stream failed ({}), reconnecting in {} seconds'.format(e, backoff))
+                self.stop_event.wait(backoff)
+            finally:
+                if self.response is not None:
+                    self.response.close()
+                    self.response = None
+    
+    def backfill(self):
+        """Yields the IDs of mentions newer than last_id, oldest first."""
+        r = self.twitter_api.request('statuses/mentions_timeline', {'count': 200, 'since_id': self.last_id})
+        j = r.response.json() if isinstance(r, TwitterAPI.TwitterResponse) else r.json()
+        if r.status_code != 200:
+            core.debug_print('[twitter] could not backfill mentions: status {}'.format(r.status_code))
+            return
+        core.debug_print('[twitter] backfilling {} mentions since {}'.format(len(j), self.last_id))
+        for tweet in reversed(j):
+            yield from self.process(tweet)
+    
+    def load(self):
+        if self.path is None:
+            return None
+        try:
+            with open(self.path) as state_file:
+                return json.load(state_file).get('lastID')
+        except (IOError, OSError, ValueError, AttributeError):
+            return None
+    
+    def process(self, tweet):
+        if not ('id' in tweet and 'entities' in tweet and 'user_mentions' in tweet['entities']):
+            return
+        if not any(entity.get('screen_name') == self.screen_name for entity in tweet['entities']['user_mentions']):
+            return
+        if tweet['id'] in self.recent_ids:
+            return
+        self.recent_ids.append(tweet['id'])
+        if self.last_id is None or tweet['id'] > self.last_id:
+            self.last_id = tweet['id']
+            self.save()
+        tweet_cache().add(tweet) # so pasting the mention doesn't need to fetch it again
+        yield tweet['id']
+    
+    def read(self, response):
+        """Yields the decoded messages from the stream that might be mentions, until it ends. Raises IOError if it stalls."""
+        needle = self.screen_name.encode('utf-8')
+        buf = bytearray()
+        watchdog = threading.Thread(target=self.watchdog, args=(response,), name='wurstminebot Twitter stream watchdog', daemon=True)
+        self.last_data = time.monotonic()
+        self.stalled = False
+        watchdog.start()
+        for chunk in response.iter_content(chunk_size=None):
+            self.last_data = time.monotonic()
+            if self.stopped:
+                return
+            buf += chunk
+            start = 0
+            while True:
+                end = buf.find(b'\r\n', start)
+                if end == -1:
+                    break
+                message = bytes(buf[start:end])
+                start = end + 2
+                if needle in message: # skips keepalives and most other messages without decoding them
+                    yield json.loads(message.decode('utf-8'))
+            del buf[:start]
+        if self.stalled:
+            raise IOError('no data for {} seconds'.format(STALL_TIMEOUT))
+    
+    def save(self):
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as state_file:
+                json.dump({'lastID': self.last_id}, state_file)
+            os.replace(self.path + '.tmp', self.path)
+        except (IOError, OSError):
+            core.debug_print('[twitter] could not save ' + self.path)
+    
+    def stop(self):
+        """Ends the iteration, closing the stream and interrupting a backoff. Can be called from any thread."""
+        self.stop_event.set()
+        response = self.response
+        if response is not None:
+            response.close()
+    
+    @property
+    def stopped(self):
+        return self.stop_event.is_set()
+    
+    def watchdog(self, response):
+        """Closes the response if no data arrives for STALL_TIMEOUT seconds, which ends read."""
+        while self.response is response and not self.stopped:
+            remaining = self.last_data + STALL_TIMEOUT - time.monotonic()
+            if remaining <= 0:
+                self.stalled = True
+                response.close()
+                return
+            time.sleep(min(remaining, 1))
+
+_tweet_cache_lock = threading.Lock()
+
+def tweet_cache():
+    """Returns the tweet cache, creating it if necessary, or None if Twitter isn't configured."""
+    if core.twitter is None:
+        return None
+    with _tweet_cache_lock:
+        if core.state.get('tweet_cache') is None:
+            twitter_config = core.config('twitter')
+            core.state['tweet_cache'] = TweetCache(core.twitter, max_size=twitter_config.get('tweet_cache_size', 256), ttl=twitter_config.get('tweet_cache_ttl', 600), batch_window=twitter_config.get('batch_window', 0.1))
+        return core.state['tweet_cache']
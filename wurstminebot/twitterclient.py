@@ -0,0 +1,203 @@
+import collections
+import concurrent.futures
+from wurstminebot import core
+import json
+import os
+import os.path
+import re
+import threading
+import time
+
+COALESCED_RESOURCES = {'application/rate_limit_status', 'followers/ids', 'friends/ids', 'lists/members', 'search/tweets', 'statuses/lookup', 'statuses/mentions_timeline', 'statuses/show/:id', 'statuses/user_timeline', 'users/lookup', 'users/show'} # read-only, so a response can be shared by identical requests
+STREAMING_RESOURCES = {'site', 'statuses/filter', 'statuses/firehose', 'statuses/sample', 'user'}
+
+class Client:
+    """Wraps a TwitterAPI.TwitterAPI, keeping track of the rate limit of each endpoint.
+    
+    The x-rate-limit-* headers of every response are recorded per endpoint, and the budget is counted down locally between responses. While an endpoint's budget is used up, requests to it raise TwitterError 88 without being sent, and deferred requests wait until the limit resets. Identical read-only requests (see COALESCED_RESOURCES) that are in flight or were successfully answered less than coalesce_window seconds ago share a single response. Streaming requests are passed through unchanged.
+    """
+    
+    def __init__(self, twitter_api, coalesce_window=5, reserve=2, path=None):
+        """Optional arguments:
+        coalesce_window -- The time in seconds for which a response is reused for identical requests.
+        reserve -- Deferred requests are only sent while more than this many requests are left in the endpoint's budget, so urgent requests don't run out.
+        path -- A JSON file in which deferred requests are kept until they have been sent, so they survive restarts.
+        """
+        self.twitter_api = twitter_api
+        self.coalesce_window = coalesce_window
+        self.reserve = reserve
+        self.path = path
+        self.condition = threading.Condition()
+        self.budgets = {} # endpoint → dict with the keys limit, remaining, and reset (a Unix timestamp)
+        self.deferred = collections.deque((resource, params, concurrent.futures.Future()) for resource, params in self.load())
+        self.requests = {} # request key → (time answered or None while in flight, Future)
+        self.stopped = False
+        self.stats = {
+            'coalesced': 0,
+            'deferred': 0,
+            'rejected': 0,
+            'sent': 0
+        }
+        self.thread = threading.Thread(target=self.work, name='wurstminebot Twitter client', daemon=True)
+        self.thread.start()
+    
+    def __getattr__(self, name):
+        return getattr(self.twitter_api, name)
+    
+    def _record(self, endpoint, response):
+        headers = response.headers
+        with self.condition:
+            if 'x-rate-limit-remaining' in headers:
+                budget = {
+                    'limit': int(headers.get('x-rate-limit-limit', 0)),
+                    'remaining': int(headers['x-rate-limit-remaining']),
+                    'reset': int(headers.get('x-rate-limit-reset', 0))
+                }
+                old_budget = self.budgets.get(endpoint)
+                if old_budget is not None and old_budget['reset'] == budget['reset']:
+                    budget['remaining'] = min(budget['remaining'], old_budget['remaining']) # responses to concurrent requests may arrive out of order, and the local count includes requests still in flight
+                self.budgets[endpoint] = budget
+            elif response.status_code == 429:
+                self.budgets[endpoint] = {
+                    'limit': self.budgets.get(endpoint, {}).get('limit', 0),
+                    'remaining': 0,
+                    'reset': int(time.time()) + 900 # the length of a rate limit window
+                }
+            self.condition.notify_all()
+    
+    def _send(self, resource, params):
+        endpoint = endpoint_name(resource)
+        with self.condition:
+            budget = self.budgets.get(endpoint)
+            if budget is not None and budget['reset'] > time.time():
+                if budget['remaining'] <= 0:
+                    self.stats['rejected'] += 1
+                    raise core.TwitterError(88, message='Rate limit exceeded', status_code=429)
+                budget['remaining'] -= 1 # so concurrent requests don't overdraw the budget before the response headers arrive
+        response = self.twitter_api.request(resource, params)
+        self.stats['sent'] += 1
+        self._record(endpoint, response)
+        return response
+    
+    def defer(self, resource, params=None):
+        """Queues a request that isn't urgent, like following someone. It is sent by a worker thread once the endpoint has budget to spare. Returns a Future for the response."""
+        future = concurrent.futures.Future()
+        with self.condition:
+            self.deferred.append((resource, params, future))
+            self.stats['deferred'] += 1
+            self.save()
+            self.condition.notify_all()
+        return future
+    
+    def load(self):
+        if self.path is None:
+            return []
+        try:
+            with open(self.path) as deferred_file:
+                return [(entry['resource'], entry['params']) for entry in json.load(deferred_file)]
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return []
+    
+    def remaining(self, endpoint):
+        """Returns the number of requests left for the endpoint in the current rate limit window, or None if it's unknown."""
+        with self.condition:
+            budget = self.budgets.get(endpoint)
+            if budget is None or budget['reset'] <= time.time():
+                return None
+            return budget['remaining']
+    
+    def request(self, resource, params=None):
+        """Sends a request right away, like TwitterAPI.TwitterAPI.request. Raises TwitterError 88 instead if the endpoint's rate limit is used up."""
+        if resource in STREAMING_RESOURCES:
+            return self.twitter_api.request(resource, params)
+        if endpoint_name(resource) not in COALESCED_RESOURCES:
+            return self._send(resource, params)
+        key = resource, tuple(sorted((params or {}).items()))
+        with self.condition:
+            now = time.time()
+            for other_key, (answered, other_future) in list(self.requests.items()):
+                if answered is not None and answered < now - self.coalesce_window:
+                    del self.requests[other_key]
+            if key in self.requests:
+                self.stats['coalesced'] += 1
+                future = self.requests[key][1]
+                send = False
+            else:
+                future = concurrent.futures.Future()
+                self.requests[key] = None, future
+                send = True
+        if send:
+            try:
+                future.set_result(self._send(resource, params))
+            except Exception as e:
+                future.set_exception(e)
+            with self.condition:
+                if future.exception() is None and future.result().status_code == 200:
+                    self.requests[key] = time.time(), future
+                else:
+                    del self.requests[key] # don't reuse errors
+        return future.result()
+    
+    def save(self):
+        """Writes the deferred requests to disk. Must be called with the condition held."""
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as deferred_file:
+                json.dump([{'params': params, 'resource': resource} for resource, params, future in self.deferred], deferred_file, sort_keys=True, indent=4, separators=(',', ': '))
+            os.replace(self.path + '.tmp', self.path)
+        except (IOError, OSError):
+            core.debug_print('[twitter] could not save ' + self.path)
+    
+    def status(self):
+        with self.condition:
+            return dict(self.stats, budgets={endpoint: dict(budget) for endpoint, budget in self.budgets.items()}, queued=len(self.deferred))
+    
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+    
+    def wait_time(self, endpoint):
+        """Returns the number of seconds until a deferred request to the endpoint may be sent. Must be called with the condition held."""
+        budget = self.budgets.get(endpoint)
+        if budget is None or budget['reset'] <= time.time() or budget['remaining'] > self.reserve:
+            return 0
+        return budget['reset'] - time.time() + 1
+    
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.stopped and (not len(self.deferred) or self.wait_time(endpoint_name(self.deferred[0][0])) > 0):
+                    self.condition.wait(None if not len(self.deferred) else self.wait_time(endpoint_name(self.deferred[0][0])))
+                if self.stopped:
+                    return
+                resource, params, future = self.deferred[0] # stays on disk until it has been sent
+            response = error = None
+            try:
+                response = self.request(resource, params)
+            except core.TwitterError as e:
+                if e.code == 88:
+                    continue # the budget was used up by urgent requests in the meantime, try again after the reset
+                error = e
+                core.debug_print('TwitterError {} in deferred request {}: {}'.format(e.status_code, resource, e))
+            except Exception as e:
+                error = e
+                core.debug_print('Exception in deferred Twitter request ' + resource + ':', exc_info=True)
+            else:
+                if response.status_code == 429:
+                    continue # rate limited, _record has set the budget to 0 until the reset
+                if response.status_code != 200:
+                    core.debug_print('[twitter] deferred request {} returned status {}'.format(resource, response.status_code))
+            with self.condition:
+                self.deferred.popleft()
+                self.save() # before resolving the future, so whoever waits for it sees the request gone from disk
+            if error is None:
+                future.set_result(response)
+            else:
+                future.set_exception(error)
+
+def endpoint_name(resource):
+    """Returns the rate limit endpoint for a resource, e.g. statuses/show/:id for statuses/show/:123."""
+    return re.sub(':[^/]+', ':id', resource)
@@ -0,0 +1,133 @@
+from wurstminebot import cache
+import concurrent.futures
+from wurstminebot import core
+import os.path
+import requests
+import requests.adapters
+import threading
+import time
+import urllib.parse
+
+class Client:
+    """A shared HTTP client for all web requests the bot makes.
+    
+    Requests go through a single requests.Session, so connections to the same host are kept alive and reused. Each request gets a timeout, which can be configured per host. At most max_connections requests run at the same time, across all threads. The *_future methods and submit run requests on a small worker pool and return a concurrent.futures.Future, so handlers on the IRC or log thread can fire a request without waiting for it.
+    """
+    
+    def __init__(self, timeout=10, host_timeouts={}, max_connections=8, workers=4):
+        self.timeout = timeout
+        self.host_timeouts = dict(host_timeouts)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.semaphore = threading.BoundedSemaphore(max_connections)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wurstminebot HTTP')
+    
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+    
+    def get_future(self, url, **kwargs):
+        return self.submit(self.get, url, **kwargs)
+    
+    def request(self, method, url, **kwargs):
+        """Sends a request and returns the requests.Response. Blocks until it has finished or timed out."""
+        kwargs.setdefault('timeout', self.timeout_for(url))
+        with self.semaphore:
+            return self.session.request(method, url, **kwargs)
+    
+    def request_future(self, method, url, **kwargs):
+        return self.submit(self.request, method, url, **kwargs)
+    
+    def stop(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+    
+    def submit(self, func, *args, **kwargs):
+        """Runs func, typically a function that makes requests and acts on the responses, on the worker pool. Returns a Future."""
+        return self.executor.submit(func, *args, **kwargs)
+    
+    def timeout_for(self, url):
+        return self.host_timeouts.get(urllib.parse.urlsplit(url).hostname, self.timeout)
+
+_client_lock = threading.Lock()
+
+def client():
+    """Returns the shared HTTP client, creating it from the http config if necessary."""
+    with _client_lock:
+        if core.state.get('http') is None:
+            http_config = core.config('http')
+            core.state['http'] = Client(timeout=http_config.get('timeout', 10), host_timeouts=http_config.get('hostTimeouts', {}), max_connections=http_config.get('maxConnections', 8), workers=http_config.get('workers', 4))
+        return core.state['http']
+
+def get(url, **kwargs):
+    return client().get(url, **kwargs)
+
+def get_cached(url, extract, params=None, ttl=None, negative_ttl=None):
+    """Returns a (status code, value) tuple for a GET request to url, using the response cache.
+    
+    extract is called with the streamed response for status 200 and returns the value to cache, which must be JSON-serializable. It should read only as much of the body as it needs, see read_until. Cached values are returned for ttl seconds (default http.cacheTTL), or negative_ttl seconds (default http.negativeCacheTTL) if extract returned None, so a page that couldn't be parsed is retried soon. After that, the request is revalidated using the stored ETag or Last-Modified header, so an unchanged page costs an empty 304 response. For other status codes, nothing is cached and the value is None.
+    """
+    http_config = core.config('http')
+    if ttl is None:
+        ttl = http_config.get('cacheTTL', 3600)
+    if negative_ttl is None:
+        negative_ttl = http_config.get('negativeCacheTTL', 60)
+    key = url if params is None else url + '?' + urllib.parse.urlencode(sorted(params.items()))
+    responses = response_cache()
+    entry = responses.get(key)
+    if entry is not None and entry['fresh'] > time.time():
+        return 200, entry['value']
+    headers = {}
+    if entry is not None and entry.get('etag') is not None:
+        headers['If-None-Match'] = entry['etag']
+    if entry is not None and entry.get('lastModified') is not None:
+        headers['If-Modified-Since'] = entry['lastModified']
+    response = get(url, params=params, headers=headers, stream=True)
+    try:
+        if response.status_code == 304 and entry is not None:
+            value = entry['value']
+        elif response.status_code == 200:
+            value = extract(response)
+        else:
+            return response.status_code, None
+        responses.set(key, {
+            'etag': response.headers.get('ETag', None if entry is None else entry.get('etag')),
+            'fresh': time.time() + (negative_ttl if value is None else ttl),
+            'lastModified': response.headers.get('Last-Modified', None if entry is None else entry.get('lastModified')),
+            'value': value
+        })
+        return 200, value
+    finally:
+        response.close()
+
+def get_future(url, **kwargs):
+    return client().get_future(url, **kwargs)
+
+def read_until(response, marker, max_bytes=65536):
+    """Reads the body of a streamed response up to and including the first occurrence of marker (a str), or up to max_bytes, and returns it decoded. The rest of the body is never downloaded."""
+    encoding = response.encoding or 'utf-8'
+    marker = marker.encode(encoding)
+    data = b''
+    for chunk in response.iter_content(chunk_size=4096):
+        data += chunk
+        end = data.find(marker, max(0, len(data) - len(chunk) - len(marker)))
+        if end != -1:
+            data = data[:end + len(marker)]
+            break
+        if len(data) >= max_bytes:
+            break
+    return data.decode(encoding, errors='replace')
+
+_response_cache_lock = threading.Lock()
+
+def response_cache():
+    """Returns the persistent cache used by get_cached, creating it if necessary."""
+    with _response_cache_lock:
+        if core.state.get('http_cache') is None:
+            http_config = core.config('http')
+            core.state['http_cache'] = cache.TTLCache(max_size=http_config.get('cacheSize', 512), ttl=http_config.get('cacheRetention', 604800), path=os.path.join(core.config('paths').get('cache', '/var/local/wurstmineberg/wurstminebot_cache'), 'http.json'))
+        return core.state['http_cache']
+
+def submit(func, *args, **kwargs):
+    return client().submit(func, *args, **kwargs)